@@ -1,16 +1,21 @@
 from fastapi import APIRouter, HTTPException
 from typing import List, Optional
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from datetime import datetime
-import json
+import asyncio
+import orjson
 import os
+import uuid
 
 router = APIRouter()
 
 class Message(BaseModel):
     role: str
     content: str
-    timestamp: datetime = datetime.now()
+    timestamp: datetime = Field(default_factory=datetime.now)
+    context_sources: Optional[List[dict]] = None
+    rag_used: Optional[bool] = None
+    search_used: Optional[bool] = None
 
 class Conversation(BaseModel):
     id: str
@@ -19,113 +24,264 @@ class Conversation(BaseModel):
     created_at: datetime
     updated_at: datetime
 
-# Simple file-based storage for now
+# Simple file-based storage for now. conversations.json holds a full
+# snapshot; conversations.jsonl is an append-only journal of changes made
+# since that snapshot was written.
 CONVERSATIONS_FILE = "conversations.json"
+CONVERSATIONS_JOURNAL = "conversations.jsonl"
+# Number of journal entries after which the snapshot is rewritten
+JOURNAL_COMPACT_THRESHOLD = 500
+# Optional message fields persisted alongside role and content
+MESSAGE_CONTEXT_FIELDS = ('context_sources', 'rag_used', 'search_used')
+# Length of the last message preview shown in conversation lists
+MESSAGE_PREVIEW_LENGTH = 80
+
+# In-memory copy of the stored conversations. It is validated against the
+# stat signatures of the snapshot and journal on every load and kept up to
+# date on every write, so reads only hit the disk when the files were
+# changed behind our back.
+_CACHE = {"path": None, "signature": None, "data": None, "journal_entries": 0}
+# Conversation id -> conversation dict, pointing at the same objects as _CACHE["data"]
+_BY_ID = {}
+# Serializes read-modify-write cycles of the mutating endpoints. The disk
+# writes themselves run in a worker thread so they don't block the event loop.
+_LOCK = asyncio.Lock()
+
+def _file_signature(path):
+    """Return a cheap change marker for a file, or None if it doesn't exist"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+def _storage_signature():
+    """Combined change marker for the snapshot and the journal"""
+    return (_file_signature(CONVERSATIONS_FILE), _file_signature(CONVERSATIONS_JOURNAL))
+
+def _remove_if_directory(path):
+    """Remove a directory squatting on one of our file paths (which shouldn't happen)"""
+    if os.path.isdir(path):
+        print(f"Warning: {path} is a directory, removing it...")
+        import shutil
+        shutil.rmtree(path)
+        return True
+    return False
+
+def _update_cache(conversations, journal_entries, signature=None):
+    """Point the cache and the id index at the given conversation list"""
+    global _BY_ID
+    _CACHE["path"] = os.path.abspath(CONVERSATIONS_FILE)
+    _CACHE["signature"] = signature or _storage_signature()
+    _CACHE["data"] = conversations
+    _CACHE["journal_entries"] = journal_entries
+    # Swap in a new index rather than mutating the old one, since saves may
+    # run in a worker thread while the event loop serves lookups
+    _BY_ID = {conv['id']: conv for conv in conversations}
+
+def _replay_journal(conversations):
+    """Apply the journal entries on top of a loaded snapshot, returning the entry count"""
+    if not os.path.exists(CONVERSATIONS_JOURNAL) or _remove_if_directory(CONVERSATIONS_JOURNAL):
+        return 0
+
+    by_id = {conv['id']: conv for conv in conversations}
+    # Deleted conversations are dropped from the list in one pass at the end,
+    # rather than with an O(N) list removal per delete entry
+    deleted = set()
+    entries = 0
+    with open(CONVERSATIONS_JOURNAL, 'rb') as f:
+        for line in f:
+            try:
+                entry = orjson.loads(line)
+            except orjson.JSONDecodeError:
+                # A torn final line from an interrupted append
+                continue
+            entries += 1
+
+            op = entry.get('op')
+            if op == 'create':
+                conversation = entry['conversation']
+                conversations.append(conversation)
+                by_id[conversation['id']] = conversation
+            elif op == 'message':
+                conversation = by_id.get(entry['id'])
+                if conversation is not None:
+                    conversation['messages'].append(entry['message'])
+                    conversation['last_message_preview'] = _message_preview(entry['message'])
+                    conversation['updated_at'] = entry['updated_at']
+                    conversation['title'] = entry['title']
+            elif op == 'delete':
+                conversation = by_id.pop(entry['id'], None)
+                if conversation is not None:
+                    deleted.add(id(conversation))
+    
+    if deleted:
+        conversations[:] = [conv for conv in conversations if id(conv) not in deleted]
+    return entries
+
+def _message_preview(message):
+    """Short preview of a message for conversation lists"""
+    return message.get('content', '')[:MESSAGE_PREVIEW_LENGTH]
+
+def _conversation_summary(conversation):
+    """Conversation metadata without the message history"""
+    messages = conversation.get('messages', [])
+    preview = conversation.get('last_message_preview')
+    if preview is None:
+        # Conversations stored before previews were denormalized
+        preview = _message_preview(messages[-1]) if messages else ''
+    return {
+        'id': conversation['id'],
+        'title': conversation.get('title', ''),
+        'created_at': conversation.get('created_at'),
+        'updated_at': conversation.get('updated_at'),
+        'message_count': len(messages),
+        'last_message_preview': preview
+    }
 
 def load_conversations():
-    """Load conversations from file"""
+    """Load conversations from the in-memory cache, re-reading the files only if they changed"""
+    if _CACHE["data"] is not None and _CACHE["path"] == os.path.abspath(CONVERSATIONS_FILE):
+        # While one of our own writes is in flight the files are expected to
+        # change underneath us, and the cache already holds the new state
+        if _LOCK.locked():
+            return _CACHE["data"]
+        signature = _storage_signature()
+        if _CACHE["signature"] == signature:
+            return _CACHE["data"]
+    else:
+        signature = _storage_signature()
+
     if os.path.exists(CONVERSATIONS_FILE):
-        # Check if it's a directory (which shouldn't happen)
-        if os.path.isdir(CONVERSATIONS_FILE):
-            print(f"Warning: {CONVERSATIONS_FILE} is a directory, removing it...")
-            import shutil
-            shutil.rmtree(CONVERSATIONS_FILE)
+        if _remove_if_directory(CONVERSATIONS_FILE):
             return []
         
         try:
-            with open(CONVERSATIONS_FILE, 'r') as f:
-                data = json.load(f)
-                # Convert timestamp strings back to datetime objects
-                for conv in data:
-                    conv['created_at'] = datetime.fromisoformat(conv['created_at'])
-                    conv['updated_at'] = datetime.fromisoformat(conv['updated_at'])
-                    for msg in conv['messages']:
-                        msg['timestamp'] = datetime.fromisoformat(msg['timestamp'])
-                return data
+            with open(CONVERSATIONS_FILE, 'rb') as f:
+                # Timestamps stay as ISO-8601 strings; callers that need
+                # datetime arithmetic parse them on demand.
+                conversations = orjson.loads(f.read())
         except Exception as e:
             print(f"Error loading conversations: {e}")
             return []
-    return []
+    else:
+        conversations = []
+
+    try:
+        journal_entries = _replay_journal(conversations)
+    except Exception as e:
+        print(f"Error replaying conversations journal: {e}")
+        return conversations
+
+    # Use the signature taken before reading, so changes that landed while
+    # we were reading invalidate the cache on the next load
+    _update_cache(conversations, journal_entries, signature)
+    return conversations
+
+def find_conversation(conversation_id):
+    """Look up a single conversation by id"""
+    load_conversations()
+    return _BY_ID.get(conversation_id)
 
 def save_conversations(conversations):
-    """Save conversations to file"""
-    # Ensure the directory doesn't exist as a file
-    if os.path.exists(CONVERSATIONS_FILE) and os.path.isdir(CONVERSATIONS_FILE):
-        print(f"Warning: {CONVERSATIONS_FILE} is a directory, removing it...")
-        import shutil
-        shutil.rmtree(CONVERSATIONS_FILE)
-    
-    # Convert datetime objects to strings for JSON serialization
-    data = []
-    for conv in conversations:
-        # Handle both datetime objects and ISO strings
-        created_at = conv['created_at']
-        if hasattr(created_at, 'isoformat'):
-            created_at = created_at.isoformat()
-        
-        updated_at = conv['updated_at']
-        if hasattr(updated_at, 'isoformat'):
-            updated_at = updated_at.isoformat()
-        
-        conv_data = {
-            'id': conv['id'],
-            'title': conv['title'],
-            'created_at': created_at,
-            'updated_at': updated_at,
-            'messages': []
-        }
-        for msg in conv['messages']:
-            # Handle both datetime objects and ISO strings for message timestamps
-            timestamp = msg['timestamp']
-            if hasattr(timestamp, 'isoformat'):
-                timestamp = timestamp.isoformat()
-            
-            conv_data['messages'].append({
-                'role': msg['role'],
-                'content': msg['content'],
-                'timestamp': timestamp
-            })
-        data.append(conv_data)
+    """Save a full snapshot of the conversations and reset the journal"""
+    _remove_if_directory(CONVERSATIONS_FILE)
     
+    # orjson serializes datetime objects and ISO strings alike, so the
+    # conversation dicts can be written out as-is.
     try:
-        with open(CONVERSATIONS_FILE, 'w') as f:
-            json.dump(data, f, indent=2)
+        # Compact output: nobody reads the file by hand, and indentation
+        # roughly doubles the bytes written and parsed
+        data = orjson.dumps(conversations)
+        # Write to a temporary file and swap it in, so readers never see a
+        # half-written snapshot
+        tmp_file = CONVERSATIONS_FILE + ".tmp"
+        with open(tmp_file, 'wb') as f:
+            f.write(data)
+        try:
+            os.replace(tmp_file, CONVERSATIONS_FILE)
+        except OSError:
+            # A bind-mounted snapshot can't be replaced; fall back to
+            # rewriting it in place
+            os.remove(tmp_file)
+            with open(CONVERSATIONS_FILE, 'wb') as f:
+                f.write(data)
+        # Everything in the journal is part of the snapshot now. Truncate
+        # rather than delete so a bind-mounted journal file keeps working.
+        if os.path.isfile(CONVERSATIONS_JOURNAL):
+            open(CONVERSATIONS_JOURNAL, 'wb').close()
     except Exception as e:
         print(f"Error saving conversations: {e}")
         raise
 
+    # Write-through: the list we just persisted becomes the cached copy
+    _update_cache(conversations, 0)
+
+def append_to_journal(entry):
+    """Persist a single change by appending it to the journal.
+
+    The cached conversations must already reflect the change; if this
+    raises, the caller undoes it. Whatever did reach the disk changed the
+    stat signature, so the next load re-reads the files. Once the journal
+    grows past JOURNAL_COMPACT_THRESHOLD entries it is folded into a fresh
+    snapshot.
+    """
+    _remove_if_directory(CONVERSATIONS_JOURNAL)
+    try:
+        with open(CONVERSATIONS_JOURNAL, 'ab') as f:
+            f.write(orjson.dumps(entry) + b"\n")
+    except Exception as e:
+        print(f"Error appending to conversations journal: {e}")
+        raise
+
+    _CACHE["journal_entries"] += 1
+    if _CACHE["journal_entries"] >= JOURNAL_COMPACT_THRESHOLD:
+        save_conversations(_CACHE["data"])
+    else:
+        _CACHE["signature"] = _storage_signature()
+
 @router.get("/")
 async def get_conversations():
-    """Get all conversations"""
+    """Get summaries of all conversations; the messages are fetched per conversation"""
     conversations = load_conversations()
-    return {"conversations": conversations}
+    return {"conversations": [_conversation_summary(conv) for conv in conversations]}
 
 @router.post("/")
 async def create_conversation(request: dict):
     """Create a new conversation"""
-    conversations = load_conversations()
-    
-    # Generate a simple ID
-    conversation_id = f"conv_{len(conversations) + 1}_{int(datetime.now().timestamp())}"
-    
-    new_conversation = {
-        'id': conversation_id,
-        'title': request.get('title', 'New Conversation'),
-        'messages': [],
-        'created_at': datetime.now(),
-        'updated_at': datetime.now()
-    }
-    
-    conversations.append(new_conversation)
-    save_conversations(conversations)
+    async with _LOCK:
+        conversations = load_conversations()
+        
+        # Generate a simple ID
+        now = datetime.now()
+        # Random rather than count-based, so ids never collide, even after deletes
+        conversation_id = f"conv_{uuid.uuid4().hex[:12]}"
+        
+        new_conversation = {
+            'id': conversation_id,
+            'title': request.get('title', 'New Conversation'),
+            'messages': [],
+            'created_at': now.isoformat(),
+            'updated_at': now.isoformat(),
+            'last_message_preview': ''
+        }
+        
+        conversations.append(new_conversation)
+        _BY_ID[conversation_id] = new_conversation
+        try:
+            await asyncio.to_thread(append_to_journal, {'op': 'create', 'conversation': new_conversation})
+        except Exception:
+            # Not persisted, so don't keep it in memory either
+            conversations.pop()
+            del _BY_ID[conversation_id]
+            raise
     
     return {"conversation": new_conversation}
 
 @router.get("/{conversation_id}")
 async def get_conversation(conversation_id: str):
     """Get a specific conversation"""
-    conversations = load_conversations()
-    conversation = next((conv for conv in conversations if conv['id'] == conversation_id), None)
+    conversation = find_conversation(conversation_id)
     
     if not conversation:
         raise HTTPException(status_code=404, detail="Conversation not found")
@@ -135,36 +291,68 @@ async def get_conversation(conversation_id: str):
 @router.post("/{conversation_id}/messages")
 async def add_message(conversation_id: str, request: dict):
     """Add a message to a conversation"""
-    conversations = load_conversations()
-    conversation = next((conv for conv in conversations if conv['id'] == conversation_id), None)
-    
-    if not conversation:
-        raise HTTPException(status_code=404, detail="Conversation not found")
-    
-    message = {
-        'role': request.get('role', 'user'),
-        'content': request.get('content', ''),
-        'timestamp': datetime.now()
-    }
-    
-    conversation['messages'].append(message)
-    conversation['updated_at'] = datetime.now()
-    
-    # Auto-generate title if this is the first user message
-    if len(conversation['messages']) == 1 and message['role'] == 'user':
-        # Simple title generation from first message
-        title = message['content'][:50] + "..." if len(message['content']) > 50 else message['content']
-        conversation['title'] = title
-    
-    save_conversations(conversations)
+    async with _LOCK:
+        conversation = find_conversation(conversation_id)
+        
+        if not conversation:
+            raise HTTPException(status_code=404, detail="Conversation not found")
+        
+        now = datetime.now().isoformat()
+        message = {
+            'role': request.get('role', 'user'),
+            'content': request.get('content', ''),
+            'timestamp': now
+        }
+        # RAG / web search context of an assistant reply, so its sources can
+        # be shown again when the conversation is reopened
+        for key in MESSAGE_CONTEXT_FIELDS:
+            if request.get(key) is not None:
+                message[key] = request[key]
+        
+        previous = {key: conversation.get(key) for key in ('updated_at', 'last_message_preview', 'title')}
+        conversation['messages'].append(message)
+        conversation['updated_at'] = now
+        conversation['last_message_preview'] = _message_preview(message)
+        
+        # Auto-generate title if this is the first user message
+        if len(conversation['messages']) == 1 and message['role'] == 'user':
+            # Simple title generation from first message
+            title = message['content'][:50] + "..." if len(message['content']) > 50 else message['content']
+            conversation['title'] = title
+        
+        try:
+            await asyncio.to_thread(append_to_journal, {
+                'op': 'message',
+                'id': conversation_id,
+                'message': message,
+                'updated_at': conversation['updated_at'],
+                'title': conversation['title']
+            })
+        except Exception:
+            # Not persisted, so don't keep it in memory either
+            conversation['messages'].pop()
+            conversation.update(previous)
+            raise
     
     return {"message": message}
 
 @router.delete("/{conversation_id}")
 async def delete_conversation(conversation_id: str):
     """Delete a conversation"""
-    conversations = load_conversations()
-    conversations = [conv for conv in conversations if conv['id'] != conversation_id]
-    save_conversations(conversations)
+    async with _LOCK:
+        load_conversations()
+        conversation = _BY_ID.pop(conversation_id, None)
+        if conversation is not None:
+            # Remove by identity; list.remove would compare whole conversation dicts
+            conversations = _CACHE["data"]
+            index = next(index for index, conv in enumerate(conversations) if conv is conversation)
+            del conversations[index]
+            try:
+                await asyncio.to_thread(append_to_journal, {'op': 'delete', 'id': conversation_id})
+            except Exception:
+                # Not persisted, so don't keep it in memory either
+                conversations.insert(index, conversation)
+                _BY_ID[conversation_id] = conversation
+                raise
     
     return {"success": True}
\ No newline at end of file
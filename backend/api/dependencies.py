@@ -0,0 +1,122 @@
+from fastapi import Request
+import asyncio
+import httpx
+import os
+import threading
+from services.chromadb_service import ChromaDBService
+from services.knowledge_writer import KnowledgeWriter
+from services.rag_service import RAGService
+from services.response_cache import ResponseCache
+from services.web_search_service import WebSearchService
+
+def _ollama_base_url() -> str:
+    """Ollama URL from OLLAMA_HOST, which may be given with or without a scheme"""
+    host = os.getenv("OLLAMA_HOST", "http://localhost:11434")
+    return host if "://" in host else f"http://{host}"
+
+OLLAMA_URL = _ollama_base_url()
+
+# Web search configuration, updated through /api/search/config
+search_config = {
+    'default_engine': 'duckduckgo',
+    'engines': {
+        'duckduckgo': {'enabled': True},
+        'searxng': {'enabled': False, 'instance_url': 'https://searx.be'},
+        'google': {'enabled': False, 'api_key': None, 'cx': None},
+        'bing': {'enabled': False, 'api_key': None}
+    }
+}
+
+def create_http_client() -> httpx.AsyncClient:
+    """Create the shared client for outgoing HTTP calls (Ollama, search APIs, status checks)"""
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(120.0),
+        limits=httpx.Limits(max_keepalive_connections=32, max_connections=64)
+    )
+
+async def get_http_client(request: Request) -> httpx.AsyncClient:
+    """Dependency returning the application's shared HTTP client.
+
+    The client is created in the application lifespan and kept on
+    app.state, so connections are reused across requests.
+    """
+    client = getattr(request.app.state, "http", None)
+    if client is None:
+        # The lifespan hasn't run, e.g. a TestClient used without `with`
+        client = request.app.state.http = create_http_client()
+    return client
+
+def create_services(state):
+    """Create the application's shared services on app.state.
+
+    There is one instance of each per process, so every router uses the
+    same ChromaDB connection and the same caches.
+    """
+    if getattr(state, "http", None) is None:
+        state.http = create_http_client()
+    state.chroma = ChromaDBService()
+    state.rag = RAGService(state.chroma)
+    state.web_search = WebSearchService(search_config, http=state.http)
+    state.response_cache = ResponseCache()
+    # Knowledge base additions are acknowledged right away and written in batches
+    state.knowledge_writer = KnowledgeWriter(state.chroma.add_documents_batch)
+
+# The dependencies below are coroutines, so FastAPI resolves them on the
+# event loop instead of dispatching each one to its thread pool
+
+_services_lock = threading.Lock()
+
+def _create_services_once(state):
+    with _services_lock:
+        if getattr(state, "chroma", None) is None:
+            create_services(state)
+
+async def _services(request: Request):
+    state = request.app.state
+    if getattr(state, "chroma", None) is None:
+        # The lifespan hasn't run, e.g. a TestClient used without `with`.
+        # Connecting to ChromaDB blocks, so it happens in a worker thread,
+        # and the lock keeps concurrent first requests from each building
+        # a set of services
+        await asyncio.to_thread(_create_services_once, state)
+    return state
+
+async def get_chroma(request: Request) -> ChromaDBService:
+    """Dependency returning the shared ChromaDB service"""
+    return (await _services(request)).chroma
+
+async def get_rag(request: Request) -> RAGService:
+    """Dependency returning the shared RAG service"""
+    return (await _services(request)).rag
+
+async def get_web_search(request: Request) -> WebSearchService:
+    """Dependency returning the shared web search service"""
+    return (await _services(request)).web_search
+
+async def get_response_cache(request: Request) -> ResponseCache:
+    """Dependency returning the shared chat response cache"""
+    return (await _services(request)).response_cache
+
+async def get_knowledge_writer(request: Request) -> KnowledgeWriter:
+    """Dependency returning the write-behind queue for knowledge base documents"""
+    return (await _services(request)).knowledge_writer
+
+# File processing and code execution are only set up when first used, so
+# the process doesn't pay for them (temp directories, worker pools) unless
+# those endpoints are called
+
+async def get_file_processing(request: Request):
+    """Dependency returning the file processing service, created on first use"""
+    state = await _services(request)
+    if getattr(state, "file_processing", None) is None:
+        from services.file_processing_service import FileProcessingService
+        state.file_processing = FileProcessingService(state.chroma)
+    return state.file_processing
+
+async def get_code_execution(request: Request):
+    """Dependency returning the code execution service, created on first use"""
+    state = request.app.state
+    if getattr(state, "code_execution", None) is None:
+        from services.code_execution_service import CodeExecutionService
+        state.code_execution = CodeExecutionService()
+    return state.code_execution
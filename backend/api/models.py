@@ -1,34 +1,99 @@
-from fastapi import APIRouter, HTTPException
-import requests
-import json
+from fastapi import APIRouter, HTTPException, Depends
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+import asyncio
+import httpx
+import orjson
+import time
+from api.dependencies import (
+    OLLAMA_URL, get_http_client, get_chroma, get_rag, get_web_search, get_response_cache
+)
 from services.chromadb_service import ChromaDBService
 from services.rag_service import RAGService
+from services.response_cache import ResponseCache
 from services.web_search_service import WebSearchService
+from utils.background import spawn
 
 router = APIRouter()
 
-# Initialize services
-chromadb_service = ChromaDBService()
-rag_service = RAGService(chromadb_service)
-web_search_service = WebSearchService()
+# Chat requests carry the whole conversation, so bodies to and from Ollama
+# are encoded with orjson rather than httpx's stdlib json
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+# Cached Ollama model list. It only changes when models are pulled or
+# removed, so it is served from memory for MODELS_CACHE_TTL seconds and
+# refreshed in the background when it is about to expire.
+MODELS_CACHE_TTL = 30
+MODELS_CACHE_REFRESH_MARGIN = 5
+_models_cache = {"models": None, "expires": 0.0, "refreshing": False}
+_models_lock = asyncio.Lock()
+
+async def _fetch_ollama_models(http: httpx.AsyncClient):
+    """Fetch the model list from Ollama, caching it on success.
+
+    Returns None if Ollama answered with an error status.
+    """
+    response = await http.get(f"{OLLAMA_URL}/api/tags", timeout=10)
+    if response.status_code != 200:
+        return None
+    models = orjson.loads(response.content).get("models", [])
+    _models_cache["models"] = models
+    _models_cache["expires"] = time.monotonic() + MODELS_CACHE_TTL
+    return models
+
+async def _refresh_models_cache(http: httpx.AsyncClient):
+    """Background refresh of the model list (stale-while-revalidate)"""
+    try:
+        await _fetch_ollama_models(http)
+    except Exception as e:
+        print(f"Background refresh of Ollama models failed: {e}")
+    finally:
+        _models_cache["refreshing"] = False
 
 @router.get("/")
-async def get_ollama_models():
+async def get_ollama_models(http: httpx.AsyncClient = Depends(get_http_client)):
     """Get list of available Ollama models"""
+    remaining = _models_cache["expires"] - time.monotonic()
+    if _models_cache["models"] is not None and remaining > 0:
+        if remaining < MODELS_CACHE_REFRESH_MARGIN and not _models_cache["refreshing"]:
+            _models_cache["refreshing"] = True
+            spawn(_refresh_models_cache(http))
+        return {"models": _models_cache["models"]}
+    
     try:
-        response = requests.get("http://localhost:11434/api/tags")
-        if response.status_code == 200:
-            models = response.json()
-            return {"models": models.get("models", [])}
+        # Concurrent misses share a single request to Ollama
+        async with _models_lock:
+            if _models_cache["models"] is not None and _models_cache["expires"] > time.monotonic():
+                return {"models": _models_cache["models"]}
+            models = await _fetch_ollama_models(http)
+        if models is not None:
+            return {"models": models}
         else:
             return {"models": [], "error": "Ollama service not available"}
-    except requests.exceptions.ConnectionError:
+    except httpx.ConnectError:
         return {"models": [], "error": "Cannot connect to Ollama service"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching models: {str(e)}")
 
+async def _store_conversation_context(chroma: ChromaDBService, conversation_id: str, messages: list):
+    """Store the latest exchange in the knowledge base for future RAG"""
+    if await chroma.check_available() and len(messages) >= 1:
+        try:
+            await chroma.add_conversation_context(conversation_id, messages[-2:])
+        except Exception as e:
+            print(f"Failed to store conversation context: {e}")
+
+async def _skipped():
+    """Placeholder for a disabled step in asyncio.gather"""
+    return None
+
 @router.post("/chat")
-async def chat_with_model(request: dict):
+async def chat_with_model(request: dict,
+                          http: httpx.AsyncClient = Depends(get_http_client),
+                          chroma: ChromaDBService = Depends(get_chroma),
+                          rag: RAGService = Depends(get_rag),
+                          web_search: WebSearchService = Depends(get_web_search),
+                          response_cache: ResponseCache = Depends(get_response_cache)):
     """Send chat request to Ollama model with optional RAG enhancement and auto-search"""
     try:
         model = request.get("model", "llama3.2")
@@ -36,117 +101,200 @@ async def chat_with_model(request: dict):
         use_rag = request.get("use_rag", True)  # Enable RAG by default
         auto_search = request.get("auto_search", True)  # Enable auto-search by default
         conversation_id = request.get("conversation_id", "default")
+        stream = bool(request.get("stream", False))
         
         # Get the latest user message
         latest_message = messages[-1] if messages else None
-        enhanced_messages = messages.copy()
+        # The history is only copied if search or RAG changes the question
+        enhanced_messages = messages
         context_sources = []
+        cache_key = None
+        query_embedding = None
+        knowledge_version = chroma.knowledge_version
         
         if latest_message and latest_message.get('role') == 'user':
             user_query = latest_message.get('content', '')
             
-            # Check if auto web search should be performed
-            search_results = None
-            if auto_search:
-                try:
-                    search_results = await web_search_service.auto_search(user_query)
-                    if search_results and search_results.get("search_performed"):
-                        # Add search results to context
-                        search_context = []
-                        for result in search_results.get("results", [])[:3]:  # Top 3 results
-                            search_context.append(f"Web result: {result.get('title', '')} - {result.get('snippet', '')}")
-                            context_sources.append({
-                                "type": "web_search",
-                                "title": result.get('title', ''),
-                                "url": result.get('url', ''),
-                                "snippet": result.get('snippet', '')
-                            })
-                        
-                        if search_context:
-                            search_text = "\n".join(search_context)
-                            user_query = f"""Web search results for reference:
+            # Repeated and near-identical questions are answered from the
+            # response cache without searching or calling the model
+            cache_key = ResponseCache.context_key(
+                model, messages[:-1], use_rag=use_rag, auto_search=auto_search)
+            cached = response_cache.get_exact(cache_key, user_query, knowledge_version)
+            if cached is None and await chroma.check_available():
+                query_embedding = await chroma.embed_query(user_query)
+                if query_embedding is not None:
+                    cached = response_cache.get_similar(cache_key, query_embedding, knowledge_version)
+            if cached is not None:
+                spawn(_store_conversation_context(chroma, conversation_id, messages + [cached.get("message", {})]))
+                cached = {**cached, "cached": True}
+                return _cached_stream(cached) if stream else cached
+            
+            # Web search and RAG retrieval are independent of each other, so
+            # they run concurrently and are combined into one prompt afterwards
+            search_results, rag_result = await asyncio.gather(
+                web_search.auto_search(user_query) if auto_search else _skipped(),
+                rag.augment_prompt(
+                    user_query,
+                    messages[:-1],  # Exclude current message
+                    conversation_id=conversation_id,
+                    query_embedding=query_embedding
+                ) if use_rag and await chroma.check_available() else _skipped(),
+                return_exceptions=True
+            )
+            
+            if isinstance(search_results, Exception):
+                print(f"Auto search failed: {search_results}")
+            elif search_results and search_results.get("search_performed"):
+                # Add search results to context
+                search_context = []
+                for result in search_results.get("results", [])[:3]:  # Top 3 results
+                    search_context.append(f"Web result: {result.get('title', '')} - {result.get('snippet', '')}")
+                    context_sources.append({
+                        "type": "web_search",
+                        "title": result.get('title', ''),
+                        "url": result.get('url', ''),
+                        "snippet": result.get('snippet', '')
+                    })
+                
+                if search_context:
+                    search_text = "\n".join(search_context)
+                    user_query = f"""Web search results for reference:
 {search_text}
 
 User question: {user_query}"""
-                            
-                except Exception as e:
-                    print(f"Auto search failed: {e}")
             
-            # Apply RAG enhancement if enabled
-            if use_rag and rag_service.chromadb_service.is_available():
-                try:
-                    rag_result = rag_service.augment_prompt(user_query, messages[:-1])  # Exclude current message
-                    
-                    if rag_result.get("rag_available") and rag_result.get("sources"):
-                        enhanced_messages[-1] = {
-                            **latest_message,
-                            'content': rag_result["augmented_prompt"]
-                        }
-                        
-                        # Add RAG sources to context sources
-                        context_sources.extend(rag_result["sources"])
-                        
-                except Exception as e:
-                    print(f"RAG enhancement failed: {e}")
-                    # Continue without RAG if it fails
-            elif user_query != latest_message.get('content', ''):
-                # Update message with search context even if RAG is disabled
-                enhanced_messages[-1] = {
+            if isinstance(rag_result, Exception):
+                print(f"RAG enhancement failed: {rag_result}")
+                # Continue without RAG if it fails
+            elif rag_result and rag_result.get("rag_available") and rag_result.get("sources"):
+                user_query = rag.format_prompt(user_query, rag_result["context_text"])
+                
+                # Add RAG sources to context sources
+                context_sources.extend(rag_result["sources"])
+            
+            if user_query != latest_message.get('content', ''):
+                enhanced_messages = messages[:-1] + [{
                     **latest_message,
                     'content': user_query
-                }
+                }]
         
         # Send request to Ollama
         ollama_request = {
             "model": model,
             "messages": enhanced_messages,
-            "stream": False
+            "stream": stream
         }
         
-        response = requests.post(
-            "http://localhost:11434/api/chat",
-            json=ollama_request,
+        rag_used = use_rag and len([s for s in context_sources if s["type"] in ["knowledge", "conversation"]]) > 0
+        search_used = auto_search and len([s for s in context_sources if s["type"] == "web_search"]) > 0
+        context_info = {
+            "context_sources": context_sources,
+            "rag_used": rag_used,
+            "search_used": search_used
+        }
+        
+        def finish(result: dict):
+            """Cache and index a completed reply"""
+            # Answers built on web results are time-sensitive, so they aren't cached
+            if cache_key is not None and not search_used:
+                response_cache.put(cache_key, latest_message.get('content', ''), result,
+                                   query_embedding, knowledge_version)
+            
+            # Add the assistant response to messages for storage; indexing
+            # happens in the background so the reply isn't held up by it
+            spawn(_store_conversation_context(chroma, conversation_id, messages + [result.get("message", {})]))
+        
+        if stream:
+            return await _stream_chat(http, ollama_request, context_info, finish)
+        
+        response = await http.post(
+            f"{OLLAMA_URL}/api/chat",
+            content=orjson.dumps(ollama_request),
+            headers=JSON_HEADERS,
             timeout=120  # 2 minute timeout for model response
         )
         
         if response.status_code == 200:
-            result = response.json()
+            result = orjson.loads(response.content)
             
             # Add context information to response
-            result["context_sources"] = context_sources
-            result["rag_used"] = use_rag and len([s for s in context_sources if s["type"] in ["knowledge", "conversation"]]) > 0
-            result["search_used"] = auto_search and len([s for s in context_sources if s["type"] == "web_search"]) > 0
-            
-            # Store conversation in knowledge base for future RAG
-            if chromadb_service.is_available() and len(messages) >= 1:
-                try:
-                    # Add the assistant response to messages for storage
-                    complete_messages = messages + [result.get("message", {})]
-                    chromadb_service.add_conversation_context(conversation_id, complete_messages[-2:])
-                except Exception as e:
-                    print(f"Failed to store conversation context: {e}")
+            result.update(context_info)
+            finish(dict(result))
             
             return result
         else:
             raise HTTPException(status_code=response.status_code, detail="Ollama request failed")
             
-    except requests.exceptions.ConnectionError:
+    except HTTPException:
+        raise
+    except httpx.ConnectError:
         raise HTTPException(status_code=503, detail="Cannot connect to Ollama service")
-    except requests.exceptions.Timeout:
+    except httpx.TimeoutException:
         raise HTTPException(status_code=504, detail="Ollama request timed out")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error in chat request: {str(e)}")
 
+async def _stream_chat(http: httpx.AsyncClient, ollama_request: dict, context_info: dict, on_complete):
+    """Forward Ollama's streamed chat response to the client as it arrives.
+
+    The response is newline-delimited JSON, as produced by Ollama. The
+    context information is added to the final ("done") chunk. Once the
+    stream has finished, `on_complete` is called with the whole reply in
+    the shape of a non-streamed response.
+    """
+    response = await http.send(
+        http.build_request("POST", f"{OLLAMA_URL}/api/chat", content=orjson.dumps(ollama_request),
+                           headers=JSON_HEADERS, timeout=120),
+        stream=True
+    )
+    if response.status_code != 200:
+        await response.aclose()
+        raise HTTPException(status_code=response.status_code, detail="Ollama request failed")
+    
+    async def forward_chunks():
+        content_parts = []
+        role = "assistant"
+        final_chunk = None
+        try:
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                chunk = orjson.loads(line)
+                message = chunk.get("message") or {}
+                role = message.get("role", role)
+                content_parts.append(message.get("content", ""))
+                if chunk.get("done"):
+                    chunk.update(context_info)
+                    final_chunk = chunk
+                yield orjson.dumps(chunk) + b"\n"
+        finally:
+            await response.aclose()
+        
+        if final_chunk is not None:
+            on_complete({**final_chunk, "message": {"role": role, "content": "".join(content_parts)}})
+    
+    # The background task closes the upstream response even if the client
+    # disconnects before the body is sent
+    return StreamingResponse(forward_chunks(), media_type="application/x-ndjson",
+                             background=BackgroundTask(response.aclose))
+
+def _cached_stream(result: dict) -> StreamingResponse:
+    """Stream a cached reply as a single, final chunk"""
+    return StreamingResponse(iter([orjson.dumps({**result, "done": True}) + b"\n"]),
+                             media_type="application/x-ndjson")
+
 @router.get("/rag/status")
-async def get_rag_status():
+async def get_rag_status(chroma: ChromaDBService = Depends(get_chroma),
+                         rag: RAGService = Depends(get_rag),
+                         web_search: WebSearchService = Depends(get_web_search)):
     """Get RAG system status"""
-    rag_status = rag_service.get_rag_status()
-    search_status = web_search_service.get_service_status()
+    rag_status = await asyncio.to_thread(rag.get_rag_status)
+    search_status = web_search.get_service_status()
     
     return {
         "rag_service": rag_status,
         "web_search_service": search_status,
-        "chromadb_available": chromadb_service.is_available(),
+        "chromadb_available": await chroma.check_available(),
         "features": {
             "knowledge_retrieval": rag_status.get("available", False),
             "conversation_context": rag_status.get("available", False),
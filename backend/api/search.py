@@ -1,73 +1,67 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File
-import requests
-from typing import Optional, List
+from fastapi import APIRouter, HTTPException, UploadFile, File, Body, Depends, Request, Response
+from fastapi.responses import ORJSONResponse
+from typing import Optional, List, Union
+import asyncio
+from api.dependencies import (
+    search_config, get_chroma, get_rag, get_web_search, get_knowledge_writer,
+    get_file_processing, get_code_execution
+)
 from services.chromadb_service import ChromaDBService
+from services.knowledge_writer import KnowledgeWriter
 from services.rag_service import RAGService
 from services.web_search_service import WebSearchService
-from services.file_processing_service import FileProcessingService
-from services.code_execution_service import CodeExecutionService
 
 router = APIRouter()
 
-# Initialize services with default configuration
-search_config = {
-    'default_engine': 'duckduckgo',
-    'engines': {
-        'duckduckgo': {'enabled': True},
-        'searxng': {'enabled': False, 'instance_url': 'https://searx.be'},
-        'google': {'enabled': False, 'api_key': None, 'cx': None},
-        'bing': {'enabled': False, 'api_key': None}
-    }
-}
-
-chromadb_service = ChromaDBService()
-rag_service = RAGService(chromadb_service)
-web_search_service = WebSearchService(search_config)
-file_processing_service = FileProcessingService(chromadb_service)
-code_execution_service = CodeExecutionService()
+# Endpoints returning lists of search results build their ORJSONResponse
+# themselves: a returned dict would first be copied by FastAPI's
+# jsonable_encoder, which is pure Python and far slower than orjson
 
 @router.get("/web")
-async def search_web(q: str, limit: Optional[int] = 5, engine: Optional[str] = None):
+async def search_web(q: str, limit: Optional[int] = 5, engine: Optional[str] = None,
+                     web_search: WebSearchService = Depends(get_web_search)):
     """Search the web using the specified search engine"""
     try:
-        result = await web_search_service.search_web(q, limit, engine)
-        return result
+        result = await web_search.search_web(q, limit, engine)
+        return ORJSONResponse(result)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Search error: {str(e)}")
 
 @router.get("/news")
-async def search_news(q: str, limit: Optional[int] = 3, engine: Optional[str] = None):
+async def search_news(q: str, limit: Optional[int] = 3, engine: Optional[str] = None,
+                      web_search: WebSearchService = Depends(get_web_search)):
     """Search for news using the specified search engine"""
     try:
-        result = await web_search_service.search_news(q, limit, engine)
-        return result
+        result = await web_search.search_news(q, limit, engine)
+        return ORJSONResponse(result)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"News search error: {str(e)}")
 
 @router.get("/auto")
-async def auto_search(q: str, engine: Optional[str] = None):
+async def auto_search(q: str, engine: Optional[str] = None,
+                      web_search: WebSearchService = Depends(get_web_search)):
     """Automatically determine if search is needed and perform it"""
     try:
-        result = await web_search_service.auto_search(q, engine)
+        result = await web_search.auto_search(q, engine)
         if result is None:
             return {
                 "search_performed": False,
                 "reason": "Query does not require web search",
                 "query": q
             }
-        return {
+        return ORJSONResponse({
             "search_performed": True,
             **result
-        }
+        })
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Auto search error: {str(e)}")
 
 @router.get("/engines")
-async def get_search_engines():
+async def get_search_engines(web_search: WebSearchService = Depends(get_web_search)):
     """Get list of supported search engines and their configuration requirements"""
     try:
-        engines = web_search_service.get_supported_engines()
-        status = web_search_service.get_service_status()
+        engines = web_search.get_supported_engines()
+        status = web_search.get_service_status()
         
         return {
             "engines": engines,
@@ -78,11 +72,9 @@ async def get_search_engines():
         raise HTTPException(status_code=500, detail=f"Error getting engines: {str(e)}")
 
 @router.post("/config")
-async def update_search_config(config: dict):
+async def update_search_config(config: dict, request: Request):
     """Update search engine configuration"""
     try:
-        global search_config, web_search_service
-        
         # Validate configuration
         if 'engines' in config:
             for engine_name, engine_config in config['engines'].items():
@@ -93,7 +85,7 @@ async def update_search_config(config: dict):
         search_config.update(config)
         
         # Reinitialize web search service with new config
-        web_search_service = WebSearchService(search_config)
+        request.app.state.web_search = WebSearchService(search_config, http=getattr(request.app.state, "http", None))
         
         return {
             "success": True,
@@ -105,27 +97,29 @@ async def update_search_config(config: dict):
         raise HTTPException(status_code=500, detail=f"Error updating config: {str(e)}")
 
 @router.get("/config")
-async def get_search_config():
+async def get_search_config(web_search: WebSearchService = Depends(get_web_search)):
     """Get current search engine configuration"""
     try:
         return {
             "config": search_config,
-            "status": web_search_service.get_service_status()
+            "status": web_search.get_service_status()
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error getting config: {str(e)}")
 
 @router.get("/knowledge")
-async def search_knowledge(q: str, limit: Optional[int] = 5):
+async def search_knowledge(q: str, limit: Optional[int] = 5, chroma: ChromaDBService = Depends(get_chroma)):
     """Search the knowledge database using ChromaDB"""
     try:
-        if chromadb_service.is_available():
-            results = chromadb_service.search_documents(q, limit)
-            return {
+        if await chroma.check_available():
+            # Embedded up front so concurrent searches can be batched
+            query_embedding = await chroma.embed_query(q)
+            results = await chroma.search_documents(q, limit, query_embedding=query_embedding)
+            return ORJSONResponse({
                 "query": q,
                 "results": results,
                 "chromadb_available": True
-            }
+            })
         else:
             return {
                 "query": q,
@@ -143,21 +137,83 @@ async def search_knowledge(q: str, limit: Optional[int] = 5):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Knowledge search error: {str(e)}")
 
+@router.get("/knowledge/documents")
+async def list_knowledge_documents(limit: int = 20, offset: int = 0,
+                                   chroma: ChromaDBService = Depends(get_chroma)):
+    """List knowledge base documents a page at a time"""
+    if limit < 1 or offset < 0:
+        raise HTTPException(status_code=400, detail="limit must be positive and offset non-negative")
+    
+    try:
+        if not await chroma.check_available():
+            return {
+                "documents": [],
+                "total": 0,
+                "limit": limit,
+                "offset": offset,
+                "next_offset": None,
+                "chromadb_available": False
+            }
+        
+        page = await chroma.list_documents(limit, offset)
+        next_offset = offset + len(page["documents"])
+        return ORJSONResponse({
+            "documents": page["documents"],
+            "total": page["total"],
+            "limit": limit,
+            "offset": offset,
+            "next_offset": next_offset if next_offset < page["total"] else None,
+            "chromadb_available": True
+        })
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error listing knowledge: {str(e)}")
+
 @router.post("/knowledge/add")
-async def add_knowledge(request: dict):
-    """Add content to the knowledge database"""
+async def add_knowledge(response: Response,
+                        request: Union[dict, list] = Body(...),
+                        chroma: ChromaDBService = Depends(get_chroma),
+                        knowledge_writer: KnowledgeWriter = Depends(get_knowledge_writer)):
+    """Add content to the knowledge database.
+
+    Accepts a single document ({"content", "metadata"}) or a batch, either
+    as a list of documents or as {"items": [...]}. Documents are queued and
+    the response (202 Accepted) returns their ids right away; they are
+    embedded and stored in the background, batched with other additions.
+    """
     try:
-        content = request.get('content', '')
-        metadata = request.get('metadata', {})
+        if isinstance(request, list):
+            items = request
+        elif 'items' in request:
+            items = request['items']
+        else:
+            items = None
         
-        if not content:
-            raise HTTPException(status_code=400, detail="Content is required")
+        documents = items if items is not None else [request]
+        if not isinstance(documents, list) or not documents:
+            raise HTTPException(status_code=400, detail="Items must be a non-empty list")
+        for i, document in enumerate(documents):
+            if not isinstance(document, dict) or not document.get('content'):
+                detail = "Content is required" if items is None else f"Content is required for item {i}"
+                raise HTTPException(status_code=400, detail=detail)
         
-        if chromadb_service.is_available():
-            doc_id = chromadb_service.add_document(content, metadata)
+        if await chroma.check_available():
+            doc_ids = knowledge_writer.submit(
+                [document['content'] for document in documents],
+                [document.get('metadata') or {} for document in documents]
+            )
+            response.status_code = 202
+            if items is None:
+                return {
+                    "success": True,
+                    "document_id": doc_ids[0],
+                    "queued": True,
+                    "chromadb_available": True
+                }
             return {
                 "success": True,
-                "document_id": doc_id,
+                "document_ids": doc_ids,
+                "count": len(doc_ids),
+                "queued": True,
                 "chromadb_available": True
             }
         else:
@@ -167,32 +223,50 @@ async def add_knowledge(request: dict):
                 "chromadb_available": False
             }
             
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error adding knowledge: {str(e)}")
 
 @router.get("/status")
-async def get_search_status():
+async def get_search_status(chroma: ChromaDBService = Depends(get_chroma),
+                            rag: RAGService = Depends(get_rag),
+                            knowledge_writer: KnowledgeWriter = Depends(get_knowledge_writer),
+                            web_search: WebSearchService = Depends(get_web_search),
+                            file_processing=Depends(get_file_processing),
+                            code_execution=Depends(get_code_execution)):
     """Get status of search services"""
-    chromadb_stats = chromadb_service.get_collection_stats()
-    web_search_status = web_search_service.get_service_status()
+    # The ChromaDB status calls block on the server, so they run in worker threads
+    chromadb_available, chromadb_stats, rag_status, file_processing_status, _ = await asyncio.gather(
+        chroma.check_available(),
+        asyncio.to_thread(chroma.get_collection_stats),
+        asyncio.to_thread(rag.get_rag_status),
+        asyncio.to_thread(file_processing.get_service_status),
+        code_execution.refresh_language_availability()
+    )
+    web_search_status = web_search.get_service_status()
     
     return {
-        "chromadb_available": chromadb_service.is_available(),
+        "chromadb_available": chromadb_available,
         "web_search_available": web_search_status.get("available", False),
         "knowledge_documents": chromadb_stats.get("knowledge_documents", 0),
         "conversation_history": chromadb_stats.get("conversations", 0),
-        "rag_service": rag_service.get_rag_status(),
+        "knowledge_writes": {
+            "pending": knowledge_writer.pending,
+            "failed": knowledge_writer.failed_writes
+        },
+        "rag_service": rag_status,
         "services": {
             "chromadb": chromadb_stats,
             "web_search": web_search_status,
-            "file_processing": file_processing_service.get_service_status(),
-            "code_execution": code_execution_service.get_service_status()
+            "file_processing": file_processing_status,
+            "code_execution": code_execution.get_service_status()
         }
     }
 
 # RAG endpoints
 @router.post("/rag/augment")
-async def augment_prompt(request: dict):
+async def augment_prompt(request: dict, rag: RAGService = Depends(get_rag)):
     """Augment a prompt with relevant context using RAG"""
     try:
         user_message = request.get('message', '')
@@ -201,7 +275,11 @@ async def augment_prompt(request: dict):
         if not user_message:
             raise HTTPException(status_code=400, detail="Message is required")
         
-        result = rag_service.augment_prompt(user_message, conversation_history)
+        result = await rag.augment_prompt(
+            user_message,
+            conversation_history,
+            conversation_id=request.get('conversation_id')
+        )
         return result
         
     except Exception as e:
@@ -209,21 +287,17 @@ async def augment_prompt(request: dict):
 
 # File processing endpoints
 @router.post("/files/upload")
-async def upload_file(file: UploadFile = File(...)):
+async def upload_file(file: UploadFile = File(...), file_processing=Depends(get_file_processing)):
     """Upload and process a file"""
     try:
         # Validate file
-        validation = file_processing_service.validate_file(file.filename)
+        validation = file_processing.validate_file(file.filename)
         if not validation["valid"]:
             raise HTTPException(status_code=400, detail=validation["error"])
         
-        # Read file content
-        file_content = await file.read()
-        
-        # Process file
-        result = await file_processing_service.process_uploaded_file(
-            file_content, 
-            file.filename,
+        # Process file, streaming it to disk rather than reading it into memory
+        result = await file_processing.process_upload(
+            file,
             metadata={"upload_timestamp": __import__("datetime").datetime.now().isoformat()}
         )
         
@@ -233,29 +307,29 @@ async def upload_file(file: UploadFile = File(...)):
         raise HTTPException(status_code=500, detail=f"File upload error: {str(e)}")
 
 @router.get("/files/search")
-async def search_files(q: str, limit: Optional[int] = 5):
+async def search_files(q: str, limit: Optional[int] = 5, file_processing=Depends(get_file_processing)):
     """Search through uploaded files"""
     try:
-        results = await file_processing_service.search_uploaded_files(q, limit)
-        return {
+        results = await file_processing.search_uploaded_files(q, limit)
+        return ORJSONResponse({
             "query": q,
             "results": results,
             "count": len(results)
-        }
+        })
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"File search error: {str(e)}")
 
 @router.get("/files/types")
-async def get_supported_file_types():
+async def get_supported_file_types(file_processing=Depends(get_file_processing)):
     """Get list of supported file types"""
     return {
-        "supported_types": file_processing_service.get_supported_file_types(),
-        "service_status": file_processing_service.get_service_status()
+        "supported_types": file_processing.get_supported_file_types(),
+        "service_status": await asyncio.to_thread(file_processing.get_service_status)
     }
 
 # Code execution endpoints
 @router.post("/code/execute")
-async def execute_code(request: dict):
+async def execute_code(request: dict, code_execution=Depends(get_code_execution)):
     """Execute code safely"""
     try:
         code = request.get('code', '')
@@ -265,18 +339,19 @@ async def execute_code(request: dict):
         if not code:
             raise HTTPException(status_code=400, detail="Code is required")
         
-        result = await code_execution_service.execute_code(code, language, timeout)
+        result = await code_execution.execute_code(code, language, timeout)
         return result
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Code execution error: {str(e)}")
 
 @router.get("/code/detect")
-async def detect_language(code: str):
+async def detect_language(code: str, code_execution=Depends(get_code_execution)):
     """Detect programming language from code"""
     try:
-        language = code_execution_service.detect_language(code)
-        lang_info = code_execution_service.get_language_info(language)
+        language = code_execution.detect_language(code)
+        await code_execution.refresh_language_availability()
+        lang_info = code_execution.get_language_info(language)
         
         return {
             "detected_language": language,
@@ -288,9 +363,10 @@ async def detect_language(code: str):
         raise HTTPException(status_code=500, detail=f"Language detection error: {str(e)}")
 
 @router.get("/code/languages")
-async def get_supported_languages():
+async def get_supported_languages(code_execution=Depends(get_code_execution)):
     """Get list of supported programming languages"""
-    service_status = code_execution_service.get_service_status()
+    await code_execution.refresh_language_availability()
+    service_status = code_execution.get_service_status()
     return {
         "supported_languages": service_status["supported_languages"],
         "language_availability": service_status["language_availability"],
@@ -1,16 +1,50 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+import asyncio
+import httpx
+from fastapi import FastAPI, Depends
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from api.models import router as models_router
 from api.conversations import router as conversations_router
 from api.search import router as search_router
+from api.dependencies import (
+    create_http_client, create_services, get_http_client, get_chroma, get_web_search
+)
+from services.chromadb_service import ChromaDBService
+from services.web_search_service import WebSearchService
 from utils.system_status import get_system_status, get_performance_metrics
+from utils.background import drain as drain_background_tasks
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Application startup and shutdown"""
+    # One HTTP client for the whole app, so outgoing connections are pooled
+    # and kept alive instead of being set up per request
+    app.state.http = create_http_client()
+    # ChromaDB, RAG, web search and the response cache are shared by all
+    # routers and reached through dependencies. Connecting to ChromaDB
+    # blocks (with retries), so it is done in a worker thread.
+    await asyncio.to_thread(create_services, app.state)
+    # Heartbeats to ChromaDB are sent from a background task from here on,
+    # off the request path
+    app.state.chroma.start_health_checks()
+    yield
+    await app.state.chroma.stop_health_checks()
+    await app.state.knowledge_writer.flush()
+    await drain_background_tasks()
+    await app.state.http.aclose()
+    app.state.chroma.embedding_cache.close()
 
 app = FastAPI(
     title="EvolveUI Backend API",
     version="1.1.0",
     description="Enhanced Local Interface for Ollama Models with RAG, Knowledge Management, and Comprehensive Monitoring",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    lifespan=lifespan,
+    # Serialize responses with orjson, which is much faster than the stdlib
+    # on large payloads such as conversation histories
+    default_response_class=ORJSONResponse
 )
 
 # Configure CORS
@@ -44,11 +78,14 @@ def health_check():
     return {"status": "healthy", "version": "1.1.0"}
 
 @app.get("/api/status", tags=["system"])
-async def get_api_status():
+async def get_api_status(http: httpx.AsyncClient = Depends(get_http_client),
+                         chroma: ChromaDBService = Depends(get_chroma),
+                         web_search: WebSearchService = Depends(get_web_search)):
     """Get comprehensive system status including all services"""
-    return await get_system_status()
+    return await get_system_status(http, chroma, web_search)
 
 @app.get("/api/metrics", tags=["system"])
-async def get_api_metrics():
+async def get_api_metrics(http: httpx.AsyncClient = Depends(get_http_client),
+                          chroma: ChromaDBService = Depends(get_chroma)):
     """Get detailed performance metrics and system information"""
-    return await get_performance_metrics()
\ No newline at end of file
+    return await get_performance_metrics(http, chroma)
\ No newline at end of file
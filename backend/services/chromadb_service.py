@@ -1,15 +1,56 @@
 import chromadb
 from chromadb.config import Settings
-from typing import List, Dict, Any, Optional
-import uuid
+from chromadb.utils import embedding_functions
+from typing import List, Dict, Any, AsyncIterator, Iterable, Optional, Tuple
+import hashlib
 import logging
 import os
 import time
 import asyncio
-from contextlib import asynccontextmanager
+import numpy as np
+from cachetools import TTLCache
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, suppress
+from functools import partial
+from itertools import islice, takewhile
+from services.embedding_cache import EmbeddingCache
+from services.vector_index import VectorIndex
+from services.usearch_index import USearchIndex, USEARCH_AVAILABLE
+from services.query_batcher import QueryBatcher
+from utils.ids import new_ids
 
 logger = logging.getLogger(__name__)
 
+# HNSW index settings for the searched collections, applied when they are
+# created. Chroma's defaults (M=16, construction_ef=100, search_ef=10) lose
+# recall as collections grow. The distance stays squared L2, which the
+# distance thresholds and the in-memory index are tuned for.
+HNSW_METADATA = {
+    "hnsw:M": 24,
+    "hnsw:construction_ef": 128,
+    "hnsw:search_ef": 100,
+}
+
+# Most client calls in flight at once: the threads running them, and the
+# HTTP connections they use. A thread never waits for a connection, and
+# there is never an idle connection without a thread to use it.
+MAX_CONCURRENT_REQUESTS = 32
+
+# Fields fetched for query matches. Embeddings are never needed, and at
+# hundreds of floats per match would dominate the response.
+QUERY_INCLUDE = ["documents", "metadatas", "distances"]
+
+def _clean_metadata(metadata: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Metadata without its None values, which ChromaDB can't store.
+
+    Metadata rarely has any, so it is only copied when it does.
+    """
+    if not metadata:
+        return {}
+    if None not in metadata.values():
+        return metadata
+    return {k: v for k, v in metadata.items() if v is not None}
+
 class ChromaDBService:
     def __init__(self, host: str = None, port: int = None, max_retries: int = 3):
         """Initialize ChromaDB service with enhanced connection management"""
@@ -22,9 +63,60 @@ class ChromaDBService:
         self.files_collection = None
         self._last_connection_check = 0
         self._connection_check_interval = 60  # Check connection every 60 seconds
+        self._connection_check_task: Optional[asyncio.Future] = None
+        # Once started, checks the connection every interval in place of requests
+        self._health_task: Optional[asyncio.Task] = None
+        self._embedding_function = None
+        # Client calls block on ChromaDB round trips, so they run in their own
+        # threads, one per pooled connection. They don't queue behind
+        # embedding and file work on the default executor, and vice versa.
+        self.executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_REQUESTS, thread_name_prefix="chromadb")
+        self.requests_in_flight = 0
+        # Query embeddings; the same text is often embedded several times per
+        # chat turn and across turns. Set EMBEDDING_CACHE_PATH to keep them
+        # across restarts.
+        self.embedding_cache = EmbeddingCache(
+            path=os.getenv("EMBEDDING_CACHE_PATH"),
+            model="all-MiniLM-L6-v2"  # The model behind Chroma's default embedding function
+        )
+        # Bumped whenever the knowledge base changes, so caches of search results can be invalidated
+        self.knowledge_version = 0
+        # In-memory copy of the knowledge base embeddings, searched directly
+        # while the collection is small enough
+        self.matrix_search_max_documents = 50000
+        # Stored as int8, which keeps 50k MiniLM embeddings to about 20 MB,
+        # and float16 in the larger HNSW index
+        self.matrix_search_quantize = True
+        # Larger knowledge bases get an in-memory HNSW index instead, when
+        # usearch is installed
+        self.ann_search_max_documents = 250000
+        self._knowledge_index: Optional[VectorIndex] = None
+        self._knowledge_index_version = None
+        self._knowledge_index_lock = asyncio.Lock()
+        # Collection counts for the status endpoints: name -> (count, time counted)
+        self.count_cache_ttl = 5.0
+        self._counts: Dict[str, Tuple[int, float]] = {}
+        # Likewise for the conversation and file collections
+        self.conversations_version = 0
+        self.files_version = 0
+        # Recent search results of all three collections, keyed on the
+        # query and the collection's version
+        self.search_cache = TTLCache(maxsize=1024, ttl=60)
+        # Concurrent queries are sent to ChromaDB together, batched per
+        # collection, kind of query (text or embedding) and file type filter
+        self._query_batchers: Dict[Tuple[str, str, Optional[str]], QueryBatcher] = {}
+        # Most documents bulk_add_documents stores with one call
+        self.add_batch_size = 256
         
         self._initialize_client()
 
+    @staticmethod
+    def _client_settings(**settings) -> Settings:
+        # Telemetry is off, so client operations don't also send analytics
+        # events. A new object each time, since the clients modify the
+        # settings they are given.
+        return Settings(anonymized_telemetry=False, **settings)
+
     def _initialize_client(self) -> bool:
         """Initialize ChromaDB client with retry logic"""
         for attempt in range(self.max_retries):
@@ -32,7 +124,17 @@ class ChromaDBService:
                 # Try HTTP client first
                 self.client = chromadb.HttpClient(
                     host=self.host,
-                    port=self.port
+                    port=self.port,
+                    # Clients of the same server share one connection pool,
+                    # which is safe to use from several threads. It holds a
+                    # connection for each executor thread, kept open for long
+                    # enough between queries that a query doesn't have to
+                    # open a new connection first.
+                    settings=self._client_settings(
+                        chroma_http_keepalive_secs=60.0,
+                        chroma_http_max_connections=MAX_CONCURRENT_REQUESTS,
+                        chroma_http_max_keepalive_connections=MAX_CONCURRENT_REQUESTS
+                    )
                 )
                 
                 # Test the connection
@@ -52,7 +154,8 @@ class ChromaDBService:
                         
                         # Create embedded client
                         self.client = chromadb.PersistentClient(
-                            path=data_dir
+                            path=data_dir,
+                            settings=self._client_settings()
                         )
                         logger.info(f"Connected to embedded ChromaDB at {data_dir}")
                         break
@@ -72,23 +175,39 @@ class ChromaDBService:
     def _initialize_collections(self) -> bool:
         """Initialize all collections with error handling"""
         try:
-            # Get or create collection for knowledge base
-            self.collection = self.client.get_or_create_collection(
-                name="evolveui_knowledge",
-                metadata={"description": "EvolveUI knowledge base", "version": "1.1"}
-            )
+            # The three are requested at once, so (re)connecting waits for
+            # one round trip to the server rather than three
+            with ThreadPoolExecutor(max_workers=3) as pool:
+                # Get or create collection for knowledge base
+                knowledge = pool.submit(
+                    self.client.get_or_create_collection,
+                    name="evolveui_knowledge",
+                    metadata={"description": "EvolveUI knowledge base", "version": "1.1", **HNSW_METADATA}
+                )
+                
+                # Get or create collection for conversations
+                conversations = pool.submit(
+                    self.client.get_or_create_collection,
+                    name="evolveui_conversations",
+                    metadata={"description": "EvolveUI conversation history", "version": "1.1", **HNSW_METADATA}
+                )
+                
+                # Get or create collection for files
+                files = pool.submit(
+                    self.client.get_or_create_collection,
+                    name="evolveui_files",
+                    metadata={"description": "EvolveUI file storage", "version": "1.1"}
+                )
+            self.collection = knowledge.result()
+            self.conversations_collection = conversations.result()
+            self.files_collection = files.result()
             
-            # Get or create collection for conversations
-            self.conversations_collection = self.client.get_or_create_collection(
-                name="evolveui_conversations",
-                metadata={"description": "EvolveUI conversation history", "version": "1.1"}
-            )
+            for name, collection in (("knowledge", self.collection), ("conversations", self.conversations_collection)):
+                self._ensure_search_ef(name, collection)
             
-            # Get or create collection for files
-            self.files_collection = self.client.get_or_create_collection(
-                name="evolveui_files",
-                metadata={"description": "EvolveUI file storage", "version": "1.1"}
-            )
+            # The in-memory index and counts are reloaded from the new collections
+            self._knowledge_index_version = None
+            self._counts = {}
             
             logger.info("ChromaDB collections initialized successfully")
             return True
@@ -101,9 +220,26 @@ class ChromaDBService:
             self.files_collection = None
             return False
 
+    def _ensure_search_ef(self, name: str, collection):
+        """Raise the HNSW search breadth of a collection created before HNSW_METADATA.
+
+        get_or_create_collection ignores the metadata of collections that
+        already exist, so those keep the search_ef they were created with.
+        """
+        target = HNSW_METADATA["hnsw:search_ef"]
+        try:
+            ef = ((collection.configuration or {}).get("hnsw") or {}).get("ef_search")
+            if isinstance(ef, int) and ef < target:
+                # Through the configuration; modifying the metadata would
+                # replace it without changing the index
+                collection.modify(configuration={"hnsw": {"ef_search": target}})
+                logger.info(f"Raised HNSW search_ef of the {name} collection from {ef} to {target}")
+        except Exception as e:
+            logger.warning(f"Could not raise search_ef of the {name} collection: {e}")
+
     def _check_connection(self) -> bool:
         """Check if connection is still alive and reconnect if needed"""
-        current_time = time.time()
+        current_time = time.monotonic()
         if current_time - self._last_connection_check < self._connection_check_interval:
             return self.client is not None
             
@@ -119,155 +255,523 @@ class ChromaDBService:
             logger.warning(f"Connection check failed: {e}, attempting to reconnect...")
             return self._initialize_client()
 
+    async def _run(self, fn, *args, **kwargs):
+        """Run a blocking client call in the ChromaDB executor"""
+        self.requests_in_flight += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, partial(fn, *args, **kwargs))
+        finally:
+            self.requests_in_flight -= 1
+
+    def _connection_check_due(self) -> bool:
+        return time.monotonic() - self._last_connection_check >= self._connection_check_interval
+
+    def start_health_checks(self):
+        """Check the connection from a background task from now on, rather than on requests.
+
+        Requests then only look at whether the last check left a client,
+        so none of them waits on a heartbeat or reconnect.
+        """
+        if self._health_task is None:
+            self._health_task = asyncio.create_task(self._health_loop(), name="chromadb-health")
+
+    async def stop_health_checks(self):
+        """Stop the background connection checks (called on application shutdown)"""
+        if self._health_task is not None:
+            self._health_task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._health_task
+            self._health_task = None
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(max(self._last_connection_check + self._connection_check_interval - time.monotonic(), 0))
+            try:
+                await self._shared_connection_check()
+            except Exception as e:
+                logger.error(f"ChromaDB connection check failed: {e}")
+                self._last_connection_check = time.monotonic()
+
     @asynccontextmanager
     async def _safe_operation(self):
         """Context manager for safe ChromaDB operations with automatic reconnection"""
-        if not self._check_connection():
+        # A due check reconnects with blocking retries and backoff sleeps, so
+        # it runs in a worker thread; otherwise the last check's outcome stands
+        if self._health_task is None and self._connection_check_due():
+            connected = await self._shared_connection_check()
+        else:
+            connected = self.client is not None
+        if not connected:
             raise Exception("ChromaDB not available after reconnection attempts")
         yield
 
     def is_available(self) -> bool:
         """Check if ChromaDB is available with connection verification"""
+        if self._health_task is not None:
+            return self._is_available_cached()
         return self._check_connection() and self.collection is not None
 
+    def _is_available_cached(self) -> bool:
+        """Whether the last connection check left ChromaDB available, without checking again"""
+        return self.client is not None and self.collection is not None
+
+    async def _shared_connection_check(self) -> bool:
+        """Run a due connection check in a worker thread, once for all callers waiting on it.
+
+        A heartbeat (or reconnect, with its retries) is network I/O, so it
+        runs off the event loop; requests arriving while it runs wait for
+        its result rather than each probing ChromaDB.
+        """
+        if self._connection_check_task is None:
+            task = asyncio.ensure_future(self._run(self._check_connection))
+            task.add_done_callback(lambda _: setattr(self, "_connection_check_task", None))
+            self._connection_check_task = task
+        # Shielded, so one caller giving up doesn't cancel the check for the others
+        return await asyncio.shield(self._connection_check_task)
+
+    async def check_available(self) -> bool:
+        """Like is_available, but a due connection check runs in a worker thread instead of on the event loop"""
+        if self._health_task is None and self._connection_check_due():
+            return await self._shared_connection_check() and self.collection is not None
+        return self.is_available()
+
     async def add_document(self, content: str, metadata: Dict[str, Any] = None) -> str:
         """Add a document to the knowledge base with error handling"""
+        doc_ids = await self.add_documents_batch([content], [metadata])
+        return doc_ids[0]
+
+    def _get_embedding_function(self):
+        # Chroma's DefaultEmbeddingFunction loads the ONNX model again on every
+        # call, so the model it wraps is kept here and loaded once. By default
+        # ONNX Runtime uses every available provider, CUDA included when
+        # onnxruntime-gpu is installed; EMBEDDING_PROVIDERS pins the list.
+        if self._embedding_function is None:
+            providers = os.getenv("EMBEDDING_PROVIDERS")
+            self._embedding_function = embedding_functions.ONNXMiniLM_L6_V2(
+                preferred_providers=providers.split(",") if providers else None
+            )
+        return self._embedding_function
+
+    def _embed_query_sync(self, text: str):
+        # Checks the persistent cache before running the embedding model
+        embedding = self.embedding_cache.get(text)
+        if embedding is not None:
+            return embedding
+        return self.embedding_cache.put(text, self._get_embedding_function()([text])[0])
+
+    async def embed_query(self, text: str):
+        """Embed a query with the same embedding function the collections use by default.
+
+        Returns a float32 vector, or None if the query couldn't be embedded.
+        Runs of whitespace are collapsed first; the tokenizer ignores them, so
+        this only makes more queries hit the embedding cache.
+        """
+        text = " ".join(text.split())
+        embedding = self.embedding_cache.get(text, memory_only=True)
+        if embedding is not None:
+            return embedding
+        try:
+            return await asyncio.to_thread(self._embed_query_sync, text)
+        except Exception as e:
+            logger.warning(f"Could not embed query: {e}")
+            return None
+
+    async def embed_documents(self, contents: List[str]):
+        """Embed a batch of documents in one pass of the embedding model.
+
+        Returns a float32 matrix, or None if they couldn't be embedded.
+        """
+        try:
+            embeddings = await asyncio.to_thread(self._get_embedding_function(), list(contents))
+            return np.asarray(embeddings, dtype=np.float32)
+        except Exception as e:
+            logger.warning(f"Could not embed documents, leaving it to ChromaDB: {e}")
+            return None
+
+    async def add_documents_batch(self, contents: List[str], metadatas: List[Dict[str, Any]],
+                                  ids: Optional[List[str]] = None) -> List[str]:
+        """Add a batch of documents to the knowledge base in a single call, so they are embedded together"""
         async with self._safe_operation():
-            doc_id = str(uuid.uuid4())
+            doc_ids = ids or new_ids(len(contents))
+            safe_metadatas = [_clean_metadata(metadata) for metadata in metadatas]
             
-            # Ensure metadata is a dictionary and filter out None values
-            safe_metadata = {}
-            if metadata:
-                safe_metadata = {k: v for k, v in metadata.items() if v is not None}
+            # Embedded here rather than by ChromaDB, so the vectors can also
+            # go straight into the in-memory index
+            embeddings = await self.embed_documents(contents)
+            add_args = {"embeddings": embeddings} if embeddings is not None else {}
             
             try:
-                self.collection.add(
-                    documents=[content],
-                    metadatas=[safe_metadata],
-                    ids=[doc_id]
+                await self._run(
+                    self.collection.add,
+                    documents=list(contents),
+                    metadatas=safe_metadatas,
+                    ids=doc_ids,
+                    **add_args
                 )
-                logger.info(f"Successfully added document {doc_id}")
-                return doc_id
+                await self._knowledge_added(doc_ids, embeddings, list(contents), safe_metadatas)
+                # Debug, and formatted only when enabled: this runs for every
+                # write, and for every batch of a bulk add
+                logger.debug("Successfully added batch of %d documents", len(doc_ids))
+                return doc_ids
             except Exception as e:
-                logger.error(f"Error adding document to ChromaDB: {e}")
+                logger.error(f"Error adding document batch to ChromaDB: {e}")
                 raise
 
-    async def search_documents(self, query: str, limit: int = 5, distance_threshold: float = 0.8) -> List[Dict[str, Any]]:
-        """Search for similar documents with improved relevance filtering"""
-        if not self._check_connection():
+    def _index_capacity(self, index) -> int:
+        """Most documents the in-memory index may hold before searches go back to ChromaDB"""
+        if isinstance(index, USearchIndex):
+            return self.ann_search_max_documents
+        return self.matrix_search_max_documents
+
+    def _load_knowledge_index(self) -> Optional[VectorIndex]:
+        """Load all knowledge base embeddings, unless the collection is too large to hold in memory"""
+        count = self.collection.count()
+        if count <= self.matrix_search_max_documents:
+            index = VectorIndex(quantize=self.matrix_search_quantize)
+        elif USEARCH_AVAILABLE and count <= self.ann_search_max_documents:
+            index = USearchIndex(quantize=self.matrix_search_quantize)
+        else:
+            return None
+        results = self.collection.get(include=["embeddings", "documents", "metadatas"])
+        index.add(results['ids'], results['embeddings'], results['documents'], results['metadatas'])
+        return index
+
+    async def _get_knowledge_index(self) -> Optional[VectorIndex]:
+        """Get the in-memory knowledge index, (re)loading it if the knowledge base changed"""
+        if self._knowledge_index_version == self.knowledge_version:
+            return self._knowledge_index
+        async with self._knowledge_index_lock:
+            if self._knowledge_index_version != self.knowledge_version:
+                version = self.knowledge_version
+                try:
+                    self._knowledge_index = await self._run(self._load_knowledge_index)
+                except Exception as e:
+                    logger.warning(f"Could not load knowledge embeddings, searching through ChromaDB: {e}")
+                    self._knowledge_index = None
+                self._knowledge_index_version = version
+            return self._knowledge_index
+
+    async def _knowledge_added(self, doc_ids: List[str], embeddings=None, contents: Optional[List[str]] = None,
+                               metadatas: Optional[List[Dict[str, Any]]] = None):
+        """Record new knowledge base documents, appending them to the in-memory index if it is loaded.
+
+        If the caller already has the documents' embeddings they are used
+        directly; otherwise they are fetched back from ChromaDB.
+        """
+        async with self._knowledge_index_lock:
+            up_to_date = self._knowledge_index is not None and self._knowledge_index_version == self.knowledge_version
+            self.knowledge_version += 1
+            self._counts.pop("knowledge", None)
+            if not up_to_date:
+                return
+            if len(self._knowledge_index) + len(doc_ids) > self._index_capacity(self._knowledge_index):
+                # Reloaded on the next search, as a larger kind of index or not at all
+                self._knowledge_index = None
+                return
+            try:
+                if embeddings is not None:
+                    self._knowledge_index.add(doc_ids, embeddings, contents, metadatas)
+                else:
+                    results = await self._run(
+                        self.collection.get,
+                        ids=doc_ids,
+                        include=["embeddings", "documents", "metadatas"]
+                    )
+                    self._knowledge_index.add(results['ids'], results['embeddings'], results['documents'], results['metadatas'])
+                self._knowledge_index_version = self.knowledge_version
+            except Exception as e:
+                # Left out of date, so it is reloaded on the next search
+                logger.warning(f"Could not add documents to the in-memory index: {e}")
+
+    def _search_knowledge_index(self, index: VectorIndex, query_embedding, limit: int,
+                                distance_threshold: float) -> List[Dict[str, Any]]:
+        documents = []
+        for position, distance in index.search(query_embedding, limit):
+            # Results are nearest first, so the rest are above the threshold too
+            if distance > distance_threshold:
+                break
+            documents.append(self._result_entry(index.ids[position], index.documents[position],
+                                                index.metadatas[position], distance))
+        return documents
+
+    @staticmethod
+    def _result_rows(results: Dict[str, Any]):
+        """(id, document, metadata, distance) of each match of a single-query ChromaDB result"""
+        if not results['documents'] or not results['documents'][0]:
+            return ()  # No matches, so nothing else to look at
+        contents = results['documents'][0]
+        distances = results['distances'][0] if results['distances'] and results['distances'][0] else [0.0] * len(contents)
+        metadatas = results['metadatas'][0] if results['metadatas'] and results['metadatas'][0] else [None] * len(contents)
+        return zip(results['ids'][0], contents, metadatas, distances)
+
+    @classmethod
+    def _rows_within(cls, results: Dict[str, Any], distance_threshold: Optional[float]):
+        """_result_rows up to the first match beyond `distance_threshold`.
+
+        Matches come nearest first, so the rest would be beyond it too.
+        Asking ChromaDB for more than the limit couldn't add matches within
+        the threshold either, for the same reason.
+        """
+        rows = cls._result_rows(results)
+        if distance_threshold is None:
+            return rows
+        return takewhile(lambda row: row[3] <= distance_threshold, rows)
+
+    @staticmethod
+    def _result_entry(doc_id: str, content: str, metadata: Optional[Dict[str, Any]], distance: float) -> Dict[str, Any]:
+        return {
+            'id': doc_id,
+            'content': content,
+            'metadata': _clean_metadata(metadata),
+            'distance': distance,
+            'relevance_score': 1.0 - distance  # Convert distance to relevance score
+        }
+
+    @staticmethod
+    def _within_threshold(distances: List[float], distance_threshold: float) -> List[int]:
+        """Positions of the distances at or below the threshold, in their original order"""
+        return np.flatnonzero(np.asarray(distances, dtype=np.float64) <= distance_threshold).tolist()
+
+    def _query_collection(self, name: str, query_field: str, queries: List[Any], n_results: int,
+                          where: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        # Looked up on every call, since reconnecting replaces the collections
+        return getattr(self, name).query(n_results=n_results, where=where, include=QUERY_INCLUDE,
+                                         **{query_field: queries})
+
+    async def _batched_query(self, name: str, query, n_results: int,
+                             file_type: Optional[str] = None) -> Dict[str, Any]:
+        """Query the `name` collection with a query text or embedding, optionally only matching `file_type`.
+
+        Concurrent queries of the same kind are sent as one multi-query
+        call, which ChromaDB embeds and searches in one pass. The result has
+        the shape of a single-query result.
+        """
+        query_field = "query_texts" if isinstance(query, str) else "query_embeddings"
+        key = (name, query_field, file_type)
+        batcher = self._query_batchers.get(key)
+        if batcher is None:
+            # The where clause is built once here and reused for every query
+            where = {"file_type": file_type} if file_type else None
+            batcher = QueryBatcher(partial(self._query_collection, name, query_field, where=where),
+                                   executor=self.executor)
+            self._query_batchers[key] = batcher
+        return await batcher.submit(query, n_results)
+
+    async def search_documents(self, query: str, limit: int = 5, distance_threshold: float = 0.8,
+                               query_embedding: Optional[List[float]] = None) -> List[Dict[str, Any]]:
+        """Search for similar documents with improved relevance filtering.
+
+        If the query has already been embedded, pass `query_embedding` to
+        skip embedding it again. Small knowledge bases are searched in
+        memory; larger ones are queried through ChromaDB. Results are cached
+        for a minute, or until the knowledge base changes.
+        """
+        if not await self.check_available():
             return []
+        
+        cache_key = self._search_cache_key(query, "knowledge", limit, distance_threshold, self.knowledge_version)
+        documents = self.search_cache.get(cache_key)
+        if documents is None:
+            documents = await self._search_documents(query, limit, distance_threshold, query_embedding)
+            if documents is None:
+                return []
+            self.search_cache[cache_key] = documents
+        return documents
+
+    @staticmethod
+    def _search_cache_key(query: str, *params) -> Tuple:
+        # Whitespace is normalized as for embedding, and the query hashed so
+        # long queries don't take up space as keys. Callers include the
+        # collection's version, which makes entries from before its last
+        # change unreachable.
+        digest = hashlib.blake2b(" ".join(query.split()).encode(), digest_size=16).digest()
+        return (digest, *params)
+
+    async def _search_documents(self, query: str, limit: int, distance_threshold: float,
+                                query_embedding: Optional[List[float]]) -> Optional[List[Dict[str, Any]]]:
+        """Search the knowledge base, returning None if the search failed"""
+        async with self._safe_operation():
+            index = await self._get_knowledge_index()
+            if index is not None:
+                if query_embedding is None:
+                    query_embedding = await self.embed_query(query)
+                if query_embedding is not None:
+                    return self._search_knowledge_index(index, query_embedding, limit, distance_threshold)
             
+            try:
+                results = await self._batched_query(
+                    "collection", query if query_embedding is None else query_embedding, limit
+                )
+                
+                # Only include results below distance threshold for better relevance.
+                # ChromaDB returns matches nearest first, so they are already
+                # in order of relevance (highest first).
+                return [
+                    self._result_entry(doc_id, content, metadata, distance)
+                    for doc_id, content, metadata, distance in self._rows_within(results, distance_threshold)
+                ]
+                
+            except Exception as e:
+                logger.error(f"Error searching ChromaDB: {e}")
+                return None
+
+    async def list_documents(self, limit: int = 20, offset: int = 0) -> Dict[str, Any]:
+        """Page through the knowledge base documents without running a similarity search"""
         async with self._safe_operation():
             try:
-                results = self.collection.query(
-                    query_texts=[query],
-                    n_results=limit
+                # ChromaDB applies the offset server side, so a page only
+                # transfers `limit` documents
+                results = await self._run(
+                    self.collection.get,
+                    limit=limit,
+                    offset=offset,
+                    include=["documents", "metadatas"]
                 )
+                total = await self._run(self.collection.count)
                 
-                documents = []
-                for i, doc in enumerate(results['documents'][0]):
-                    distance = results['distances'][0][i] if results['distances'] and results['distances'][0] else 0
-                    
-                    # Only include results below distance threshold for better relevance
-                    if distance <= distance_threshold:
-                        metadata = results['metadatas'][0][i] if results['metadatas'] and results['metadatas'][0] and i < len(results['metadatas'][0]) else {}
-                        safe_metadata = {k: v for k, v in metadata.items() if v is not None} if metadata else {}
-                        
-                        documents.append({
-                            'id': results['ids'][0][i],
-                            'content': doc,
-                            'metadata': safe_metadata,
-                            'distance': distance,
-                            'relevance_score': 1.0 - distance  # Convert distance to relevance score
-                        })
+                # Each field is looked up once for the whole page, not per row
+                doc_ids = results['ids']
+                contents = results.get('documents') or [''] * len(doc_ids)
+                metadatas = results.get('metadatas') or [None] * len(doc_ids)
+                documents = [
+                    {
+                        'id': doc_id,
+                        'content': content,
+                        'metadata': _clean_metadata(metadata)
+                    }
+                    for doc_id, content, metadata in zip(doc_ids, contents, metadatas)
+                ]
                 
-                # Sort by relevance score (highest first)
-                documents.sort(key=lambda x: x['relevance_score'], reverse=True)
-                return documents
+                return {"documents": documents, "total": total}
                 
             except Exception as e:
-                logger.error(f"Error searching ChromaDB: {e}")
-                return []
+                logger.error(f"Error listing documents: {e}")
+                return {"documents": [], "total": 0, "error": str(e)}
 
-    async def add_conversation_context(self, conversation_id: str, messages: List[Dict[str, Any]]):
-        """Add conversation context to the knowledge base with enhanced metadata"""
+    async def add_conversation_context(self, conversation_id: str, messages: Iterable[Dict[str, Any]]):
+        """Add conversation context to the knowledge base with enhanced metadata.
+
+        `messages` is read once, so it may also be a generator.
+        """
         async with self._safe_operation():
             if not self.conversations_collection:
                 logger.warning("Conversations collection not available")
                 return
             
             try:
-                # Create a summary of the conversation
-                conversation_text = f"Conversation {conversation_id}:\n"
+                # Create a summary of the conversation, collecting what the
+                # metadata needs in the same pass. The lines are joined once
+                # rather than grown by repeated concatenation.
+                lines = [f"Conversation {conversation_id}:"]
+                participants = set()
+                last_message = {}
                 for msg in messages:
                     role = msg.get('role', 'unknown')
-                    content = msg.get('content', '')
-                    conversation_text += f"{role}: {content}\n"
+                    participants.add(role)
+                    lines.append(f"{role}: {msg.get('content', '')}")
+                    last_message = msg
+                conversation_text = "\n".join(lines) + "\n"
                 
                 # Enhanced metadata with more context
                 metadata = {
                     'type': 'conversation',
                     'conversation_id': str(conversation_id),
-                    'message_count': len(messages),
-                    'timestamp': messages[-1].get('timestamp', '') if messages else '',
-                    'participants': list(set(msg.get('role', 'unknown') for msg in messages)),
-                    'last_message_preview': messages[-1].get('content', '')[:100] if messages else ''
+                    'message_count': len(lines) - 1,
+                    'timestamp': last_message.get('timestamp', ''),
+                    'participants': list(participants),
+                    'last_message_preview': last_message.get('content', '')[:100]
                 }
                 
                 # Filter out None values from metadata
-                safe_metadata = {k: v for k, v in metadata.items() if v is not None}
+                safe_metadata = _clean_metadata(metadata)
                 
                 # Add to conversations collection
-                doc_id = str(uuid.uuid4())
-                self.conversations_collection.add(
+                doc_id = new_ids(1)[0]
+                await self._run(
+                    self.conversations_collection.add,
                     documents=[conversation_text],
                     metadatas=[safe_metadata],
                     ids=[doc_id]
                 )
+                self._counts.pop("conversations", None)
+                self.conversations_version += 1
                 
-                logger.info(f"Added conversation {conversation_id} to ChromaDB with enhanced metadata")
+                logger.debug("Added conversation %s to ChromaDB with enhanced metadata", conversation_id)
                 
             except Exception as e:
                 logger.error(f"Error adding conversation context: {e}")
 
     async def get_relevant_context(self, query: str, limit: int = 5, min_relevance: float = 0.6) -> List[str]:
-        """Get relevant context for a query with improved filtering"""
-        documents = await self.search_documents(query, limit, distance_threshold=1.0 - min_relevance)
-        return [doc['content'] for doc in documents if doc['relevance_score'] >= min_relevance]
+        """Get relevant context for a query with improved filtering.
 
-    async def search_conversations(self, query: str, limit: int = 5) -> List[Dict[str, Any]]:
-        """Search conversation history with enhanced filtering"""
+        Only the text of the matches is needed, so ChromaDB isn't asked for
+        their ids or metadata and no per-result dicts are built.
+        """
+        if not await self.check_available():
+            return []
+        distance_threshold = 1.0 - min_relevance
+        
         async with self._safe_operation():
-            if not self.conversations_collection:
-                return []
+            index = await self._get_knowledge_index()
+            if index is not None:
+                query_embedding = await self.embed_query(query)
+                if query_embedding is not None:
+                    matches = index.search(query_embedding, limit)
+                    return [index.documents[position] for position, distance in matches if distance <= distance_threshold]
             
             try:
-                results = self.conversations_collection.query(
+                results = await self._run(
+                    self.collection.query,
                     query_texts=[query],
-                    n_results=limit
+                    n_results=limit,
+                    include=["documents", "distances"]
+                )
+            except Exception as e:
+                logger.error(f"Error getting relevant context from ChromaDB: {e}")
+                return []
+            
+            contents = results['documents'][0]
+            if not results['distances'] or not results['distances'][0]:
+                return list(contents)
+            return [contents[i] for i in self._within_threshold(results['distances'][0], distance_threshold)]
+
+    async def search_conversations(self, query: str, limit: int = 5, distance_threshold: Optional[float] = None,
+                                   query_embedding: Optional[List[float]] = None) -> List[Dict[str, Any]]:
+        """Search conversation history with enhanced filtering.
+
+        Results are cached for a minute, or until a conversation is added.
+        """
+        cache_key = self._search_cache_key(query, "conversations", limit, distance_threshold, self.conversations_version)
+        conversations = self.search_cache.get(cache_key)
+        if conversations is None:
+            conversations = await self._search_conversations(query, limit, distance_threshold, query_embedding)
+            if conversations is None:
+                return []
+            self.search_cache[cache_key] = conversations
+        return conversations
+
+    async def _search_conversations(self, query: str, limit: int, distance_threshold: Optional[float],
+                                    query_embedding: Optional[List[float]]) -> Optional[List[Dict[str, Any]]]:
+        """Search conversation history, returning None if the search failed"""
+        async with self._safe_operation():
+            if not self.conversations_collection:
+                return None
+            
+            try:
+                results = await self._batched_query(
+                    "conversations_collection", query if query_embedding is None else query_embedding, limit
                 )
                 
-                conversations = []
-                for i, doc in enumerate(results['documents'][0]):
-                    metadata = results['metadatas'][0][i] if results['metadatas'] and results['metadatas'][0] and i < len(results['metadatas'][0]) else {}
-                    safe_metadata = {k: v for k, v in metadata.items() if v is not None} if metadata else {}
-                    distance = results['distances'][0][i] if results['distances'] and results['distances'][0] else 0
-                    
-                    conversations.append({
-                        'id': results['ids'][0][i],
-                        'content': doc,
-                        'metadata': safe_metadata,
-                        'distance': distance,
-                        'relevance_score': 1.0 - distance
-                    })
-                
-                # Sort by relevance
-                conversations.sort(key=lambda x: x['relevance_score'], reverse=True)
-                return conversations
+                # Skip irrelevant results before doing any more work on them.
+                # Matches come nearest first, so already sorted by relevance.
+                return [
+                    self._result_entry(doc_id, content, metadata, distance)
+                    for doc_id, content, metadata, distance in self._rows_within(results, distance_threshold)
+                ]
                 
             except Exception as e:
                 logger.error(f"Error searching conversations: {e}")
-                return []
+                return None
 
     async def add_file_content(self, filename: str, content: str, file_type: str, metadata: Dict[str, Any] = None) -> str:
         """Add file content to dedicated files collection"""
@@ -276,7 +780,7 @@ class ChromaDBService:
                 logger.warning("Files collection not available")
                 return ""
                 
-            doc_id = str(uuid.uuid4())
+            doc_id = new_ids(1)[0]
             
             # Enhanced file metadata
             file_metadata = {
@@ -288,112 +792,171 @@ class ChromaDBService:
                 **(metadata or {})
             }
             
-            safe_metadata = {k: v for k, v in file_metadata.items() if v is not None}
+            safe_metadata = _clean_metadata(file_metadata)
             
             try:
-                self.files_collection.add(
+                await self._run(
+                    self.files_collection.add,
                     documents=[content],
                     metadatas=[safe_metadata],
                     ids=[doc_id]
                 )
-                logger.info(f"Successfully added file {filename} with id {doc_id}")
+                self._counts.pop("files", None)
+                self.files_version += 1
+                logger.debug("Successfully added file %s with id %s", filename, doc_id)
                 return doc_id
             except Exception as e:
                 logger.error(f"Error adding file to ChromaDB: {e}")
                 raise
 
     async def search_files(self, query: str, file_type: Optional[str] = None, limit: int = 5) -> List[Dict[str, Any]]:
-        """Search through uploaded files"""
+        """Search through uploaded files.
+
+        Results are cached for a minute, or until a file is added.
+        """
+        cache_key = self._search_cache_key(query, "files", limit, file_type, self.files_version)
+        files = self.search_cache.get(cache_key)
+        if files is None:
+            files = await self._search_files(query, file_type, limit)
+            if files is None:
+                return []
+            self.search_cache[cache_key] = files
+        return files
+
+    async def _search_files(self, query: str, file_type: Optional[str], limit: int) -> Optional[List[Dict[str, Any]]]:
+        """Search through uploaded files, returning None if the search failed"""
         async with self._safe_operation():
             if not self.files_collection:
-                return []
+                return None
             
             try:
-                # Build where clause for filtering by file type
-                where_clause = None
-                if file_type:
-                    where_clause = {"file_type": file_type}
-                
-                results = self.files_collection.query(
-                    query_texts=[query],
-                    n_results=limit,
-                    where=where_clause
-                )
-                
-                files = []
-                for i, doc in enumerate(results['documents'][0]):
-                    metadata = results['metadatas'][0][i] if results['metadatas'] and results['metadatas'][0] and i < len(results['metadatas'][0]) else {}
-                    safe_metadata = {k: v for k, v in metadata.items() if v is not None} if metadata else {}
-                    distance = results['distances'][0][i] if results['distances'] and results['distances'][0] else 0
-                    
-                    files.append({
-                        'id': results['ids'][0][i],
-                        'content': doc,
-                        'metadata': safe_metadata,
-                        'distance': distance,
-                        'relevance_score': 1.0 - distance
-                    })
+                # Filtered by file type on the server
+                results = await self._batched_query("files_collection", query, limit, file_type=file_type)
                 
-                files.sort(key=lambda x: x['relevance_score'], reverse=True)
-                return files
+                # Nearest first, so already sorted by relevance
+                return [
+                    self._result_entry(doc_id, content, metadata, distance)
+                    for doc_id, content, metadata, distance in self._result_rows(results)
+                ]
                 
             except Exception as e:
                 logger.error(f"Error searching files: {e}")
-                return []
+                return None
     
+    def _cached_count(self, name: str) -> Optional[int]:
+        cached = self._counts.get(name)
+        if cached is not None and time.monotonic() - cached[1] < self.count_cache_ttl:
+            return cached[0]
+        return None
+
+    def _count(self, name: str, collection) -> int:
+        """Count a collection's documents, cached for count_cache_ttl seconds or until it is written to"""
+        if collection is None:
+            return 0
+        count = self._cached_count(name)
+        if count is None:
+            now = time.monotonic()
+            count = collection.count()
+            self._counts[name] = (count, now)
+        return count
+
+    def _count_all(self, collections: Dict[str, Any]) -> Dict[str, int]:
+        """Counts of several collections (name -> collection), those not cached counted concurrently"""
+        counting = {
+            name: self.executor.submit(self._count, name, collection)
+            for name, collection in collections.items()
+            if collection is not None and self._cached_count(name) is None
+        }
+        return {
+            name: counting[name].result() if name in counting else self._count(name, collection)
+            for name, collection in collections.items()
+        }
+
     def get_collection_stats(self) -> Dict[str, Any]:
-        """Get statistics about ChromaDB collections with enhanced details"""
-        if not self.is_available():
+        """Get statistics about ChromaDB collections with enhanced details.
+
+        The connection isn't checked again here: callers have just checked
+        it, or run alongside a check, and a lost connection fails the
+        counts anyway.
+        """
+        if not self._is_available_cached():
             return {"available": False, "error": "ChromaDB not available"}
         
         try:
+            # Each count is a query on the server, so they are taken once and cached briefly
+            counts = self._count_all({
+                "knowledge": self.collection,
+                "conversations": self.conversations_collection,
+                "files": self.files_collection
+            })
+            knowledge_count = counts["knowledge"]
+            conversations_count = counts["conversations"]
+            files_count = counts["files"]
             stats = {
                 "available": True,
                 "connection_type": "embedded" if "Persistent" in str(type(self.client)) else "http",
-                "knowledge_documents": self.collection.count(),
-                "conversations": self.conversations_collection.count() if self.conversations_collection else 0,
-                "files": self.files_collection.count() if self.files_collection else 0,
+                "requests_in_flight": self.requests_in_flight,
+                "max_concurrent_requests": MAX_CONCURRENT_REQUESTS,
+                "knowledge_documents": knowledge_count,
+                "conversations": conversations_count,
+                "files": files_count,
                 "collections": [
                     {
                         "name": "evolveui_knowledge", 
                         "type": "knowledge_base",
-                        "count": self.collection.count(),
+                        "count": knowledge_count,
                         "description": "Main knowledge base for documents and context"
                     },
                     {
                         "name": "evolveui_conversations", 
                         "type": "conversation_history",
-                        "count": self.conversations_collection.count() if self.conversations_collection else 0,
+                        "count": conversations_count,
                         "description": "Historical conversation data for context retrieval"
                     },
                     {
                         "name": "evolveui_files", 
                         "type": "file_storage",
-                        "count": self.files_collection.count() if self.files_collection else 0,
+                        "count": files_count,
                         "description": "Uploaded file content for search and retrieval"
                     }
                 ],
-                "total_documents": (
-                    self.collection.count() + 
-                    (self.conversations_collection.count() if self.conversations_collection else 0) +
-                    (self.files_collection.count() if self.files_collection else 0)
-                )
+                "total_documents": knowledge_count + conversations_count + files_count
             }
             return stats
         except Exception as e:
             logger.error(f"Error getting collection stats: {e}")
             return {"available": False, "error": str(e)}
     
+    async def optimize_for_search(self, ef: int = 200) -> Dict[str, Any]:
+        """Set the HNSW search breadth of the searched collections, including ones created before HNSW_METADATA"""
+        async with self._safe_operation():
+            updated = []
+            for name, collection in (("knowledge", self.collection), ("conversations", self.conversations_collection)):
+                if collection is None:
+                    continue
+                try:
+                    # Through the configuration; modifying the metadata would
+                    # replace it without changing the index
+                    await self._run(collection.modify, configuration={"hnsw": {"ef_search": ef}})
+                    updated.append(name)
+                except Exception as e:
+                    logger.error(f"Error setting search_ef on the {name} collection: {e}")
+                    return {"success": False, "error": str(e), "updated": updated}
+            
+            logger.info(f"Set HNSW search_ef to {ef} on {', '.join(updated)}")
+            return {"success": True, "search_ef": ef, "updated": updated}
+
     async def optimize_collections(self) -> Dict[str, Any]:
         """Optimize collections for better performance"""
-        if not self.is_available():
+        if not await self.check_available():
             return {"success": False, "error": "ChromaDB not available"}
         
         optimization_results = {}
         
         try:
-            # Get stats before optimization
-            before_stats = self.get_collection_stats()
+            # Get stats before optimization. Counting blocks on the server, so
+            # off the event loop.
+            before_stats = await asyncio.to_thread(self.get_collection_stats)
             
             # Perform optimization operations (if supported by ChromaDB version)
             # Currently, ChromaDB doesn't expose explicit optimization methods,
@@ -417,45 +980,65 @@ class ChromaDBService:
             logger.error(f"Error optimizing collections: {e}")
             return {"success": False, "error": str(e)}
 
-    async def bulk_add_documents(self, documents: List[Dict[str, Any]]) -> Dict[str, Any]:
-        """Add multiple documents efficiently"""
+    async def bulk_add_documents(self, documents: Iterable[Dict[str, Any]], batch_size: Optional[int] = None,
+                                 concurrency: int = 4) -> Dict[str, Any]:
+        """Add multiple documents efficiently, as bulk_add_documents_iter, reporting the totals at the end"""
+        results = {"success": True, "added": 0, "errors": []}
+        async for batch in self.bulk_add_documents_iter(documents, batch_size, concurrency):
+            results["added"] += len(batch["added_ids"])
+            results["errors"].extend(batch["errors"])
+        results["success"] = not results["errors"]
+        
+        if results["added"]:
+            logger.info(f"Successfully bulk added {results['added']} documents")
+        return results
+
+    async def bulk_add_documents_iter(self, documents: Iterable[Dict[str, Any]], batch_size: Optional[int] = None,
+                                      concurrency: int = 4) -> AsyncIterator[Dict[str, Any]]:
+        """Add multiple documents efficiently, yielding the outcome of each batch as soon as it is stored.
+
+        Documents are read from `documents` as they are needed and stored in
+        batches of `batch_size` (add_batch_size by default), each embedded in
+        one pass and stored with a single call. Up to `concurrency` batches
+        are stored at once, so memory use doesn't grow with the number of
+        documents. Each outcome is {"added_ids": [...], "errors": [...]}; a
+        failed batch doesn't affect the others.
+        """
         async with self._safe_operation():
-            if not documents:
-                return {"success": True, "added": 0, "errors": []}
-            
-            results = {"success": True, "added": 0, "errors": []}
-            
-            # Prepare bulk data
-            doc_ids = []
-            doc_contents = []
-            doc_metadatas = []
-            
-            for doc in documents:
-                doc_id = str(uuid.uuid4())
-                content = doc.get('content', '')
-                metadata = doc.get('metadata', {})
-                
-                if content:  # Only add non-empty documents
-                    doc_ids.append(doc_id)
-                    doc_contents.append(content)
-                    
-                    # Clean metadata
-                    safe_metadata = {k: v for k, v in metadata.items() if v is not None}
-                    doc_metadatas.append(safe_metadata)
-            
+            pending = set()
             try:
-                if doc_ids:
-                    self.collection.add(
-                        documents=doc_contents,
-                        metadatas=doc_metadatas,
-                        ids=doc_ids
-                    )
-                    results["added"] = len(doc_ids)
-                    logger.info(f"Successfully bulk added {len(doc_ids)} documents")
-                
-            except Exception as e:
-                logger.error(f"Error in bulk add: {e}")
-                results["success"] = False
-                results["errors"].append(str(e))
-            
-            return results
\ No newline at end of file
+                for contents, metadatas in self._document_batches(documents, batch_size or self.add_batch_size):
+                    if len(pending) >= concurrency:
+                        # Wait for a batch to finish before reading more documents
+                        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                        for task in done:
+                            yield task.result()
+                    pending.add(asyncio.create_task(self._add_bulk_batch(contents, metadatas)))
+                for task in asyncio.as_completed(pending):
+                    yield await task
+            finally:
+                # The caller stopped iterating early. A ChromaDB call already
+                # under way may still complete, but nothing more is started.
+                for task in pending:
+                    if not task.done():
+                        task.cancel()
+
+    async def _add_bulk_batch(self, contents: List[str], metadatas: List[Dict[str, Any]]) -> Dict[str, Any]:
+        try:
+            doc_ids = await self.add_documents_batch(contents, metadatas)
+            return {"added_ids": doc_ids, "errors": []}
+        except Exception as e:
+            logger.error(f"Error in bulk add: {e}")
+            return {"added_ids": [], "errors": [str(e)]}
+
+    @staticmethod
+    def _document_batches(documents: Iterable[Dict[str, Any]], batch_size: int):
+        """(contents, metadatas) of each batch of up to `batch_size` non-empty documents"""
+        # Only add non-empty documents. Each batch is cut from the stream and
+        # split into columns with comprehensions, not appended to row by row.
+        non_empty = (doc for doc in documents if doc.get('content'))
+        while True:
+            batch = list(islice(non_empty, batch_size))
+            if not batch:
+                return
+            yield [doc['content'] for doc in batch], [doc.get('metadata', {}) for doc in batch]
\ No newline at end of file
@@ -1,33 +1,105 @@
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Tuple
 import subprocess
 import tempfile
 import os
+import shutil
 import time
 import signal
+import select
+import selectors
 import asyncio
 from concurrent.futures import ThreadPoolExecutor
 import logging
 import re
+from utils.sandbox import launcher_command, sandbox_support
+
+try:
+    from resource import prlimit, RLIMIT_CORE, RLIMIT_CPU, RLIMIT_DATA, RLIMIT_FSIZE
+    RESOURCE_LIMITS_AVAILABLE = True
+except ImportError:  # Linux only; elsewhere snippets run without kernel limits
+    RESOURCE_LIMITS_AVAILABLE = False
 
 logger = logging.getLogger(__name__)
 
+# Patterns are compiled once here rather than looked up in re's cache on
+# every request
+
+# Indicators counted to guess the language of a snippet, searched in the
+# code as written
+LANGUAGE_PATTERNS = {
+    'python': tuple(re.compile(pattern, re.MULTILINE) for pattern in (
+        r'\bimport\s+\w+',
+        r'\bfrom\s+\w+\s+import',
+        r'\bdef\s+\w+\s*\(',
+        r'\bclass\s+\w+\s*\(',
+        r'\bif\s+__name__\s*==\s*["\']__main__["\']',
+        r'\bprint\s*\(',
+        r'^\s*#.*python',
+    )),
+    'javascript': tuple(re.compile(pattern, re.MULTILINE) for pattern in (
+        r'\bconsole\.log\s*\(',
+        r'\bfunction\s+\w+\s*\(',
+        r'\bconst\s+\w+\s*=',
+        r'\blet\s+\w+\s*=',
+        r'\bvar\s+\w+\s*=',
+        r'\brequire\s*\(',
+        r'^\s*//.*js',
+    )),
+    'bash': tuple(re.compile(pattern, re.MULTILINE) for pattern in (
+        r'^\s*#!/bin/bash',
+        r'^\s*#!/bin/sh',
+        r'\becho\s+',
+        r'\bexport\s+\w+',
+        r'\$\w+',
+        r'^\s*#.*bash',
+    )),
+}
+
+# Markers that settle the language on their own, checked in order before
+# any indicators are counted
+FAST_SIGNALS = (
+    (re.compile(r'\A\s*#!\S*(?:/|\s)(?:ba)?sh\b'), 'bash'),
+    (re.compile(r'\A\s*#!\S*(?:/|\s)python'), 'python'),
+    (re.compile(r'\A\s*#!\S*(?:/|\s)node\b'), 'javascript'),
+    (re.compile(r'\bconsole\.log\s*\('), 'javascript'),
+    (re.compile(r'^\s*def\s+\w+\s*\(', re.MULTILINE), 'python'),
+)
+
+# Environment variables passed through to snippets; anything else the
+# server was started with (API keys, ...) stays out of their reach
+SANDBOX_ENV_VARS = ('PATH', 'HOME', 'LANG', 'LC_ALL', 'PYENV_ROOT', 'PYENV_VERSION')
+
+# Kernel limits on each running snippet. Memory is capped through the data
+# segment rather than the address space, which V8 reserves far more of
+# than it uses.
+MEMORY_LIMIT_BYTES = 512 * 1024 * 1024
+FILE_SIZE_LIMIT_BYTES = 10 * 1024 * 1024
+
+# Output kept from each of stdout and stderr; a snippet printing more is
+# killed rather than buffered in the server
+MAX_OUTPUT_BYTES = 1024 * 1024
+
 class CodeExecutionService:
-    def __init__(self):
+    def __init__(self, max_workers: Optional[int] = None):
         """Initialize code execution service"""
-        self.executor = ThreadPoolExecutor(max_workers=2)
+        # Each worker waits on one running snippet, so the pool bounds how
+        # many run at once. Defaults to ThreadPoolExecutor's own sizing.
+        self.max_workers = max_workers or int(os.getenv("CODE_EXECUTION_WORKERS", "0")) or min(32, (os.cpu_count() or 1) + 4)
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="code-execution")
+        # Each command reads the program from stdin
         self.supported_languages = {
             'python': {
-                'command': ['python3', '-c'],
+                'command': ['python3', '-'],
                 'file_extension': '.py',
                 'timeout': 30
             },
             'javascript': {
-                'command': ['node', '-e'],
+                'command': ['node', '-'],
                 'file_extension': '.js',
                 'timeout': 30
             },
             'bash': {
-                'command': ['bash', '-c'],
+                'command': ['bash', '-s'],
                 'file_extension': '.sh',
                 'timeout': 30
             }
@@ -36,49 +108,31 @@ class CodeExecutionService:
         # Create temp directory for code execution
         self.temp_dir = tempfile.mkdtemp(prefix='evolveui_code_')
         
-    def detect_language(self, code: str) -> Optional[str]:
-        """Detect programming language from code"""
-        code_lower = code.lower().strip()
-        
-        # Python indicators
-        python_patterns = [
-            r'\bimport\s+\w+',
-            r'\bfrom\s+\w+\s+import',
-            r'\bdef\s+\w+\s*\(',
-            r'\bclass\s+\w+\s*\(',
-            r'\bif\s+__name__\s*==\s*["\']__main__["\']',
-            r'\bprint\s*\(',
-            r'^\s*#.*python',
-        ]
+        # Snippets run in a Landlock + seccomp sandbox (see utils/sandbox.py).
+        # Without one, nothing is run.
+        self.sandbox_unavailable_reason = sandbox_support()
+        if self.sandbox_unavailable_reason:
+            logger.warning(f"Code execution disabled, no sandbox: {self.sandbox_unavailable_reason}")
         
-        # JavaScript indicators
-        js_patterns = [
-            r'\bconsole\.log\s*\(',
-            r'\bfunction\s+\w+\s*\(',
-            r'\bconst\s+\w+\s*=',
-            r'\blet\s+\w+\s*=',
-            r'\bvar\s+\w+\s*=',
-            r'\brequire\s*\(',
-            r'^\s*//.*js',
-        ]
+        # Runtime availability is probed with a subprocess, so results are
+        # cached and only re-checked every _availability_check_interval seconds
+        self._availability_cache = {}
+        self._last_availability_check = 0
+        self._availability_check_interval = 60
         
-        # Bash indicators
-        bash_patterns = [
-            r'^\s*#!/bin/bash',
-            r'^\s*#!/bin/sh',
-            r'\becho\s+',
-            r'\bexport\s+\w+',
-            r'\$\w+',
-            r'^\s*#.*bash',
-        ]
+    def detect_language(self, code: str) -> Optional[str]:
+        """Detect programming language from code"""
+        for pattern, language in FAST_SIGNALS:
+            if pattern.search(code):
+                return language
         
-        # Count matches for each language
-        python_score = sum(1 for pattern in python_patterns if re.search(pattern, code, re.MULTILINE))
-        js_score = sum(1 for pattern in js_patterns if re.search(pattern, code, re.MULTILINE))
-        bash_score = sum(1 for pattern in bash_patterns if re.search(pattern, code, re.MULTILINE))
+        # Otherwise count matches for each language
+        scores = {
+            language: sum(1 for pattern in patterns if pattern.search(code))
+            for language, patterns in LANGUAGE_PATTERNS.items()
+        }
         
         # Return language with highest score
-        scores = {'python': python_score, 'javascript': js_score, 'bash': bash_score}
         max_score = max(scores.values())
         
         if max_score > 0:
@@ -128,6 +182,7 @@ class CodeExecutionService:
     def _execute_code_sync(self, code: str, language: str, timeout: int) -> Dict[str, Any]:
         """Synchronous code execution (runs in thread pool)"""
         lang_config = self.supported_languages[language]
+        work_dir = None
         
         try:
             # Basic security checks
@@ -139,53 +194,60 @@ class CodeExecutionService:
                     "language": language
                 }
             
-            # Create temporary file for code
-            file_ext = lang_config['file_extension']
-            temp_file = os.path.join(self.temp_dir, f"code_{int(time.time())}{file_ext}")
+            if self.sandbox_unavailable_reason:
+                return {
+                    "success": False,
+                    "error": f"Code execution sandbox unavailable: {self.sandbox_unavailable_reason}",
+                    "language": language
+                }
             
-            # Prepare execution command
-            if language in ['python', 'javascript']:
-                # For Python and JS, execute code directly
-                cmd = lang_config['command'] + [code]
-            else:
-                # For bash, write to file first
-                with open(temp_file, 'w') as f:
-                    f.write(code)
-                cmd = lang_config['command'] + [code]
+            # Each run gets its own working directory, the only place it can
+            # write, so one snippet can't see or leave files for another
+            work_dir = tempfile.mkdtemp(dir=self.temp_dir)
             
-            # Execute with timeout
-            start_time = time.time()
+            # The code is piped in rather than passed as an argument, so it
+            # isn't copied into argv (visible to anyone reading /proc) or
+            # bound by ARG_MAX
+            start_time = time.perf_counter()
             process = subprocess.Popen(
-                cmd,
+                launcher_command(work_dir) + lang_config['command'],
+                stdin=subprocess.PIPE,
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE,
-                text=True,
-                cwd=self.temp_dir,
-                preexec_fn=os.setsid  # Create new process group for easier termination
+                cwd=work_dir,
+                env=self._sandbox_env(work_dir),
+                start_new_session=True  # Create new process group for easier termination
             )
             
+            # The runtime has started but has no code until stdin is
+            # written, so the limits are in place before any of it runs
             try:
-                stdout, stderr = process.communicate(timeout=timeout)
-                execution_time = time.time() - start_time
-                
-                # Clean up temp file
-                if os.path.exists(temp_file):
-                    os.remove(temp_file)
+                self._limit_resources(process.pid, timeout)
+            except OSError:
+                process.kill()
+                process.communicate()
+                raise
+            
+            try:
+                stdout, stderr, truncated = self._communicate(process, code, timeout)
+                execution_time = time.perf_counter() - start_time
                 
                 return {
                     "success": True,
                     "language": language,
                     "stdout": stdout,
                     "stderr": stderr,
+                    "output_truncated": truncated,
                     "return_code": process.returncode,
                     "execution_time": execution_time,
                     "timeout": timeout
                 }
                 
             except subprocess.TimeoutExpired:
-                # Kill the process group
-                os.killpg(os.getpgid(process.pid), signal.SIGTERM)
-                process.communicate()  # Clean up
+                # Kill the process group. SIGKILL, since a snippet can trap
+                # SIGTERM and would then hold this worker indefinitely.
+                os.killpg(os.getpgid(process.pid), signal.SIGKILL)
+                process.wait()  # Clean up
                 
                 return {
                     "success": False,
@@ -201,70 +263,86 @@ class CodeExecutionService:
                 "language": language
             }
         finally:
-            # Clean up any remaining temp files
-            if 'temp_file' in locals() and os.path.exists(temp_file):
-                try:
-                    os.remove(temp_file)
-                except:
-                    pass
+            if work_dir is not None:
+                shutil.rmtree(work_dir, ignore_errors=True)
     
-    def _check_code_security(self, code: str, language: str) -> Dict[str, Any]:
-        """Basic security checks for code execution"""
-        
-        # Common dangerous patterns
-        dangerous_patterns = [
-            r'\bexec\s*\(',
-            r'\beval\s*\(',
-            r'\b__import__\s*\(',
-            r'\bopen\s*\(',
-            r'\bfile\s*\(',
-            r'\bos\.',
-            r'\bsys\.',
-            r'\bsubprocess\.',
-            r'\bshutil\.',
-            r'\bglob\.',
-            r'\brm\s+-rf',
-            r'\bdel\s+/',
-            r'\bmkdir\s+/',
-            r'\bchmod\s+',
-            r'\bchown\s+',
-            r'\bsu\s+',
-            r'\bsudo\s+',
-            r'\bcurl\s+',
-            r'\bwget\s+',
-            r'\bgit\s+clone',
-            r'\bpip\s+install',
-            r'\bnpm\s+install'
-        ]
-        
-        code_lower = code.lower()
-        
-        for pattern in dangerous_patterns:
-            if re.search(pattern, code_lower):
-                return {
-                    "safe": False,
-                    "reason": f"Potentially dangerous pattern detected: {pattern}"
-                }
-        
-        # Check for network operations
-        network_patterns = [
-            r'\bsocket\.',
-            r'\brequests\.',
-            r'\burllib\.',
-            r'\bhttp\.',
-            r'\bftp\.',
-            r'fetch\s*\(',
-            r'axios\.',
-            r'XMLHttpRequest'
-        ]
+    def _sandbox_env(self, work_dir: str) -> Dict[str, str]:
+        """Environment for a snippet: the basics from ours, with temp files in its working directory"""
+        env = {key: os.environ[key] for key in SANDBOX_ENV_VARS if key in os.environ}
+        env['TMPDIR'] = work_dir
+        return env
+    
+    def _communicate(self, process: subprocess.Popen, code: str, timeout: int) -> Tuple[str, str, bool]:
+        """Like process.communicate(input=code, timeout=timeout), but keeps
+        at most MAX_OUTPUT_BYTES of each stream.
+
+        Once either stream goes past the limit, the process group is killed
+        and the output so far is returned. Returns stdout, stderr and whether
+        the output was cut off. Closes all three pipes.
+        """
+        deadline = time.monotonic() + timeout
+        code_bytes = memoryview(code.encode())
+        written = 0
+        output = {process.stdout: bytearray(), process.stderr: bytearray()}
+        truncated = False
         
-        for pattern in network_patterns:
-            if re.search(pattern, code_lower):
-                return {
-                    "safe": False,
-                    "reason": f"Network operation detected: {pattern}"
-                }
+        try:
+            with selectors.DefaultSelector() as selector:
+                selector.register(process.stdin, selectors.EVENT_WRITE)
+                for stream in output:
+                    selector.register(stream, selectors.EVENT_READ)
+                
+                while selector.get_map() and not truncated:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise subprocess.TimeoutExpired(process.args, timeout)
+                    
+                    for key, _ in selector.select(remaining):
+                        if key.fileobj is process.stdin:
+                            try:
+                                written += os.write(key.fd, code_bytes[written:written + select.PIPE_BUF])
+                            except BrokenPipeError:
+                                written = len(code_bytes)  # Exited without reading all of it
+                            if written >= len(code_bytes):
+                                selector.unregister(process.stdin)
+                                process.stdin.close()
+                            continue
+                        
+                        data = os.read(key.fd, 32768)
+                        if not data:
+                            selector.unregister(key.fileobj)
+                            continue
+                        buffer = output[key.fileobj]
+                        buffer += data
+                        if len(buffer) > MAX_OUTPUT_BYTES:
+                            del buffer[MAX_OUTPUT_BYTES:]
+                            truncated = True
+            
+            if truncated:
+                os.killpg(os.getpgid(process.pid), signal.SIGKILL)
+            process.wait()
+        finally:
+            for stream in (process.stdin, process.stdout, process.stderr):
+                stream.close()
         
+        stdout, stderr = (bytes(buffer).decode(errors='replace') for buffer in output.values())
+        return stdout, stderr, truncated
+    
+    def _limit_resources(self, pid: int, timeout: int):
+        """Cap the CPU time, memory and file sizes of a running snippet"""
+        if not RESOURCE_LIMITS_AVAILABLE:
+            return
+        prlimit(pid, RLIMIT_CPU, (timeout, timeout + 1))
+        prlimit(pid, RLIMIT_DATA, (MEMORY_LIMIT_BYTES, MEMORY_LIMIT_BYTES))
+        prlimit(pid, RLIMIT_FSIZE, (FILE_SIZE_LIMIT_BYTES, FILE_SIZE_LIMIT_BYTES))
+        prlimit(pid, RLIMIT_CORE, (0, 0))
+    
+    def _check_code_security(self, code: str, language: str) -> Dict[str, Any]:
+        """Checks on the code before it is run.
+
+        What the code may do once running is enforced by the sandbox, so
+        only the size is checked here.
+        """
         # Length check
         if len(code) > 10000:  # 10KB limit
             return {
@@ -285,9 +363,33 @@ class CodeExecutionService:
             "command": config['command'],
             "file_extension": config['file_extension'],
             "timeout": config['timeout'],
-            "available": self._check_language_availability(language)
+            "available": self.get_language_availability()[language]
         }
     
+    def _availability_is_stale(self) -> bool:
+        return (not self._availability_cache
+                or time.monotonic() - self._last_availability_check >= self._availability_check_interval)
+    
+    def get_language_availability(self) -> Dict[str, bool]:
+        """Availability of each language runtime, from cache if checked recently"""
+        if self._availability_is_stale():
+            self._availability_cache = {
+                lang: self._check_language_availability(lang) for lang in self.supported_languages
+            }
+            self._last_availability_check = time.monotonic()
+        return self._availability_cache
+    
+    async def refresh_language_availability(self) -> Dict[str, bool]:
+        """Refresh the availability cache if stale, probing all runtimes in parallel off the event loop"""
+        if self._availability_is_stale():
+            languages = list(self.supported_languages)
+            results = await asyncio.gather(
+                *(asyncio.to_thread(self._check_language_availability, lang) for lang in languages)
+            )
+            self._availability_cache = dict(zip(languages, results))
+            self._last_availability_check = time.monotonic()
+        return self._availability_cache
+    
     def _check_language_availability(self, language: str) -> bool:
         """Check if a language runtime is available"""
         config = self.supported_languages[language]
@@ -304,21 +406,21 @@ class CodeExecutionService:
     
     def get_service_status(self) -> Dict[str, Any]:
         """Get code execution service status"""
-        languages_status = {}
-        for lang in self.supported_languages:
-            languages_status[lang] = self._check_language_availability(lang)
-        
         return {
-            "available": True,
+            "available": self.sandbox_unavailable_reason is None,
+            "sandbox_unavailable_reason": self.sandbox_unavailable_reason,
             "supported_languages": list(self.supported_languages.keys()),
-            "language_availability": languages_status,
+            "language_availability": dict(self.get_language_availability()),
+            "max_concurrent_executions": self.max_workers,
             "temp_directory": self.temp_dir,
             "security_features": [
-                "pattern_filtering",
                 "timeout_protection",
                 "process_isolation",
-                "file_system_restrictions"
-            ]
+                "file_system_restrictions",
+                "network_restrictions",
+                "syscall_filtering",
+                "output_limits"
+            ] + (["resource_limits"] if RESOURCE_LIMITS_AVAILABLE else [])
         }
     
     def cleanup(self):
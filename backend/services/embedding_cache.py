@@ -0,0 +1,112 @@
+from typing import Optional
+from collections import OrderedDict
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+class EmbeddingCache:
+    """LRU cache of text embeddings, optionally persisted to SQLite.
+
+    Entries are keyed on the SHA-256 of the embedding model name and the text,
+    and stored as float32 vectors. With a `path`, every entry is also written
+    to a SQLite table so embeddings survive restarts; the most recent entries
+    are loaded into memory on startup and older ones are read on demand.
+    Safe to use from worker threads.
+    """
+
+    def __init__(self, path: Optional[str] = None, maxsize: int = 4096, model: str = "default"):
+        self.path = path
+        self.maxsize = maxsize
+        self.model = model
+        self._memory: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            self._open(path)
+
+    def _open(self, path: str):
+        try:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS embeddings (key BLOB PRIMARY KEY, vec BLOB NOT NULL)")
+            self._db.commit()
+
+            # Load the hot set: the most recently written entries
+            rows = self._db.execute(
+                "SELECT key, vec FROM embeddings ORDER BY rowid DESC LIMIT ?", (self.maxsize,)
+            ).fetchall()
+            for key, vec in reversed(rows):
+                self._memory[key] = np.frombuffer(vec, dtype=np.float32)
+            logger.info(f"Loaded {len(rows)} cached embeddings from {path}")
+        except sqlite3.Error as e:
+            logger.warning(f"Embedding cache persistence disabled, cannot open {path}: {e}")
+            self._db = None
+
+    def _key(self, text: str) -> bytes:
+        return hashlib.sha256(f"{self.model}\0{text}".encode()).digest()
+
+    def _remember(self, key: bytes, vector: np.ndarray):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        if len(self._memory) > self.maxsize:
+            self._memory.popitem(last=False)
+
+    def get(self, text: str, memory_only: bool = False) -> Optional[np.ndarray]:
+        """Return the cached embedding for the text, or None on a miss.
+
+        With `memory_only`, SQLite isn't consulted, so the call never blocks
+        on disk.
+        """
+        key = self._key(text)
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                return vector
+            if memory_only or self._db is None:
+                return None
+            try:
+                row = self._db.execute("SELECT vec FROM embeddings WHERE key = ?", (key,)).fetchone()
+            except sqlite3.Error as e:
+                logger.warning(f"Embedding cache read failed: {e}")
+                return None
+            if row is None:
+                return None
+            vector = np.frombuffer(row[0], dtype=np.float32)
+            self._remember(key, vector)
+            return vector
+
+    def put(self, text: str, embedding) -> np.ndarray:
+        """Cache an embedding for the text and return it as a float32 vector"""
+        key = self._key(text)
+        vector = np.asarray(embedding, dtype=np.float32).ravel()
+        with self._lock:
+            self._remember(key, vector)
+            if self._db is not None:
+                try:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO embeddings (key, vec) VALUES (?, ?)", (key, vector.tobytes())
+                    )
+                    self._db.commit()
+                except sqlite3.Error as e:
+                    logger.warning(f"Embedding cache write failed: {e}")
+        return vector
+
+    def close(self):
+        """Close the SQLite connection"""
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def __len__(self) -> int:
+        return len(self._memory)
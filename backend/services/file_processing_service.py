@@ -1,12 +1,27 @@
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Iterator, BinaryIO
+from itertools import islice
 import os
 import tempfile
 import mimetypes
-from pathlib import Path
+import asyncio
 import logging
+import uuid
+from utils.background import spawn
+from utils.ids import new_ids
 
 logger = logging.getLogger(__name__)
 
+# Size of the chunks streamed from an upload to disk
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# Characters per stored text chunk (roughly 1000 tokens)
+TEXT_CHUNK_SIZE = 4000
+# Number of chunks embedded and stored per ChromaDB call
+EMBEDDING_BATCH_SIZE = 64
+# File types whose text can be read directly
+TEXT_FILE_TYPES = frozenset({
+    'text/plain', 'text/markdown', 'text/html', 'text/css', 'application/json', 'application/xml', 'text/csv'
+})
+
 class FileProcessingService:
     def __init__(self, chromadb_service=None):
         """Initialize file processing service"""
@@ -24,73 +39,152 @@ class FileProcessingService:
             '.csv': 'text/csv'
         }
         
+        # The supported extensions never change, so build the list once
+        self._supported_extensions = tuple(self.supported_types)
+        
         # Create upload directory
         self.upload_dir = os.path.join(os.getcwd(), "uploads")
         os.makedirs(self.upload_dir, exist_ok=True)
     
     def get_file_type(self, filename: str) -> str:
         """Determine file type from filename"""
-        file_ext = Path(filename).suffix.lower()
-        return self.supported_types.get(file_ext, 'unknown')
+        return self.supported_types.get(self._file_extension(filename), 'unknown')
+    
+    @staticmethod
+    def _file_extension(filename: str) -> str:
+        """Lower-cased extension of a filename, including the dot"""
+        return os.path.splitext(filename)[1].lower()
     
     async def process_uploaded_file(self, file_content: bytes, filename: str, metadata: Dict[str, Any] = None) -> Dict[str, Any]:
         """Process uploaded file and extract content"""
+        file_type = self.get_file_type(filename)
+        if file_type == 'unknown':
+            return self._unsupported_type_result(filename)
+        
         try:
-            file_type = self.get_file_type(filename)
-            
-            if file_type == 'unknown':
-                return {
-                    "success": False,
-                    "error": f"Unsupported file type: {Path(filename).suffix}",
-                    "supported_types": list(self.supported_types.keys())
-                }
-            
             # Save file temporarily
-            file_path = os.path.join(self.upload_dir, filename)
-            with open(file_path, 'wb') as f:
-                f.write(file_content)
-            
-            # Extract text content
-            extracted_content = await self._extract_text_content(file_path, file_type)
-            
-            if not extracted_content:
-                return {
-                    "success": False,
-                    "error": "Could not extract text content from file"
-                }
-            
+            file_path = self._temporary_path(filename)
+            await asyncio.to_thread(self._write_file, file_path, file_content)
+        except Exception as e:
+            logger.error(f"Error processing file {filename}: {e}")
+            return {
+                "success": False,
+                "error": str(e),
+                "filename": filename
+            }
+        
+        return await self._process_saved_file(file_path, filename, file_type, len(file_content), metadata)
+    
+    async def process_upload(self, upload, metadata: Dict[str, Any] = None) -> Dict[str, Any]:
+        """Process a streamed upload (e.g. a FastAPI UploadFile) without reading it into memory"""
+        filename = upload.filename
+        file_type = self.get_file_type(filename)
+        if file_type == 'unknown':
+            return self._unsupported_type_result(filename)
+        
+        file_path = self._temporary_path(filename)
+        size = 0
+        try:
+            source = getattr(upload, "file", None)
+            if source is not None:
+                # Starlette has already spooled the body to a file, so the
+                # whole copy runs in one worker thread instead of two thread
+                # hops (read, then write) per chunk
+                size = await asyncio.to_thread(self._copy_file, source, file_path)
+            else:
+                # Copy the upload to disk chunk by chunk, doing the writes in a
+                # worker thread so the event loop stays free for other requests
+                f = await asyncio.to_thread(open, file_path, 'wb')
+                try:
+                    while chunk := await upload.read(UPLOAD_CHUNK_SIZE):
+                        await asyncio.to_thread(f.write, chunk)
+                        size += len(chunk)
+                finally:
+                    await asyncio.to_thread(f.close)
+        except Exception as e:
+            logger.error(f"Error processing file {filename}: {e}")
+            await asyncio.to_thread(self._remove_file, file_path)
+            return {
+                "success": False,
+                "error": str(e),
+                "filename": filename
+            }
+        
+        return await self._process_saved_file(file_path, filename, file_type, size, metadata)
+    
+    async def _process_saved_file(self, file_path: str, filename: str, file_type: str, size: int, metadata: Dict[str, Any] = None) -> Dict[str, Any]:
+        """Extract the content of an upload that has been saved to disk and store it in chunks"""
+        try:
             # Prepare metadata
             file_metadata = {
                 "filename": filename,
                 "file_type": file_type,
-                "size_bytes": len(file_content),
+                "size_bytes": size,
                 "source": "file_upload",
                 **(metadata or {})
             }
             
-            # Store in ChromaDB if available
+            # Chunks of one file share a document id, so they can be found together
             document_id = None
-            if self.chromadb_service and self.chromadb_service.is_available():
+            if self.chromadb_service and await self.chromadb_service.check_available():
+                document_id = new_ids(1)[0]
+            
+            content_length = 0
+            chunk_count = 0
+            chunks = self._iter_text_chunks(file_path, file_type)
+            # Bounded, so reading can't run far ahead of storing
+            batches = asyncio.Queue(maxsize=2)
+            
+            async def read_batches():
                 try:
-                    document_id = self.chromadb_service.add_document(extracted_content, file_metadata)
-                except Exception as e:
-                    logger.warning(f"Could not store file in ChromaDB: {e}")
+                    # Read batches of chunks off the event loop, so only a
+                    # few batches of the file's text are in memory at a time
+                    while batch := await asyncio.to_thread(list, islice(chunks, EMBEDDING_BATCH_SIZE)):
+                        await batches.put(batch)
+                finally:
+                    await batches.put(None)
             
-            # Clean up temporary file
+            async def store_batches():
+                nonlocal document_id, content_length, chunk_count
+                while (batch := await batches.get()) is not None:
+                    if document_id is not None:
+                        try:
+                            await self.chromadb_service.add_documents_batch(
+                                batch,
+                                [{**file_metadata, "document_id": document_id, "chunk_index": chunk_count + i}
+                                 for i in range(len(batch))],
+                                ids=[f"{document_id}_{chunk_count + i}" for i in range(len(batch))]
+                            )
+                        except Exception as e:
+                            logger.warning(f"Could not store file in ChromaDB: {e}")
+                            document_id = None
+                    
+                    content_length += sum(len(chunk) for chunk in batch)
+                    chunk_count += len(batch)
+            
+            # Extract the next batch while the previous one is being embedded and stored
             try:
-                os.remove(file_path)
-            except Exception as e:
-                logger.warning(f"Could not remove temporary file: {e}")
+                async with asyncio.TaskGroup() as tg:
+                    tg.create_task(read_batches())
+                    tg.create_task(store_batches())
+            except ExceptionGroup as group:
+                raise group.exceptions[0]
+            
+            if not content_length:
+                return {
+                    "success": False,
+                    "error": "Could not extract text content from file"
+                }
             
             return {
                 "success": True,
                 "filename": filename,
                 "file_type": file_type,
-                "content": extracted_content,
                 "metadata": file_metadata,
                 "document_id": document_id,
                 "stored_in_knowledge_base": document_id is not None,
-                "content_length": len(extracted_content)
+                "content_length": content_length,
+                "chunk_count": chunk_count
             }
             
         except Exception as e:
@@ -100,40 +194,88 @@ class FileProcessingService:
                 "error": str(e),
                 "filename": filename
             }
+        finally:
+            # Clean up temporary file without holding up the response
+            spawn(asyncio.to_thread(self._remove_file, file_path))
+    
+    def _unsupported_type_result(self, filename: str) -> Dict[str, Any]:
+        return {
+            "success": False,
+            "error": f"Unsupported file type: {os.path.splitext(filename)[1]}",
+            "supported_types": list(self._supported_extensions)
+        }
     
-    async def _extract_text_content(self, file_path: str, file_type: str) -> Optional[str]:
-        """Extract text content from file based on type"""
+    def _temporary_path(self, filename: str) -> str:
+        """Unique path in the upload directory, so concurrent uploads of the same name don't collide"""
+        return os.path.join(self.upload_dir, f"{uuid.uuid4().hex}_{os.path.basename(filename)}")
+    
+    @staticmethod
+    def _write_file(file_path: str, content: bytes):
+        with open(file_path, 'wb') as f:
+            f.write(content)
+    
+    @staticmethod
+    def _copy_file(source: BinaryIO, file_path: str) -> int:
+        """Copy a file object to disk a chunk at a time and return the number of bytes written"""
+        size = 0
+        with open(file_path, 'wb') as f:
+            while chunk := source.read(UPLOAD_CHUNK_SIZE):
+                f.write(chunk)
+                size += len(chunk)
+        return size
+    
+    @staticmethod
+    def _remove_file(file_path: str):
         try:
-            if file_type in ['text/plain', 'text/markdown', 'text/html', 'text/css', 'application/json', 'application/xml', 'text/csv']:
-                # For text-based files, read directly
-                with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                    return f.read()
-            
+            os.remove(file_path)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"Could not remove temporary file: {e}")
+    
+    def _iter_text_chunks(self, file_path: str, file_type: str) -> Iterator[str]:
+        """Yield the text content of a file in chunks of about TEXT_CHUNK_SIZE characters.
+
+        Chunks are broken at whitespace where possible so words aren't split.
+        """
+        if file_type not in TEXT_FILE_TYPES:
             # For other types, we'll need specialized parsers
             # This is a placeholder - real implementation would use libraries like:
             # - PyPDF2 for PDF files
             # - python-docx for DOCX files
             # - openpyxl for Excel files
-            
-            return None
-            
-        except Exception as e:
-            logger.error(f"Error extracting content from {file_path}: {e}")
-            return None
+            return
+        
+        # For text-based files, read directly
+        with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
+            pending = ""
+            while True:
+                data = f.read(TEXT_CHUNK_SIZE)
+                if not data:
+                    break
+                pending += data
+                while len(pending) >= TEXT_CHUNK_SIZE:
+                    cut = max(pending.rfind(" ", 0, TEXT_CHUNK_SIZE), pending.rfind("\n", 0, TEXT_CHUNK_SIZE))
+                    if cut <= 0:
+                        cut = TEXT_CHUNK_SIZE
+                    yield pending[:cut]
+                    pending = pending[cut:]
+            if pending:
+                yield pending
     
     def get_supported_file_types(self) -> List[str]:
         """Get list of supported file types"""
-        return list(self.supported_types.keys())
+        return list(self._supported_extensions)
     
     def validate_file(self, filename: str, max_size_mb: int = 10) -> Dict[str, Any]:
         """Validate file before processing"""
-        file_ext = Path(filename).suffix.lower()
+        file_ext = self._file_extension(filename)
         
         if file_ext not in self.supported_types:
             return {
                 "valid": False,
                 "error": f"Unsupported file type: {file_ext}",
-                "supported_types": list(self.supported_types.keys())
+                "supported_types": list(self._supported_extensions)
             }
         
         return {
@@ -144,12 +286,12 @@ class FileProcessingService:
     
     async def search_uploaded_files(self, query: str, limit: int = 5) -> List[Dict[str, Any]]:
         """Search through uploaded files using ChromaDB"""
-        if not self.chromadb_service or not self.chromadb_service.is_available():
+        if not self.chromadb_service or not await self.chromadb_service.check_available():
             return []
         
         try:
             # Search for documents with file metadata
-            results = self.chromadb_service.search_documents(query, limit)
+            results = await self.chromadb_service.search_documents(query, limit)
             
             # Filter for file uploads
             file_results = []
@@ -175,7 +317,7 @@ class FileProcessingService:
         """Get file processing service status"""
         return {
             "available": True,
-            "supported_file_types": list(self.supported_types.keys()),
+            "supported_file_types": list(self._supported_extensions),
             "upload_directory": self.upload_dir,
             "chromadb_integration": self.chromadb_service is not None and self.chromadb_service.is_available(),
             "features": {
@@ -0,0 +1,74 @@
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+import asyncio
+import logging
+from utils.background import spawn
+from utils.ids import new_ids
+
+logger = logging.getLogger(__name__)
+
+class KnowledgeWriter:
+    """Write-behind queue for knowledge base documents.
+
+    Documents are given their ids as soon as they are submitted and written
+    in the background. Documents submitted within `max_wait_seconds` of each
+    other (or until `max_batch_size` are waiting) are stored together with a
+    single `write_fn(contents, metadatas, ids)` call, so they are also
+    embedded in one pass.
+    """
+
+    def __init__(self, write_fn: Callable[[List[str], List[Dict[str, Any]], List[str]], Awaitable[Any]],
+                 max_batch_size: int = 64, max_wait_seconds: float = 0.05):
+        self.write_fn = write_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait_seconds = max_wait_seconds
+        self.failed_writes = 0
+        self._in_flight = 0
+        self._pending: List[Tuple[str, str, Dict[str, Any]]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._writes: List[asyncio.Task] = []
+
+    def submit(self, contents: List[str], metadatas: List[Dict[str, Any]]) -> List[str]:
+        """Queue documents for writing and return their ids"""
+        doc_ids = new_ids(len(contents))
+        self._pending.extend(zip(doc_ids, contents, metadatas))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(self.max_wait_seconds, self._flush)
+        return doc_ids
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        while self._pending:
+            batch = self._pending[:self.max_batch_size]
+            self._pending = self._pending[self.max_batch_size:]
+            self._in_flight += len(batch)
+            task = spawn(self._run(batch), name="knowledge-write")
+            self._writes.append(task)
+            task.add_done_callback(self._writes.remove)
+
+    async def _run(self, batch: List[Tuple[str, str, Dict[str, Any]]]):
+        doc_ids = [doc_id for doc_id, _, _ in batch]
+        try:
+            await self.write_fn([content for _, content, _ in batch],
+                                [metadata for _, _, metadata in batch],
+                                doc_ids)
+            logger.debug(f"Wrote {len(batch)} queued documents")
+        except Exception as e:
+            self.failed_writes += len(batch)
+            logger.error(f"Failed to write {len(batch)} queued documents ({', '.join(doc_ids)}): {e}")
+        finally:
+            self._in_flight -= len(batch)
+
+    @property
+    def pending(self) -> int:
+        """Number of documents accepted but not yet written"""
+        return len(self._pending) + self._in_flight
+
+    async def flush(self):
+        """Write everything queued so far and wait for it to be stored"""
+        self._flush()
+        if self._writes:
+            await asyncio.gather(*self._writes, return_exceptions=True)
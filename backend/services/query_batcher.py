@@ -0,0 +1,73 @@
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from concurrent.futures import Executor
+import asyncio
+import logging
+from utils.background import spawn
+
+logger = logging.getLogger(__name__)
+
+# Per-query fields of a ChromaDB query result
+RESULT_FIELDS = ("ids", "documents", "metadatas", "distances")
+
+class QueryBatcher:
+    """Coalesces concurrent vector queries into one multi-vector query.
+
+    Queries (embeddings, or texts for ChromaDB to embed) submitted within
+    `max_wait_seconds` of each other (or until `max_batch_size` are
+    waiting) are sent together as a single `query_fn(queries, n_results)`
+    call, run in `executor` (by default, the event loop's default
+    executor). Each caller gets back a result in the shape of a
+    single-query ChromaDB result, trimmed to the number of results it
+    asked for.
+    """
+
+    def __init__(self, query_fn: Callable[[List[Any], int], Dict[str, Any]],
+                 max_batch_size: int = 16, max_wait_seconds: float = 0.005,
+                 executor: Optional[Executor] = None):
+        self.query_fn = query_fn
+        self.executor = executor
+        self.max_batch_size = max_batch_size
+        self.max_wait_seconds = max_wait_seconds
+        self._pending: List[Tuple[Any, int, asyncio.Future]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+
+    async def submit(self, query, n_results: int) -> Dict[str, Any]:
+        """Queue a query and wait for its results"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((query, n_results, future))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.max_wait_seconds, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if batch:
+            spawn(self._run(batch), name="vector-query-batch")
+
+    async def _run(self, batch: List[Tuple[Any, int, asyncio.Future]]):
+        queries = [query for query, _, _ in batch]
+        n_results = max(k for _, k, _ in batch)
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(
+                self.executor, self.query_fn, queries, n_results
+            )
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        logger.debug(f"Ran {len(batch)} vector queries in one call")
+        for i, (_, k, future) in enumerate(batch):
+            if future.done():  # The caller gave up waiting
+                continue
+            future.set_result({
+                field: [results[field][i][:k]] if results.get(field) else None
+                for field in RESULT_FIELDS
+            })
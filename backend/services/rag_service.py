@@ -1,5 +1,8 @@
 from typing import List, Dict, Any, Optional
+from collections import OrderedDict
 from services.chromadb_service import ChromaDBService
+from services.semantic_cache import SemanticCache
+import asyncio
 import logging
 
 logger = logging.getLogger(__name__)
@@ -9,11 +12,71 @@ class RAGService:
         """Initialize RAG service with ChromaDB"""
         self.chromadb_service = chromadb_service
         self.max_context_length = 4000  # Maximum characters for context
+        # Maximum distances for retrieved context to be considered relevant
+        self.document_distance_threshold = 0.7
+        self.conversation_distance_threshold = 0.8
+        # Per-conversation caches of knowledge base search results, so
+        # follow-up questions on the same topic skip the vector search
+        self.max_cached_conversations = 64
+        self._semantic_caches: "OrderedDict[str, SemanticCache]" = OrderedDict()
+        self._cached_knowledge_version = None
+    
+    def _get_semantic_cache(self, conversation_id: str) -> SemanticCache:
+        """Get the semantic cache for a conversation, evicting the least recently used one if needed"""
+        # Cached results are stale once the knowledge base has changed
+        knowledge_version = getattr(self.chromadb_service, "knowledge_version", None)
+        if knowledge_version != self._cached_knowledge_version:
+            self._semantic_caches.clear()
+            self._cached_knowledge_version = knowledge_version
         
-    def augment_prompt(self, user_message: str, conversation_history: List[Dict[str, Any]] = None) -> Dict[str, Any]:
-        """Augment user prompt with relevant context from knowledge base"""
+        cache = self._semantic_caches.get(conversation_id)
+        if cache is None:
+            cache = SemanticCache()
+            self._semantic_caches[conversation_id] = cache
+            if len(self._semantic_caches) > self.max_cached_conversations:
+                self._semantic_caches.popitem(last=False)
+        else:
+            self._semantic_caches.move_to_end(conversation_id)
+        return cache
+    
+    async def _search_documents(self, user_message: str, embedding, conversation_id: Optional[str],
+                                limit: int) -> List[Dict[str, Any]]:
+        """Search the knowledge base, serving repeated or near-identical queries from the semantic cache"""
+        if conversation_id is None or embedding is None:
+            return await self.chromadb_service.search_documents(
+                user_message, limit=limit, distance_threshold=self.document_distance_threshold,
+                query_embedding=embedding)
         
-        if not self.chromadb_service.is_available():
+        cache = self._get_semantic_cache(conversation_id)
+        cached = cache.lookup(embedding)
+        if cached is not None:
+            return cached
+        
+        documents = await self.chromadb_service.search_documents(
+            user_message, limit=limit, distance_threshold=self.document_distance_threshold, query_embedding=embedding)
+        cache.insert(embedding, documents)
+        return documents
+        
+    async def _search_conversations(self, user_message: str, embedding, limit: int) -> List[Dict[str, Any]]:
+        """Search earlier conversations for context"""
+        return await self.chromadb_service.search_conversations(
+            user_message, limit=limit, distance_threshold=self.conversation_distance_threshold,
+            query_embedding=embedding)
+    
+    async def _no_results(self) -> List[Dict[str, Any]]:
+        return []
+        
+    async def augment_prompt(self, user_message: str, conversation_history: List[Dict[str, Any]] = None,
+                             conversation_id: Optional[str] = None, query_embedding=None) -> Dict[str, Any]:
+        """Augment user prompt with relevant context from knowledge base.
+
+        If the message has already been embedded, pass `query_embedding`; it
+        is used for both the knowledge and the conversation search.
+        """
+        
+        # A due connection check (and any reconnect, with its retry backoff)
+        # runs in a worker thread rather than blocking the event loop
+        if not await self.chromadb_service.check_available():
             return {
                 "augmented_prompt": user_message,
                 "context_used": [],
@@ -22,24 +85,25 @@ class RAGService:
             }
         
         try:
-            # Search for relevant documents
-            relevant_docs = self.chromadb_service.search_documents(user_message, limit=5)
+            # Embed the message once for both searches
+            if query_embedding is None:
+                query_embedding = await self.chromadb_service.embed_query(user_message)
             
-            # Search conversation history for context
-            conversation_context = []
-            if conversation_history:
-                conversation_context = self.chromadb_service.search_conversations(user_message, limit=3)
-            
-            # Filter and rank results by relevance (distance threshold)
-            filtered_docs = [doc for doc in relevant_docs if doc['distance'] < 0.7]
-            filtered_conversations = [conv for conv in conversation_context if conv['distance'] < 0.8]
+            # Search for relevant documents and conversation history together.
+            # Results come back filtered by distance and sorted by relevance,
+            # so only as many as will be used are requested
+            relevant_docs, conversation_context = await asyncio.gather(
+                self._search_documents(user_message, query_embedding, conversation_id, limit=3),
+                self._search_conversations(user_message, query_embedding, limit=2)
+                if conversation_history else self._no_results()
+            )
             
             # Prepare context
             context_parts = []
             sources = []
             
             # Add document context
-            for doc in filtered_docs[:3]:  # Limit to top 3 documents
+            for doc in relevant_docs:  # Top 3 documents
                 context_parts.append(f"Knowledge: {doc['content'][:500]}...")  # Truncate long content
                 sources.append({
                     "type": "knowledge",
@@ -49,7 +113,7 @@ class RAGService:
                 })
             
             # Add conversation context
-            for conv in filtered_conversations[:2]:  # Limit to top 2 conversations
+            for conv in conversation_context:  # Top 2 conversations
                 context_parts.append(f"Previous conversation: {conv['content'][:300]}...")
                 sources.append({
                     "type": "conversation",
@@ -65,20 +129,10 @@ class RAGService:
             if len(context_text) > self.max_context_length:
                 context_text = context_text[:self.max_context_length] + "..."
             
-            # Create augmented prompt
-            if context_text:
-                augmented_prompt = f"""Context Information:
-{context_text}
-
-User Question: {user_message}
-
-Please answer the user's question using the provided context when relevant. If the context doesn't contain relevant information, answer based on your general knowledge."""
-            else:
-                augmented_prompt = user_message
-            
             return {
-                "augmented_prompt": augmented_prompt,
+                "augmented_prompt": self.format_prompt(user_message, context_text),
                 "context_used": context_parts,
+                "context_text": context_text,
                 "sources": sources,
                 "rag_available": True,
                 "context_length": len(context_text)
@@ -94,6 +148,18 @@ Please answer the user's question using the provided context when relevant. If t
                 "error": str(e)
             }
     
+    def format_prompt(self, user_message: str, context_text: str) -> str:
+        """Build the augmented prompt from a user message and retrieved context"""
+        if not context_text:
+            return user_message
+        
+        return f"""Context Information:
+{context_text}
+
+User Question: {user_message}
+
+Please answer the user's question using the provided context when relevant. If the context doesn't contain relevant information, answer based on your general knowledge."""
+    
     def evaluate_context_relevance(self, query: str, context: str) -> float:
         """Evaluate how relevant context is to the query (placeholder for more sophisticated scoring)"""
         # Simple keyword overlap scoring
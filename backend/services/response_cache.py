@@ -0,0 +1,84 @@
+from typing import Any, Dict, List, Optional
+from collections import OrderedDict
+from cachetools import TTLCache
+from services.semantic_cache import SemanticCache
+import hashlib
+import orjson
+
+class ResponseCache:
+    """Cache of chat completions for repeated questions.
+
+    Two tiers are checked in order: an exact match on the normalized question,
+    then a semantic match on the question's embedding. Both are scoped to a
+    context key covering the model, the request options and the conversation
+    history before the question, so an answer is only reused for the same
+    conversation state. All entries are dropped when the knowledge base
+    changes, since answers may depend on retrieved documents.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl_seconds: float = 3600.0,
+                 semantic_threshold: float = 0.95, max_contexts: int = 64):
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self.semantic_threshold = semantic_threshold
+        self.max_contexts = max_contexts
+        self._exact = TTLCache(maxsize=maxsize, ttl=ttl_seconds)
+        self._semantic: "OrderedDict[str, SemanticCache]" = OrderedDict()
+        self._knowledge_version = None
+
+    @staticmethod
+    def context_key(model: str, history: List[Dict[str, Any]], **options) -> str:
+        """Hash of everything other than the question that the answer depends on"""
+        payload = {
+            "model": model,
+            "options": options,
+            "history": [(m.get("role"), m.get("content")) for m in history]
+        }
+        return hashlib.sha256(orjson.dumps(payload, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+    @staticmethod
+    def _normalize(question: str) -> str:
+        return " ".join(question.split()).casefold()
+
+    def _exact_key(self, context_key: str, question: str) -> str:
+        return hashlib.sha256(f"{context_key}\0{self._normalize(question)}".encode()).hexdigest()
+
+    def _check_version(self, knowledge_version):
+        if knowledge_version != self._knowledge_version:
+            self.clear()
+            self._knowledge_version = knowledge_version
+
+    def _semantic_cache(self, context_key: str, create: bool) -> Optional[SemanticCache]:
+        cache = self._semantic.get(context_key)
+        if cache is not None:
+            self._semantic.move_to_end(context_key)
+        elif create:
+            cache = SemanticCache(threshold=self.semantic_threshold, ttl_seconds=self.ttl_seconds)
+            self._semantic[context_key] = cache
+            if len(self._semantic) > self.max_contexts:
+                self._semantic.popitem(last=False)
+        return cache
+
+    def get_exact(self, context_key: str, question: str, knowledge_version=None) -> Optional[Dict[str, Any]]:
+        """Return the cached response for the same question, or None on a miss"""
+        self._check_version(knowledge_version)
+        return self._exact.get(self._exact_key(context_key, question))
+
+    def get_similar(self, context_key: str, embedding, knowledge_version=None) -> Optional[Dict[str, Any]]:
+        """Return the cached response for a question with a similar embedding, or None on a miss"""
+        self._check_version(knowledge_version)
+        cache = self._semantic_cache(context_key, create=False)
+        return cache.lookup(embedding) if cache is not None else None
+
+    def put(self, context_key: str, question: str, response: Dict[str, Any], embedding=None, knowledge_version=None):
+        """Cache a response for the question"""
+        self._check_version(knowledge_version)
+
+        self._exact[self._exact_key(context_key, question)] = response
+        if embedding is not None:
+            self._semantic_cache(context_key, create=True).insert(embedding, response)
+
+    def clear(self):
+        """Drop all cached responses"""
+        self._exact.clear()
+        self._semantic.clear()
@@ -0,0 +1,84 @@
+from typing import Any, Optional
+import time
+import numpy as np
+
+class SemanticCache:
+    """Small cache of retrieval results keyed on query embedding similarity.
+
+    Embeddings are stored L2-normalized in a single matrix, so a lookup is one
+    vectorized dot product against all cached queries. A hit is any cached
+    query whose cosine similarity with the new one is at least `threshold`.
+    When full, the least recently used entry is replaced.
+    """
+
+    def __init__(self, capacity: int = 256, threshold: float = 0.92, ttl_seconds: float = 300.0):
+        self.capacity = capacity
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self._embeddings = None  # (capacity, dim) matrix, allocated on first insert
+        self._values = [None] * capacity
+        self._inserted_at = np.zeros(capacity)
+        self._last_used = np.zeros(capacity)
+        self._size = 0
+        self._clock = 0
+
+    @staticmethod
+    def _normalize(embedding) -> Optional[np.ndarray]:
+        vector = np.asarray(embedding, dtype=np.float32).ravel()
+        norm = np.linalg.norm(vector)
+        if norm == 0:
+            return None
+        return vector / norm
+
+    def _tick(self) -> int:
+        self._clock += 1
+        return self._clock
+
+    def lookup(self, embedding) -> Optional[Any]:
+        """Return the cached value for the most similar query, or None on a miss"""
+        if self._size == 0:
+            return None
+        query = self._normalize(embedding)
+        if query is None or query.shape[0] != self._embeddings.shape[1]:
+            return None
+
+        similarities = self._embeddings[:self._size] @ query
+        # Expired entries never match
+        expired = time.monotonic() - self._inserted_at[:self._size] > self.ttl_seconds
+        similarities[expired] = -1.0
+
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.threshold:
+            return None
+        self._last_used[best] = self._tick()
+        return self._values[best]
+
+    def insert(self, embedding, value: Any):
+        """Cache a value under the given query embedding"""
+        vector = self._normalize(embedding)
+        if vector is None:
+            return
+        if self._embeddings is None or self._embeddings.shape[1] != vector.shape[0]:
+            # First insert, or the embedding model changed
+            self._embeddings = np.zeros((self.capacity, vector.shape[0]), dtype=np.float32)
+            self.clear()
+
+        if self._size < self.capacity:
+            slot = self._size
+            self._size += 1
+        else:
+            slot = int(np.argmin(self._last_used))
+
+        self._embeddings[slot] = vector
+        self._values[slot] = value
+        self._inserted_at[slot] = time.monotonic()
+        self._last_used[slot] = self._tick()
+
+    def clear(self):
+        """Drop all cached entries"""
+        self._values = [None] * self.capacity
+        self._last_used[:] = 0
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
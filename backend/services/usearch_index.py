@@ -0,0 +1,74 @@
+from typing import Any, Dict, List, Tuple
+import numpy as np
+
+try:
+    from usearch.index import Index, MetricKind, ScalarKind
+    USEARCH_AVAILABLE = True
+except ImportError:  # Optional; without it large collections are searched through ChromaDB
+    USEARCH_AVAILABLE = False
+
+class USearchIndex:
+    """In-memory HNSW index of a collection's embeddings, backed by USearch.
+
+    Used in place of VectorIndex for collections too large to scan in full.
+    USearch computes distances with SIMD kernels for the host CPU, so a
+    search is faster than a round trip to the ChromaDB server. It has the
+    same interface as VectorIndex, and distances are also squared L2, so
+    distance thresholds tuned against ChromaDB results still apply.
+    Requires the optional `usearch` package.
+
+    With `quantize`, embeddings are stored as float16, half the memory.
+    USearch's int8 storage is only meant for cosine distance, and throws
+    squared L2 distances far off, so it isn't used.
+    """
+
+    def __init__(self, quantize: bool = False, connectivity: int = 24, expansion_add: int = 128,
+                 expansion_search: int = 100):
+        if not USEARCH_AVAILABLE:
+            raise RuntimeError("usearch is not installed")
+        self.quantize = quantize
+        self.connectivity = connectivity
+        self.expansion_add = expansion_add
+        self.expansion_search = expansion_search
+        self.ids: List[str] = []
+        self.documents: List[str] = []
+        self.metadatas: List[Dict[str, Any]] = []
+        self._index = None  # Created on the first add, once the dimensions are known
+
+    def add(self, ids: List[str], embeddings, documents: List[str], metadatas: List[Dict[str, Any]]):
+        """Append entries to the index"""
+        if not ids:
+            return
+        vectors = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if vectors.ndim != 2 or vectors.shape[0] != len(ids):
+            raise ValueError(f"Expected {len(ids)} embeddings, got an array of shape {vectors.shape}")
+        if self._index is None:
+            self._index = Index(
+                ndim=vectors.shape[1],
+                metric=MetricKind.L2sq,
+                dtype=ScalarKind.F16 if self.quantize else ScalarKind.F32,
+                connectivity=self.connectivity,
+                expansion_add=self.expansion_add,
+                expansion_search=self.expansion_search
+            )
+
+        # Entries are keyed on their position in the lists below
+        keys = np.arange(len(self.ids), len(self.ids) + len(ids), dtype=np.uint64)
+        self._index.add(keys, vectors)
+        self.ids.extend(ids)
+        self.documents.extend(documents)
+        self.metadatas.extend(metadata or {} for metadata in metadatas)
+
+    def search(self, query_embedding, limit: int) -> List[Tuple[int, float]]:
+        """Return (position, distance) of the `limit` nearest entries, nearest first"""
+        if self._index is None or limit <= 0:
+            return []
+        query = np.asarray(query_embedding, dtype=np.float32).ravel()
+        if query.shape[0] != self._index.ndim:
+            return []
+
+        matches = self._index.search(query, min(limit, len(self.ids)))
+        return [(int(key), max(float(distance), 0.0)) for key, distance in zip(matches.keys, matches.distances)]
+
+    def __len__(self) -> int:
+        return len(self.ids)
@@ -0,0 +1,88 @@
+from typing import Any, Dict, List, Tuple
+import numpy as np
+
+class VectorIndex:
+    """In-memory copy of a collection's embeddings for brute-force search.
+
+    For small collections a single matrix-vector product over every embedding
+    is faster than a round trip to the ChromaDB server. Distances are squared
+    L2, the metric ChromaDB collections use by default, so distance thresholds
+    tuned against ChromaDB results still apply.
+
+    With `quantize`, embeddings are stored as int8 with a float32 scale per
+    row, a quarter of the memory, and the scan reads a quarter of the bytes.
+    Distances are then those of the dequantized vectors, which for sentence
+    embeddings are within a fraction of a percent of the exact ones.
+    """
+
+    def __init__(self, quantize: bool = False, block_rows: int = 4096):
+        self.quantize = quantize
+        self.block_rows = block_rows
+        self.ids: List[str] = []
+        self.documents: List[str] = []
+        self.metadatas: List[Dict[str, Any]] = []
+        self._matrix = None  # (N, dim) float32, or int8 when quantized
+        self._scales = None  # (N,) per-row scales when quantized
+        self._sq_norms = None  # (N,) squared row norms, precomputed for the distance
+
+    def add(self, ids: List[str], embeddings, documents: List[str], metadatas: List[Dict[str, Any]]):
+        """Append entries to the index"""
+        if not ids:
+            return
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if vectors.ndim != 2 or vectors.shape[0] != len(ids):
+            raise ValueError(f"Expected {len(ids)} embeddings, got an array of shape {vectors.shape}")
+
+        scales = None
+        if self.quantize:
+            # Symmetric per-row quantization: the largest component maps to 127
+            scales = np.abs(vectors).max(axis=1) / 127.0
+            scales[scales == 0] = 1.0
+            rows = np.round(vectors / scales[:, None]).astype(np.int8)
+            vectors = rows * scales[:, None]  # What the search will actually see
+        else:
+            rows = vectors
+        sq_norms = np.einsum("ij,ij->i", vectors, vectors)
+
+        if self._matrix is None:
+            self._matrix = np.ascontiguousarray(rows)
+            self._scales = scales
+            self._sq_norms = sq_norms
+        else:
+            self._matrix = np.vstack([self._matrix, rows])
+            if scales is not None:
+                self._scales = np.concatenate([self._scales, scales])
+            self._sq_norms = np.concatenate([self._sq_norms, sq_norms])
+        self.ids.extend(ids)
+        self.documents.extend(documents)
+        self.metadatas.extend(metadata or {} for metadata in metadatas)
+
+    def search(self, query_embedding, limit: int) -> List[Tuple[int, float]]:
+        """Return (position, distance) of the `limit` nearest entries, nearest first"""
+        if self._matrix is None or limit <= 0:
+            return []
+        query = np.asarray(query_embedding, dtype=np.float32).ravel()
+        if query.shape[0] != self._matrix.shape[1]:
+            return []
+
+        # ||m - q||^2 = ||m||^2 - 2 m.q + ||q||^2
+        distances = self._sq_norms - 2.0 * self._dot(query) + float(query @ query)
+        k = min(limit, len(self.ids))
+        top = np.argpartition(distances, k - 1)[:k]
+        top = top[np.argsort(distances[top])]
+        return [(int(i), max(float(distances[i]), 0.0)) for i in top]
+
+    def _dot(self, query: np.ndarray) -> np.ndarray:
+        """Dot product of every row with the query"""
+        if self._scales is None:
+            return self._matrix @ query
+        # NumPy has no int8 matrix kernels, so rows are widened to float32 a
+        # cache-sized block at a time; the whole matrix is only read as int8
+        dots = np.empty(len(self._matrix), dtype=np.float32)
+        for start in range(0, len(self._matrix), self.block_rows):
+            block = self._matrix[start:start + self.block_rows]
+            dots[start:start + len(block)] = block.astype(np.float32) @ query
+        return dots * self._scales
+
+    def __len__(self) -> int:
+        return len(self.ids)
@@ -2,41 +2,133 @@ from typing import List, Dict, Any, Optional
 import logging
 import asyncio
 from concurrent.futures import ThreadPoolExecutor
+from cachetools import TTLCache
 import re
-import aiohttp
+import httpx
 import time
+import importlib.util
 
-try:
-    from ddgs import DDGS
-    DDGS_AVAILABLE = True
-except ImportError:
-    try:
-        from duckduckgo_search import DDGS
-        DDGS_AVAILABLE = True
-    except ImportError:
-        DDGS_AVAILABLE = False
-        DDGS = None
+# The DuckDuckGo search library is slow to import, so only its presence is
+# checked here; it is imported the first time a DuckDuckGo search runs
+DDGS_AVAILABLE = any(importlib.util.find_spec(name) is not None for name in ("ddgs", "duckduckgo_search"))
+DDGS = None
 
 logger = logging.getLogger(__name__)
 
+# Phrases suggesting a message needs a web search, by category, with the
+# weight each one found adds to the search score
+SEARCH_INDICATORS = [
+    # Explicit search commands (high weight)
+    ("explicit", 3, [
+        'search for', 'find information about', 'look up', 'google',
+        'search', 'find', 'lookup', 'research'
+    ]),
+    # Current/time-sensitive indicators (high weight)
+    ("current", 2, [
+        'current', 'latest', 'recent', 'today', 'now', 'this year',
+        'update', 'news', 'breaking', 'live', 'real-time'
+    ]),
+    # Question words that often need web search (medium weight)
+    ("question", 1.5, [
+        'what is', 'who is', 'where is', 'when did', 'how to',
+        'how much', 'why is', 'which', 'define', 'explain'
+    ]),
+    # Topics that frequently need current information (medium weight)
+    ("dynamic", 2, [
+        'weather', 'stock price', 'cryptocurrency', 'bitcoin', 'news',
+        'sports score', 'election', 'market', 'price', 'cost'
+    ])
+]
+
+_INDICATORS = {indicator for _, _, indicators in SEARCH_INDICATORS for indicator in indicators}
+# A lookahead matches at every position, so overlapping indicators are all
+# found; the alternation is longest first, and the shorter indicators that a
+# match begins with ("search" in "search for") are added from this table
+_INDICATOR_RE = re.compile(
+    "(?=(" + "|".join(re.escape(i) for i in sorted(_INDICATORS, key=len, reverse=True)) + "))"
+)
+_INDICATOR_PREFIXES = {
+    indicator: [other for other in _INDICATORS if indicator.startswith(other)]
+    for indicator in _INDICATORS
+}
+
+_URL_RE = re.compile(r'https?://|www\.|\.com|\.org|\.net')
+
+_QUERY_TYPE_PATTERNS = [
+    (query_type, re.compile("|".join(re.escape(word) for word in words)))
+    for query_type, words in [
+        ('weather', ['weather', 'temperature', 'forecast']),
+        ('news', ['news', 'breaking', 'report']),
+        ('price', ['price', 'cost', 'buy', 'sell', 'stock']),
+        ('tutorial', ['how to', 'tutorial', 'guide', 'instructions']),
+        ('definition', ['define', 'meaning', 'what is', 'definition'])
+    ]
+]
+
+def _load_ddgs():
+    """Import the DDGS client class (ddgs, or the older duckduckgo_search)"""
+    global DDGS
+    if DDGS is None:
+        try:
+            from ddgs import DDGS as ddgs_class
+        except ImportError:
+            from duckduckgo_search import DDGS as ddgs_class
+        DDGS = ddgs_class
+    return DDGS
+
 class WebSearchService:
-    def __init__(self, config: Dict[str, Any] = None):
-        """Initialize web search service with configuration"""
+    def __init__(self, config: Dict[str, Any] = None, http: Optional[httpx.AsyncClient] = None):
+        """Initialize web search service with configuration.
+
+        `http` is the client used for search API calls; the app passes its
+        shared client so connections are pooled across requests.
+        """
         self.config = config or {}
+        self._http = http
         self.executor = ThreadPoolExecutor(max_workers=3)
         
-        # Initialize DuckDuckGo search if available
-        self.ddgs = None
-        if DDGS_AVAILABLE:
-            try:
-                self.ddgs = DDGS()
-            except Exception as e:
-                logger.error(f"Failed to initialize DDGS: {e}")
+        # DuckDuckGo search client, created on first use
+        self._ddgs = None
+        self._ddgs_failed = False
                 
         # Rate limiting
         self.last_request_time = {}
         self.min_request_interval = 2.0  # Minimum seconds between requests per service
         
+        # Recent successful results. They change slowly, so a repeated query
+        # is answered from memory, without waiting on the rate limit
+        self.results_cache = TTLCache(maxsize=256, ttl=300)
+        
+    @property
+    def ddgs(self):
+        """DuckDuckGo search client, or None if it isn't available"""
+        if self._ddgs is None and DDGS_AVAILABLE and not self._ddgs_failed:
+            try:
+                self._ddgs = _load_ddgs()()
+            except Exception as e:
+                logger.error(f"Failed to initialize DDGS: {e}")
+                self._ddgs_failed = True
+        return self._ddgs
+    
+    @ddgs.setter
+    def ddgs(self, client):
+        self._ddgs = client
+    
+    @property
+    def http(self) -> httpx.AsyncClient:
+        """HTTP client for search API calls, created if none was given"""
+        if self._http is None:
+            self._http = httpx.AsyncClient(timeout=httpx.Timeout(10.0))
+        return self._http
+    
+    @http.setter
+    def http(self, client):
+        self._http = client
+    
+    def _ddgs_usable(self) -> bool:
+        """Whether DuckDuckGo search can be used, without importing the library"""
+        return self._ddgs is not None or (DDGS_AVAILABLE and not self._ddgs_failed)
+        
     def _get_search_config(self, engine: str = None) -> Dict[str, Any]:
         """Get configuration for a specific search engine"""
         engine = engine or self.config.get('default_engine', 'duckduckgo')
@@ -84,13 +176,14 @@ class WebSearchService:
         
     async def _rate_limit_check(self, service: str):
         """Check and enforce rate limiting"""
-        now = time.time()
+        # Monotonic, so a wall clock adjustment can't skip or stretch the wait
+        now = time.monotonic()
         if service in self.last_request_time:
             time_since_last = now - self.last_request_time[service]
             if time_since_last < self.min_request_interval:
                 wait_time = self.min_request_interval - time_since_last
                 await asyncio.sleep(wait_time)
-        self.last_request_time[service] = time.time()
+        self.last_request_time[service] = time.monotonic()
         
     def _deduplicate_results(self, results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """Remove duplicate results and rank by relevance"""
@@ -165,6 +258,18 @@ class WebSearchService:
         # Ensure score is between 0 and 1
         return max(0.0, min(1.0, score))
     
+    def _cached_results(self, key: tuple, query: str) -> Optional[Dict[str, Any]]:
+        """Copy of the cached results for the key, or None"""
+        cached = self.results_cache.get(key)
+        if cached is None:
+            return None
+        return {**cached, "query": query, "cached": True}
+    
+    def _cache_results(self, key: tuple, results: Dict[str, Any]):
+        if results.get("success"):
+            # Stored as a copy; callers add their own fields to the result
+            self.results_cache[key] = dict(results)
+    
     def _clean_search_query(self, query: str) -> str:
         """Clean and optimize search query"""
         # Remove special characters and clean up
@@ -176,60 +281,23 @@ class WebSearchService:
     def _enhance_search_intent(self, message: str) -> Dict[str, Any]:
         """Enhanced search intent detection with improved accuracy"""
         
-        # Explicit search commands
-        explicit_search = [
-            'search for', 'find information about', 'look up', 'google',
-            'search', 'find', 'lookup', 'research'
-        ]
-        
-        # Current/time-sensitive indicators
-        current_indicators = [
-            'current', 'latest', 'recent', 'today', 'now', 'this year',
-            'update', 'news', 'breaking', 'live', 'real-time'
-        ]
-        
-        # Question words that often need web search
-        question_indicators = [
-            'what is', 'who is', 'where is', 'when did', 'how to',
-            'how much', 'why is', 'which', 'define', 'explain'
-        ]
-        
-        # Topics that frequently need current information
-        dynamic_topics = [
-            'weather', 'stock price', 'cryptocurrency', 'bitcoin', 'news',
-            'sports score', 'election', 'market', 'price', 'cost'
-        ]
-        
         message_lower = message.lower()
         search_score = 0
         indicators_found = []
         
-        # Check for explicit search commands (high weight)
-        for indicator in explicit_search:
-            if indicator in message_lower:
-                search_score += 3
-                indicators_found.append(f"explicit: {indicator}")
-        
-        # Check for current/time-sensitive indicators (high weight)
-        for indicator in current_indicators:
-            if indicator in message_lower:
-                search_score += 2
-                indicators_found.append(f"current: {indicator}")
-        
-        # Check for question patterns (medium weight)
-        for indicator in question_indicators:
-            if indicator in message_lower:
-                search_score += 1.5
-                indicators_found.append(f"question: {indicator}")
-        
-        # Check for dynamic topics (medium weight)
-        for topic in dynamic_topics:
-            if topic in message_lower:
-                search_score += 2
-                indicators_found.append(f"dynamic: {topic}")
+        # Every indicator phrase in the message, found in a single scan
+        found = set()
+        for match in _INDICATOR_RE.finditer(message_lower):
+            found.update(_INDICATOR_PREFIXES[match.group(1)])
+        
+        for category, weight, indicators in SEARCH_INDICATORS:
+            for indicator in indicators:
+                if indicator in found:
+                    search_score += weight
+                    indicators_found.append(f"{category}: {indicator}")
         
         # URL or domain mentions (low weight, might be referential)
-        if re.search(r'https?://|www\.|\.com|\.org|\.net', message_lower):
+        if _URL_RE.search(message_lower):
             search_score += 0.5
             indicators_found.append("url_mention")
         
@@ -253,18 +321,10 @@ class WebSearchService:
     
     def _classify_query_type(self, message: str) -> str:
         """Classify the type of query for better search strategy"""
-        if any(word in message for word in ['weather', 'temperature', 'forecast']):
-            return 'weather'
-        elif any(word in message for word in ['news', 'breaking', 'report']):
-            return 'news'
-        elif any(word in message for word in ['price', 'cost', 'buy', 'sell', 'stock']):
-            return 'price'
-        elif any(word in message for word in ['how to', 'tutorial', 'guide', 'instructions']):
-            return 'tutorial'
-        elif any(word in message for word in ['define', 'meaning', 'what is', 'definition']):
-            return 'definition'
-        else:
-            return 'general'
+        for query_type, pattern in _QUERY_TYPE_PATTERNS:
+            if pattern.search(message):
+                return query_type
+        return 'general'
     
     async def search_web(self, query: str, max_results: int = 5, engine: str = None) -> Dict[str, Any]:
         """Search the web using the specified engine with enhanced result processing"""
@@ -280,9 +340,14 @@ class WebSearchService:
                 "source": engine
             }
         
+        cleaned_query = self._clean_search_query(query)
+        cache_key = ("web", engine, cleaned_query, max_results)
+        cached = self._cached_results(cache_key, query)
+        if cached is not None:
+            return cached
+        
         try:
             await self._rate_limit_check(engine)
-            cleaned_query = self._clean_search_query(query)
             
             # Get raw results from engine
             raw_results = None
@@ -310,7 +375,7 @@ class WebSearchService:
                 # Limit to requested number after processing
                 final_results = processed_results[:max_results]
                 
-                return {
+                result = {
                     "query": query,
                     "cleaned_query": cleaned_query,
                     "results": final_results,
@@ -319,6 +384,8 @@ class WebSearchService:
                     "success": True,
                     "source": engine
                 }
+                self._cache_results(cache_key, result)
+                return result
             else:
                 return raw_results or {
                     "query": query,
@@ -374,30 +441,29 @@ class WebSearchService:
             'categories': 'general'
         }
         
-        async with aiohttp.ClientSession() as session:
-            async with session.get(search_url, params=params, timeout=10) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    results = []
-                    
-                    for item in data.get('results', [])[:max_results]:
-                        results.append({
-                            "title": item.get('title', ''),
-                            "url": item.get('url', ''),
-                            "snippet": item.get('content', ''),
-                            "source": "web"
-                        })
-                    
-                    return {
-                        "query": query,
-                        "cleaned_query": query,
-                        "results": results,
-                        "success": True,
-                        "source": "searxng",
-                        "instance": instance_url
-                    }
-                else:
-                    raise Exception(f"SearXNG request failed with status {response.status}")
+        response = await self.http.get(search_url, params=params, timeout=10)
+        if response.status_code == 200:
+            data = response.json()
+            results = []
+            
+            for item in data.get('results', [])[:max_results]:
+                results.append({
+                    "title": item.get('title', ''),
+                    "url": item.get('url', ''),
+                    "snippet": item.get('content', ''),
+                    "source": "web"
+                })
+            
+            return {
+                "query": query,
+                "cleaned_query": query,
+                "results": results,
+                "success": True,
+                "source": "searxng",
+                "instance": instance_url
+            }
+        else:
+            raise Exception(f"SearXNG request failed with status {response.status_code}")
 
     async def _search_google(self, query: str, max_results: int, config: Dict[str, Any]) -> Dict[str, Any]:
         """Search using Google Custom Search API"""
@@ -415,30 +481,29 @@ class WebSearchService:
             'num': min(max_results, 10)  # Google API max is 10
         }
         
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, params=params, timeout=10) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    results = []
-                    
-                    for item in data.get('items', []):
-                        results.append({
-                            "title": item.get('title', ''),
-                            "url": item.get('link', ''),
-                            "snippet": item.get('snippet', ''),
-                            "source": "web"
-                        })
-                    
-                    return {
-                        "query": query,
-                        "cleaned_query": query,
-                        "results": results,
-                        "success": True,
-                        "source": "google"
-                    }
-                else:
-                    error_data = await response.json()
-                    raise Exception(f"Google API error: {error_data.get('error', {}).get('message', 'Unknown error')}")
+        response = await self.http.get(url, params=params, timeout=10)
+        if response.status_code == 200:
+            data = response.json()
+            results = []
+            
+            for item in data.get('items', []):
+                results.append({
+                    "title": item.get('title', ''),
+                    "url": item.get('link', ''),
+                    "snippet": item.get('snippet', ''),
+                    "source": "web"
+                })
+            
+            return {
+                "query": query,
+                "cleaned_query": query,
+                "results": results,
+                "success": True,
+                "source": "google"
+            }
+        else:
+            error_data = response.json()
+            raise Exception(f"Google API error: {error_data.get('error', {}).get('message', 'Unknown error')}")
 
     async def _search_bing(self, query: str, max_results: int, config: Dict[str, Any]) -> Dict[str, Any]:
         """Search using Bing Search API"""
@@ -455,30 +520,29 @@ class WebSearchService:
             'responseFilter': 'Webpages'
         }
         
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, params=params, headers=headers, timeout=10) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    results = []
-                    
-                    for item in data.get('webPages', {}).get('value', []):
-                        results.append({
-                            "title": item.get('name', ''),
-                            "url": item.get('url', ''),
-                            "snippet": item.get('snippet', ''),
-                            "source": "web"
-                        })
-                    
-                    return {
-                        "query": query,
-                        "cleaned_query": query,
-                        "results": results,
-                        "success": True,
-                        "source": "bing"
-                    }
-                else:
-                    error_data = await response.json()
-                    raise Exception(f"Bing API error: {error_data.get('message', 'Unknown error')}")
+        response = await self.http.get(url, params=params, headers=headers, timeout=10)
+        if response.status_code == 200:
+            data = response.json()
+            results = []
+            
+            for item in data.get('webPages', {}).get('value', []):
+                results.append({
+                    "title": item.get('name', ''),
+                    "url": item.get('url', ''),
+                    "snippet": item.get('snippet', ''),
+                    "source": "web"
+                })
+            
+            return {
+                "query": query,
+                "cleaned_query": query,
+                "results": results,
+                "success": True,
+                "source": "bing"
+            }
+        else:
+            error_data = response.json()
+            raise Exception(f"Bing API error: {error_data.get('message', 'Unknown error')}")
     
     def _perform_ddg_search(self, query: str, max_results: int) -> List[Dict[str, Any]]:
         """Perform the actual DuckDuckGo search (blocking operation)"""
@@ -514,11 +578,17 @@ class WebSearchService:
         engine = engine or self.config.get('default_engine', 'duckduckgo')
         
         try:
-            await self._rate_limit_check(f"{engine}_news")
             cleaned_query = self._clean_search_query(query)
             
             if engine == 'duckduckgo':
-                return await self._search_ddg_news(cleaned_query, max_results)
+                cache_key = ("news", engine, cleaned_query, max_results)
+                cached = self._cached_results(cache_key, cleaned_query)
+                if cached is not None:
+                    return cached
+                await self._rate_limit_check(f"{engine}_news")
+                result = await self._search_ddg_news(cleaned_query, max_results)
+                self._cache_results(cache_key, result)
+                return result
             else:
                 # For other engines, fall back to regular search with news query modification
                 news_query = f"{cleaned_query} news"
@@ -583,6 +653,51 @@ class WebSearchService:
             logger.error(f"DuckDuckGo news search execution error: {e}")
             return []
     
+    def _auto_search_engines(self) -> List[str]:
+        """Engines used by auto search: the default engine, then every other
+        engine that is enabled and configured in the user configuration"""
+        default_engine = self.config.get('default_engine', 'duckduckgo')
+        engines = [default_engine]
+        for name, user_config in self.config.get('engines', {}).items():
+            if name != default_engine and user_config.get('enabled') \
+                    and self._is_engine_configured(name, self._get_search_config(name)):
+                engines.append(name)
+        return engines
+    
+    async def _search_engines(self, query: str, max_results: int, engines: List[str]) -> Dict[str, Any]:
+        """Search several engines concurrently and merge their results"""
+        if len(engines) == 1:
+            return await self.search_web(query, max_results=max_results, engine=engines[0])
+        
+        responses = await asyncio.gather(
+            *(self.search_web(query, max_results=max_results, engine=name) for name in engines),
+            return_exceptions=True
+        )
+        succeeded = [r for r in responses if isinstance(r, dict) and r.get("success")]
+        if not succeeded:
+            errors = [str(r) if isinstance(r, Exception) else r.get("error", "Unknown error") for r in responses]
+            return {
+                "query": query,
+                "results": [],
+                "success": False,
+                "error": "; ".join(f"{name}: {error}" for name, error in zip(engines, errors)),
+                "source": engines[0]
+            }
+        if len(succeeded) == 1:
+            return succeeded[0]
+        
+        merged = self._deduplicate_results([result for r in succeeded for result in r["results"]])
+        return {
+            "query": query,
+            "cleaned_query": succeeded[0].get("cleaned_query", query),
+            "results": merged[:max_results],
+            "total_found": sum(r.get("total_found", len(r["results"])) for r in succeeded),
+            "after_deduplication": len(merged),
+            "success": True,
+            "source": succeeded[0]["source"],
+            "sources": [r["source"] for r in succeeded]
+        }
+    
     async def auto_search(self, user_message: str, engine: str = None) -> Optional[Dict[str, Any]]:
         """Automatically determine if search is needed and perform it with enhanced intent detection"""
         intent = self._enhance_search_intent(user_message)
@@ -601,12 +716,14 @@ class WebSearchService:
         max_retries = 3
         last_error = None
         
+        engines = [engine] if engine else self._auto_search_engines()
+        
         for attempt in range(max_retries):
             try:
-                search_results = await self.search_web(
-                    intent["suggested_query"], 
-                    max_results=max_results, 
-                    engine=engine
+                search_results = await self._search_engines(
+                    intent["suggested_query"],
+                    max_results,
+                    engines
                 )
                 
                 if search_results["success"]:
@@ -643,7 +760,7 @@ class WebSearchService:
             
             # Check DuckDuckGo
             engines_status['duckduckgo'] = {
-                'available': DDGS_AVAILABLE and self.ddgs is not None,
+                'available': self._ddgs_usable(),
                 'requires_api_key': False,
                 'features': ['web_search', 'news_search']
             }
@@ -679,7 +796,7 @@ class WebSearchService:
             return False
             
         if engine == 'duckduckgo':
-            return DDGS_AVAILABLE and self.ddgs is not None
+            return self._ddgs_usable()
         elif engine == 'searxng' or engine == 'bfforexseaxng':
             return bool(config.get('instance_url'))
         elif engine == 'google':
@@ -0,0 +1,15 @@
+import httpx
+import pytest
+
+@pytest.fixture
+def make_http_client():
+    """Factory for HTTP clients answering every request with the same response"""
+    def factory(status=200, json_data=None, calls=None, error=None):
+        def handler(request):
+            if calls is not None:
+                calls.append(request)
+            if error is not None:
+                raise error
+            return httpx.Response(status, json=json_data or {})
+        return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return factory
@@ -1,4 +1,6 @@
 import pytest
+import threading
+import time
 import asyncio
 import tempfile
 import shutil
@@ -7,7 +9,19 @@ from unittest.mock import patch, MagicMock, AsyncMock
 import sys
 sys.path.append('..')
 
-from services.chromadb_service import ChromaDBService
+from services.chromadb_service import ChromaDBService, _clean_metadata
+
+def collections_by_name(knowledge, conversations, files):
+    """get_or_create_collection side effect returning each mock collection by name.
+
+    The collections are created concurrently, so not in a fixed order.
+    """
+    collections = {
+        "evolveui_knowledge": knowledge,
+        "evolveui_conversations": conversations,
+        "evolveui_files": files
+    }
+    return lambda name, **kwargs: collections[name]
 
 class TestChromaDBService:
     """Test suite for ChromaDB service functionality"""
@@ -39,7 +53,13 @@ class TestChromaDBService:
         assert service.collection is not None
         assert service.conversations_collection is not None
         assert service.files_collection is not None
-        mock_http_client.assert_called_once_with(host="localhost", port=8000)
+        mock_http_client.assert_called_once()
+        assert mock_http_client.call_args[1]['host'] == "localhost"
+        assert mock_http_client.call_args[1]['port'] == 8000
+        assert mock_http_client.call_args[1]['settings'].anonymized_telemetry is False
+        assert mock_http_client.call_args[1]['settings'].chroma_http_keepalive_secs == 60.0
+        assert mock_http_client.call_args[1]['settings'].chroma_http_max_connections == 32
+        assert mock_http_client.call_args[1]['settings'].chroma_http_max_keepalive_connections == 32
     
     @patch('services.chromadb_service.chromadb.HttpClient')
     @patch('services.chromadb_service.chromadb.PersistentClient')
@@ -60,7 +80,9 @@ class TestChromaDBService:
         service = ChromaDBService(host="localhost", port=8000)
         
         assert service.client is not None
-        mock_persistent_client.assert_called_once_with(path="/data")
+        mock_persistent_client.assert_called_once()
+        assert mock_persistent_client.call_args[1]['path'] == "/data"
+        assert mock_persistent_client.call_args[1]['settings'].anonymized_telemetry is False
         mock_makedirs.assert_called_once_with("/data", exist_ok=True)
     
     @patch('services.chromadb_service.chromadb.HttpClient')
@@ -148,6 +170,8 @@ class TestChromaDBService:
         
         # Check that results are sorted by relevance (highest first)
         assert results[0]['relevance_score'] > results[1]['relevance_score']
+        # Embeddings are left out of the query response
+        assert "embeddings" not in mock_collection.query.call_args[1]['include']
     
     @patch('services.chromadb_service.chromadb.HttpClient')
     @pytest.mark.asyncio
@@ -188,11 +212,11 @@ class TestChromaDBService:
         # Mock collections
         mock_collection = MagicMock()
         mock_conversations_collection = MagicMock()
-        mock_client.get_or_create_collection.side_effect = [
+        mock_client.get_or_create_collection.side_effect = collections_by_name(
             mock_collection,
             mock_conversations_collection,
             MagicMock()  # files collection
-        ]
+        )
         
         service = ChromaDBService()
         
@@ -201,7 +225,8 @@ class TestChromaDBService:
             {"role": "assistant", "content": "Hi there!", "timestamp": "2023-01-01T00:01:00"}
         ]
         
-        await service.add_conversation_context("conv_123", messages)
+        # Read in a single pass, so a generator works as well as a list
+        await service.add_conversation_context("conv_123", (msg for msg in messages))
         
         mock_conversations_collection.add.assert_called_once()
         call_args = mock_conversations_collection.add.call_args
@@ -211,12 +236,16 @@ class TestChromaDBService:
         assert "Conversation conv_123:" in doc_content
         assert "user: Hello" in doc_content
         assert "assistant: Hi there!" in doc_content
+        assert doc_content == "Conversation conv_123:\nuser: Hello\nassistant: Hi there!\n"
         
         # Check metadata
         metadata = call_args[1]['metadatas'][0]
         assert metadata['type'] == 'conversation'
         assert metadata['conversation_id'] == 'conv_123'
         assert metadata['message_count'] == 2
+        assert metadata['timestamp'] == "2023-01-01T00:01:00"
+        assert sorted(metadata['participants']) == ["assistant", "user"]
+        assert metadata['last_message_preview'] == "Hi there!"
     
     @patch('services.chromadb_service.chromadb.HttpClient')
     @pytest.mark.asyncio
@@ -230,11 +259,11 @@ class TestChromaDBService:
         mock_collection = MagicMock()
         mock_conversations_collection = MagicMock()
         mock_files_collection = MagicMock()
-        mock_client.get_or_create_collection.side_effect = [
+        mock_client.get_or_create_collection.side_effect = collections_by_name(
             mock_collection,
             mock_conversations_collection,
             mock_files_collection
-        ]
+        )
         
         service = ChromaDBService()
         
@@ -276,11 +305,11 @@ class TestChromaDBService:
             'ids': [["file1"]],
             'metadatas': [[{"filename": "test.txt", "file_type": "txt"}]]
         }
-        mock_client.get_or_create_collection.side_effect = [
+        mock_client.get_or_create_collection.side_effect = collections_by_name(
             mock_collection,
             mock_conversations_collection,
             mock_files_collection
-        ]
+        )
         
         service = ChromaDBService()
         
@@ -293,6 +322,11 @@ class TestChromaDBService:
         # Verify that where clause was used for file type filtering
         call_args = mock_files_collection.query.call_args
         assert call_args[1]['where'] == {"file_type": "txt"}
+
+        # The where clause is built once per file type and reused
+        await service.search_files("another query", file_type="txt", limit=5)
+        first_call, second_call = mock_files_collection.query.call_args_list
+        assert second_call[1]['where'] is first_call[1]['where']
     
     @patch('services.chromadb_service.chromadb.HttpClient')
     def test_get_collection_stats(self, mock_http_client):
@@ -309,11 +343,11 @@ class TestChromaDBService:
         mock_files_collection = MagicMock()
         mock_files_collection.count.return_value = 2
         
-        mock_client.get_or_create_collection.side_effect = [
+        mock_client.get_or_create_collection.side_effect = collections_by_name(
             mock_collection,
             mock_conversations_collection,
             mock_files_collection
-        ]
+        )
         
         service = ChromaDBService()
         stats = service.get_collection_stats()
@@ -323,6 +357,7 @@ class TestChromaDBService:
         assert stats['conversations'] == 3
         assert stats['files'] == 2
         assert stats['total_documents'] == 10
+        assert stats['requests_in_flight'] == 0
         assert len(stats['collections']) == 3
         
         # Check collection details
@@ -361,7 +396,120 @@ class TestChromaDBService:
         assert len(call_args[1]['documents']) == 2
         assert "Doc 1" in call_args[1]['documents']
         assert "Doc 2" in call_args[1]['documents']
-    
+
+    @patch('services.chromadb_service.chromadb.HttpClient')
+    @pytest.mark.asyncio
+    async def test_bulk_add_documents_in_batches(self, mock_http_client):
+        """Test that a large bulk add is stored in batches of add_batch_size"""
+        mock_client = MagicMock()
+        mock_client.heartbeat.return_value = True
+        mock_http_client.return_value = mock_client
+
+        # Mock collection
+        mock_collection = MagicMock()
+        mock_client.get_or_create_collection.return_value = mock_collection
+
+        service = ChromaDBService()
+        service.add_batch_size = 2
+        service._embedding_function = MagicMock(side_effect=lambda texts: [[1.0, 0.0]] * len(texts))
+
+        result = await service.bulk_add_documents([{"content": f"Doc {i}"} for i in range(5)])
+
+        assert result['added'] == 5
+        # Batches are stored concurrently, so in any order
+        assert sorted(len(call[1]['documents']) for call in mock_collection.add.call_args_list) == [1, 2, 2]
+
+    @patch('services.chromadb_service.chromadb.HttpClient')
+    @pytest.mark.asyncio
+    async def test_bulk_add_documents_partial_failure(self, mock_http_client):
+        """Test that a failed batch is reported without losing the batches that were stored"""
+        mock_client = MagicMock()
+        mock_client.heartbeat.return_value = True
+        mock_http_client.return_value = mock_client
+
+        mock_collection = MagicMock()
+        def add(documents, **kwargs):
+            if "Bad" in documents:
+                raise Exception("Batch rejected")
+        mock_collection.add.side_effect = add
+        mock_client.get_or_create_collection.return_value = mock_collection
+
+        service = ChromaDBService()
+        service._embedding_function = MagicMock(side_effect=lambda texts: [[1.0, 0.0]] * len(texts))
+
+        documents = iter([{"content": "Good 1"}, {"content": "Good 2"}, {"content": "Bad"}, {"content": "Good 3"}])
+        result = await service.bulk_add_documents(documents, batch_size=2, concurrency=1)
+
+        assert result['success'] is False
+        assert result['added'] == 2
+        assert result['errors'] == ["Batch rejected"]
+
+    @patch('services.chromadb_service.chromadb.HttpClient')
+    @pytest.mark.asyncio
+    async def test_add_documents_batch(self, mock_http_client):
+        """Test adding a batch of document chunks in one call"""
+        mock_client = MagicMock()
+        mock_client.heartbeat.return_value = True
+        mock_http_client.return_value = mock_client
+
+        # Mock collection
+        mock_collection = MagicMock()
+        mock_client.get_or_create_collection.return_value = mock_collection
+
+        service = ChromaDBService()
+        service._embedding_function = MagicMock(return_value=[[1.0, 0.0], [0.0, 1.0]])
+
+        ids = await service.add_documents_batch(
+            ["Chunk 1", "Chunk 2"],
+            [{"chunk_index": 0, "filename": "a.txt"}, {"chunk_index": 1, "filename": None}],
+            ids=["doc_0", "doc_1"]
+        )
+
+        assert ids == ["doc_0", "doc_1"]
+        assert service.knowledge_version == 1
+
+        mock_collection.add.assert_called_once()
+        call_args = mock_collection.add.call_args
+        assert call_args[1]['documents'] == ["Chunk 1", "Chunk 2"]
+        assert call_args[1]['ids'] == ["doc_0", "doc_1"]
+        # Both documents are embedded in one call and the vectors handed to Chroma
+        service._embedding_function.assert_called_once_with(["Chunk 1", "Chunk 2"])
+        assert call_args[1]['embeddings'].tolist() == [[1.0, 0.0], [0.0, 1.0]]
+        # None values are filtered out of the metadata
+        assert call_args[1]['metadatas'][1] == {"chunk_index": 1}
+
+    @patch('services.chromadb_service.chromadb.HttpClient')
+    @pytest.mark.asyncio
+    async def test_list_documents(self, mock_http_client):
+        """Test paging through documents with a server-side offset"""
+        mock_client = MagicMock()
+        mock_client.heartbeat.return_value = True
+        mock_http_client.return_value = mock_client
+
+        # Mock collection
+        mock_collection = MagicMock()
+        mock_collection.get.return_value = {
+            'ids': ["doc3", "doc4"],
+            'documents': ["Document 3", "Document 4"],
+            'metadatas': [{"source": "test"}, None]
+        }
+        mock_collection.count.return_value = 10
+        mock_client.get_or_create_collection.return_value = mock_collection
+
+        service = ChromaDBService()
+
+        page = await service.list_documents(limit=2, offset=2)
+
+        assert page['total'] == 10
+        assert [doc['id'] for doc in page['documents']] == ["doc3", "doc4"]
+        assert page['documents'][0]['metadata'] == {"source": "test"}
+        assert page['documents'][1]['metadata'] == {}
+
+        call_args = mock_collection.get.call_args
+        assert call_args[1]['limit'] == 2
+        assert call_args[1]['offset'] == 2
+        mock_collection.query.assert_not_called()
+
     @patch('services.chromadb_service.chromadb.HttpClient')
     @pytest.mark.asyncio
     async def test_connection_retry_logic(self, mock_http_client):
@@ -404,5 +552,508 @@ class TestChromaDBService:
         assert stats['available'] is False
         assert 'error' in stats
 
+    @patch('services.chromadb_service.chromadb.HttpClient')
+    @pytest.mark.asyncio
+    async def test_embed_query_memoized(self, mock_http_client):
+        """Test that embedding the same query twice only runs the embedding function once"""
+        mock_client = MagicMock()
+        mock_client.heartbeat.return_value = True
+        mock_http_client.return_value = mock_client
+
+        service = ChromaDBService()
+        service._embedding_function = MagicMock(return_value=[[0.1, 0.2, 0.3]])
+
+        first = await service.embed_query("What is Python?")
+        second = await service.embed_query("  What is\n Python? ")
+
+        assert first.tolist() == second.tolist() == pytest.approx([0.1, 0.2, 0.3])
+        service._embedding_function.assert_called_once_with(["What is Python?"])
+
+    @patch('services.chromadb_service.embedding_functions.ONNXMiniLM_L6_V2')
+    @patch('services.chromadb_service.chromadb.HttpClient')
+    def test_embedding_model_loaded_once(self, mock_http_client, mock_onnx):
+        """Test that one embedding model is created, on the providers from EMBEDDING_PROVIDERS"""
+        mock_client = MagicMock()
+        mock_client.heartbeat.return_value = True
+        mock_http_client.return_value = mock_client
+
+        service = ChromaDBService()
+        with patch.dict(os.environ, {"EMBEDDING_PROVIDERS": "CUDAExecutionProvider,CPUExecutionProvider"}):
+            assert service._get_embedding_function() is service._get_embedding_function()
+
+        mock_onnx.assert_called_once_with(preferred_providers=["CUDAExecutionProvider", "CPUExecutionProvider"])
+
+    @patch('services.chromadb_service.chromadb.HttpClient')
+    @pytest.mark.asyncio
+    async def test_search_documents_in_memory(self, mock_http_client):
+        """Test that a small knowledge base is searched in memory and kept up to date on adds"""
+        mock_client = MagicMock()
+        mock_client.heartbeat.return_value = True
+        mock_http_client.return_value = mock_client
+
+        mock_collection = MagicMock()
+        mock_collection.count.return_value = 2
+        mock_collection.get.return_value = {
+            'ids': ['doc1', 'doc2'],
+            'embeddings': [[1.0, 0.0], [0.0, 1.0]],
+            'documents': ['Document 1', 'Document 2'],
+            'metadatas': [{'source': 'test'}, None]
+        }
+        mock_client.get_or_create_collection.return_value = mock_collection
+
+        service = ChromaDBService()
+
+        results = await service.search_documents("test query", limit=2, distance_threshold=0.5,
+                                                 query_embedding=[0.9, 0.1])
+        assert [r['id'] for r in results] == ['doc1']
+        assert results[0]['distance'] == pytest.approx(0.02)
+        assert results[0]['metadata'] == {'source': 'test'}
+        mock_collection.query.assert_not_called()
+
+        # New documents are fetched by id and appended rather than reloading everything
+        mock_collection.get.return_value = {
+            'ids': ['doc3'],
+            'embeddings': [[0.9, 0.1]],
+            'documents': ['Document 3'],
+            'metadatas': [{}]
+        }
+        await service.add_document("Document 3")
+        results = await service.search_documents("test query", limit=2, distance_threshold=0.5,
+                                                 query_embedding=[0.9, 0.1])
+        assert [r['id'] for r in results] == ['doc3', 'doc1']
+        assert mock_collection.count.call_count == 1
+
+    @patch('services.chromadb_service.chromadb.HttpClient')
+    @pytest.mark.asyncio
+    async def test_check_available_heartbeat_off_event_loop(self, mock_http_client):
+        """Test that a due connection check doesn't run on the event loop thread"""
+        heartbeat_threads = []
+        mock_client = MagicMock()
+        mock_client.heartbeat.side_effect = lambda: heartbeat_threads.append(threading.get_ident())
+        mock_http_client.return_value = mock_client
+
+        service = ChromaDBService()
+        heartbeat_threads.clear()
+        service._last_connection_check = 0  # Make a connection check due
+
+        assert await service.check_available() is True
+        assert len(heartbeat_threads) == 1
+        assert heartbeat_threads[0] != threading.get_ident()
+
+    @patch('services.chromadb_service.chromadb.HttpClient')
+    @pytest.mark.asyncio
+    async def test_collection_counts_cached(self, mock_http_client):
+        """Test that repeated status requests reuse collection counts until a write"""
+        mock_client = MagicMock()
+        mock_client.heartbeat.return_value = True
+        mock_http_client.return_value = mock_client
+
+        mock_collection = MagicMock()
+        mock_collection.count.return_value = 5
+        mock_client.get_or_create_collection.return_value = mock_collection
+
+        service = ChromaDBService()
+        service.get_collection_stats()
+        service.get_collection_stats()
+
+        # One count per collection (all three are the same mock here)
+        assert mock_collection.count.call_count == 3
+
+        await service.add_conversation_context("conv_123", [{"role": "user", "content": "Hi"}])
+        mock_collection.count.return_value = 6
+        stats = service.get_collection_stats()
+
+        assert mock_collection.count.call_count == 4
+        assert stats["conversations"] == 6
+        assert stats["knowledge_documents"] == 5
+
+    @patch('services.chromadb_service.chromadb.HttpClient')
+    @pytest.mark.asyncio
+    async def test_hnsw_settings(self, mock_http_client):
+        """Test that searched collections are created with HNSW settings and can have search_ef raised"""
+        mock_client = MagicMock()
+        mock_client.heartbeat.return_value = True
+        mock_http_client.return_value = mock_client
+
+        service = ChromaDBService()
+
+        created = {call[1]['name']: call[1]['metadata'] for call in mock_client.get_or_create_collection.call_args_list}
+        for name in ("evolveui_knowledge", "evolveui_conversations"):
+            assert created[name]["hnsw:M"] == 24
+            assert created[name]["hnsw:search_ef"] == 100
+
+        result = await service.optimize_for_search(ef=250)
+        assert result["success"] is True
+        service.collection.modify.assert_called_with(configuration={"hnsw": {"ef_search": 250}})
+
+    @patch('services.chromadb_service.chromadb.HttpClient')
+    def test_existing_collections_get_search_ef_raised(self, mock_http_client):
+        """Test that collections created with a lower search_ef have it raised on connect"""
+        mock_client = MagicMock()
+        mock_client.heartbeat.return_value = True
+        mock_http_client.return_value = mock_client
+        knowledge, conversations, files = MagicMock(), MagicMock(), MagicMock()
+        knowledge.configuration = {"hnsw": {"ef_search": 10}}
+        conversations.configuration = {"hnsw": {"ef_search": 100}}
+        mock_client.get_or_create_collection.side_effect = collections_by_name(knowledge, conversations, files)
+
+        ChromaDBService()
+
+        knowledge.modify.assert_called_once_with(configuration={"hnsw": {"ef_search": 100}})
+        conversations.modify.assert_not_called()
+        files.modify.assert_not_called()
+
+    @patch('services.chromadb_service.chromadb.HttpClient')
+    @pytest.mark.asyncio
+    async def test_get_relevant_context(self, mock_http_client):
+        """Test that relevant context only asks ChromaDB for text and distances and keeps close matches"""
+        mock_client = MagicMock()
+        mock_client.heartbeat.return_value = True
+        mock_http_client.return_value = mock_client
+
+        # Mock collection with results - the last is not relevant enough
+        mock_collection = MagicMock()
+        mock_collection.count.return_value = 100
+        mock_collection.query.return_value = {
+            'documents': [["Close doc", "Near doc", "Far doc"]],
+            'distances': [[0.1, 0.4, 0.7]],
+            'ids': None,
+            'metadatas': None
+        }
+        mock_client.get_or_create_collection.return_value = mock_collection
+
+        service = ChromaDBService()
+        service.matrix_search_max_documents = 0  # Query through ChromaDB
+
+        context = await service.get_relevant_context("test query", limit=3, min_relevance=0.6)
+
+        assert context == ["Close doc", "Near doc"]
+        assert mock_collection.query.call_args[1]['include'] == ["documents", "distances"]
+
+    @patch('services.chromadb_service.USEARCH_AVAILABLE', False)
+    @patch('services.chromadb_service.chromadb.HttpClient')
+    @pytest.mark.asyncio
+    async def test_large_knowledge_base_searched_through_chromadb(self, mock_http_client):
+        """Test that a knowledge base too large to scan isn't loaded into memory without usearch"""
+        mock_client = MagicMock()
+        mock_client.heartbeat.return_value = True
+        mock_http_client.return_value = mock_client
+
+        mock_collection = MagicMock()
+        mock_collection.count.return_value = 60000
+        mock_client.get_or_create_collection.return_value = mock_collection
+
+        service = ChromaDBService()
+
+        assert await service._get_knowledge_index() is None
+        mock_collection.get.assert_not_called()
+
+    @patch('services.chromadb_service.chromadb.HttpClient')
+    @pytest.mark.asyncio
+    async def test_search_results_cached_until_knowledge_changes(self, mock_http_client):
+        """Test that a repeated search is served from the cache until a document is added"""
+        mock_client = MagicMock()
+        mock_client.heartbeat.return_value = True
+        mock_http_client.return_value = mock_client
+
+        mock_collection = MagicMock()
+        mock_collection.count.return_value = 100
+        mock_collection.query.return_value = {
+            'documents': [["Document 1"]],
+            'distances': [[0.1]],
+            'ids': [["doc1"]],
+            'metadatas': [[{}]]
+        }
+        mock_client.get_or_create_collection.return_value = mock_collection
+
+        service = ChromaDBService()
+        service.matrix_search_max_documents = 0  # Query through ChromaDB
+        service._embedding_function = MagicMock(return_value=[[1.0, 0.0]])
+
+        first = await service.search_documents("test  query", limit=2)
+        assert await service.search_documents("test query", limit=2) == first
+        assert mock_collection.query.call_count == 1
+
+        # A different limit is a different search
+        await service.search_documents("test query", limit=3)
+        assert mock_collection.query.call_count == 2
+
+        await service.add_document("Document 2")
+        await service.search_documents("test query", limit=2)
+        assert mock_collection.query.call_count == 3
+
+    @patch('services.chromadb_service.chromadb.HttpClient')
+    @pytest.mark.asyncio
+    async def test_concurrent_callers_share_connection_check(self, mock_http_client):
+        """Test that requests arriving while a connection check is due wait for a single heartbeat"""
+        mock_client = MagicMock()
+        mock_http_client.return_value = mock_client
+
+        service = ChromaDBService()
+        mock_client.heartbeat.reset_mock()
+        mock_client.heartbeat.side_effect = lambda: time.sleep(0.05)
+        service._last_connection_check = 0  # Make a connection check due
+
+        results = await asyncio.gather(*(service.check_available() for _ in range(5)))
+
+        assert results == [True] * 5
+        assert mock_client.heartbeat.call_count == 1
+
+    @patch('services.chromadb_service.chromadb.HttpClient')
+    @pytest.mark.asyncio
+    async def test_search_without_matches(self, mock_http_client):
+        """Test that searches with no matches return empty lists without errors"""
+        mock_client = MagicMock()
+        mock_client.heartbeat.return_value = True
+        mock_http_client.return_value = mock_client
+
+        mock_collection = MagicMock()
+        mock_collection.count.return_value = 100
+        mock_collection.query.return_value = {'ids': [[]], 'documents': None, 'metadatas': None, 'distances': None}
+        mock_client.get_or_create_collection.return_value = mock_collection
+
+        service = ChromaDBService()
+        service.matrix_search_max_documents = 0  # Query through ChromaDB
+
+        with patch('services.chromadb_service.logger') as mock_logger:
+            assert await service.search_documents("unknown") == []
+            assert await service.search_conversations("unknown") == []
+            assert await service.search_files("unknown") == []
+        mock_logger.error.assert_not_called()
+
+    @patch('services.chromadb_service.chromadb.HttpClient')
+    @pytest.mark.asyncio
+    async def test_client_calls_run_in_chromadb_executor(self, mock_http_client):
+        """Test that blocking client calls run in the service's own threads"""
+        mock_client = MagicMock()
+        mock_client.heartbeat.return_value = True
+        mock_http_client.return_value = mock_client
+
+        threads = []
+        in_flight = []
+        mock_collection = MagicMock()
+        def add(**kwargs):
+            threads.append(threading.current_thread().name)
+            in_flight.append(service.requests_in_flight)
+        mock_collection.add.side_effect = add
+        mock_client.get_or_create_collection.return_value = mock_collection
+
+        service = ChromaDBService()
+        await service.add_file_content("notes.txt", "content", "text")
+
+        assert len(threads) == 1
+        assert threads[0].startswith("chromadb")
+        assert in_flight == [1]
+        assert service.requests_in_flight == 0
+
+    @patch('services.chromadb_service.chromadb.HttpClient')
+    @pytest.mark.asyncio
+    async def test_concurrent_searches_sent_together(self, mock_http_client):
+        """Test that concurrent searches of a collection are sent as one query, per file type filter"""
+        mock_client = MagicMock()
+        mock_client.heartbeat.return_value = True
+        mock_http_client.return_value = mock_client
+
+        def query(query_texts, n_results, **kwargs):
+            return {
+                'ids': [[f"{text}-id"] for text in query_texts],
+                'documents': [[f"{text} match"] for text in query_texts],
+                'metadatas': [[{}] for _ in query_texts],
+                'distances': [[0.2] for _ in query_texts]
+            }
+        mock_collection = MagicMock()
+        mock_collection.query.side_effect = query
+        mock_client.get_or_create_collection.return_value = mock_collection
+
+        service = ChromaDBService()
+        first, second, third = await asyncio.gather(
+            service.search_conversations("first"),
+            service.search_conversations("second"),
+            service.search_files("third", file_type="pdf")
+        )
+
+        assert [result['content'] for result in first + second + third] == ["first match", "second match", "third match"]
+        calls = sorted((call[1]['query_texts'], call[1]['where']) for call in mock_collection.query.call_args_list)
+        assert calls == [(["first", "second"], None), (["third"], {"file_type": "pdf"})]
+
+    @patch('services.chromadb_service.chromadb.HttpClient')
+    @pytest.mark.asyncio
+    async def test_background_health_checks(self, mock_http_client):
+        """Test that once health checks run in the background, requests don't send heartbeats"""
+        mock_client = MagicMock()
+        mock_http_client.return_value = mock_client
+        mock_client.get_or_create_collection.return_value = MagicMock()
+
+        service = ChromaDBService()
+        service._connection_check_interval = 0.05
+        service.start_health_checks()
+        try:
+            await asyncio.sleep(0.01)
+            mock_client.heartbeat.reset_mock()
+            assert await service.check_available() is True
+            assert service.is_available() is True
+            await service.add_file_content("notes.txt", "content", "text")
+            mock_client.heartbeat.assert_not_called()
+
+            await asyncio.sleep(0.1)
+            assert mock_client.heartbeat.call_count >= 1
+        finally:
+            await service.stop_health_checks()
+        assert service._health_task is None
+
+    @patch('services.chromadb_service.chromadb.HttpClient')
+    @pytest.mark.asyncio
+    async def test_bulk_add_documents_iter(self, mock_http_client):
+        """Test that a bulk add yields the outcome of each batch as it is stored"""
+        mock_client = MagicMock()
+        mock_client.heartbeat.return_value = True
+        mock_http_client.return_value = mock_client
+
+        mock_collection = MagicMock()
+        def add(documents, **kwargs):
+            if "Bad" in documents:
+                raise Exception("Batch rejected")
+        mock_collection.add.side_effect = add
+        mock_client.get_or_create_collection.return_value = mock_collection
+
+        service = ChromaDBService()
+        service._embedding_function = MagicMock(side_effect=lambda texts: [[1.0, 0.0]] * len(texts))
+
+        documents = [{"content": "Good 1"}, {"content": "Good 2"}, {"content": "Bad"}, {"content": "Good 3"}, {"content": "Good 4"}]
+        batches = [batch async for batch in service.bulk_add_documents_iter(documents, batch_size=2, concurrency=2)]
+
+        assert len(batches) == 3
+        assert sorted(len(batch["added_ids"]) for batch in batches) == [0, 1, 2]
+        assert [error for batch in batches for error in batch["errors"]] == ["Batch rejected"]
+
+    @patch('services.chromadb_service.chromadb.HttpClient')
+    def test_collection_stats_counted_concurrently(self, mock_http_client):
+        """Test that the three collection counts are taken at the same time"""
+        mock_client = MagicMock()
+        mock_client.heartbeat.return_value = True
+        mock_http_client.return_value = mock_client
+
+        # Each count only returns once all three are waiting on the server
+        barrier = threading.Barrier(3, timeout=5)
+        def counter(count):
+            def count_fn():
+                barrier.wait()
+                return count
+            return count_fn
+        collections = []
+        for count in (5, 3, 2):
+            collection = MagicMock()
+            collection.count.side_effect = counter(count)
+            collections.append(collection)
+        mock_client.get_or_create_collection.side_effect = collections
+
+        service = ChromaDBService()
+        stats = service.get_collection_stats()
+
+        assert stats['available'] is True
+        assert stats['total_documents'] == 10
+
+    def test_clean_metadata(self):
+        """Test that None values are dropped from metadata, copying it only when there are any"""
+        clean = {"source": "test", "chunk_index": 0}
+        assert _clean_metadata(clean) is clean
+        assert _clean_metadata({"source": "test", "filename": None}) == {"source": "test"}
+        assert _clean_metadata(None) == {}
+
+    def test_rows_within_threshold_stop_at_first_beyond(self):
+        """Test that rows are read nearest first only up to the first one beyond the threshold"""
+        results = {
+            'ids': [["doc1", "doc2", "doc3"]],
+            'documents': [["Near", "Far", "Unread"]],
+            'metadatas': [[{}, {}, {}]],
+            'distances': [[0.1, 0.9, 0.2]]  # Out of order only to show the last row isn't looked at
+        }
+
+        assert [row[0] for row in ChromaDBService._rows_within(results, 0.5)] == ["doc1"]
+        assert [row[0] for row in ChromaDBService._rows_within(results, None)] == ["doc1", "doc2", "doc3"]
+
+    @patch('services.chromadb_service.chromadb.HttpClient')
+    def test_collections_created_concurrently(self, mock_http_client):
+        """Test that the three collections are requested at the same time"""
+        mock_client = MagicMock()
+        mock_client.heartbeat.return_value = True
+        mock_http_client.return_value = mock_client
+
+        # Each request only returns once all three are waiting on the server
+        barrier = threading.Barrier(3, timeout=5)
+        def get_or_create_collection(name, **kwargs):
+            barrier.wait()
+            return MagicMock(name=name)
+        mock_client.get_or_create_collection.side_effect = get_or_create_collection
+
+        service = ChromaDBService()
+
+        assert service.is_available() is True
+        assert service.files_collection is not service.collection
+
+    @patch('services.chromadb_service.chromadb.HttpClient')
+    def test_collection_stats_reuse_connection_check(self, mock_http_client):
+        """Test that collection stats don't send another heartbeat"""
+        mock_client = MagicMock()
+        mock_http_client.return_value = mock_client
+        mock_collection = MagicMock()
+        mock_collection.count.return_value = 1
+        mock_client.get_or_create_collection.return_value = mock_collection
+
+        service = ChromaDBService()
+        mock_client.heartbeat.reset_mock()
+        service._last_connection_check = 0  # Make a connection check due
+
+        assert service.get_collection_stats()['total_documents'] == 3
+        mock_client.heartbeat.assert_not_called()
+
+        service.client = None
+        assert service.get_collection_stats()['available'] is False
+
+    @patch('services.chromadb_service.chromadb.HttpClient')
+    @pytest.mark.asyncio
+    async def test_conversation_and_file_searches_cached_until_added_to(self, mock_http_client):
+        """Test that repeated conversation and file searches are answered from memory until a write"""
+        mock_client = MagicMock()
+        mock_client.heartbeat.return_value = True
+        mock_http_client.return_value = mock_client
+
+        mock_conversations_collection = MagicMock()
+        mock_conversations_collection.query.return_value = {
+            'ids': [["conv1"]], 'documents': [["user: hi"]], 'metadatas': [[{}]], 'distances': [[0.2]]
+        }
+        mock_files_collection = MagicMock()
+        mock_files_collection.query.return_value = {
+            'ids': [["file1"]], 'documents': [["File content"]], 'metadatas': [[{}]], 'distances': [[0.3]]
+        }
+        mock_client.get_or_create_collection.side_effect = collections_by_name(
+            MagicMock(), mock_conversations_collection, mock_files_collection
+        )
+
+        service = ChromaDBService()
+
+        first = await service.search_conversations("greeting")
+        assert await service.search_conversations("  greeting ") == first
+        assert await service.search_files("content", file_type="txt") == await service.search_files("content", file_type="txt")
+        assert mock_conversations_collection.query.call_count == 1
+        assert mock_files_collection.query.call_count == 1
+
+        # A different file type filter is a different search
+        await service.search_files("content", file_type="pdf")
+        assert mock_files_collection.query.call_count == 2
+
+        await service.add_conversation_context("conv2", [{"role": "user", "content": "hello"}])
+        await service.add_file_content("notes.txt", "More content", "txt")
+        await service.search_conversations("greeting")
+        await service.search_files("content", file_type="txt")
+        assert mock_conversations_collection.query.call_count == 2
+        assert mock_files_collection.query.call_count == 3
+
+        # Failed searches aren't cached
+        mock_conversations_collection.query.side_effect = Exception("Server error")
+        assert await service.search_conversations("failing") == []
+        mock_conversations_collection.query.side_effect = None
+        assert len(await service.search_conversations("failing")) == 1
+
 if __name__ == "__main__":
     pytest.main([__file__])
\ No newline at end of file
@@ -0,0 +1,178 @@
+import pytest
+import os
+import sys
+import time
+sys.path.append('..')
+
+from services.code_execution_service import CodeExecutionService, MAX_OUTPUT_BYTES, RESOURCE_LIMITS_AVAILABLE
+from utils.sandbox import sandbox_support
+
+requires_sandbox = pytest.mark.skipif(sandbox_support() is not None, reason="no sandbox support")
+
+class TestCodeExecutionService:
+    """Test suite for language detection, the code checks and sandboxed execution"""
+
+    def setup_method(self):
+        self.service = CodeExecutionService()
+
+    def teardown_method(self):
+        self.service.cleanup()
+
+    def test_detect_language(self):
+        """Test that the language with the most indicators is detected"""
+        assert self.service.detect_language("import math\nprint(math.pi)") == 'python'
+        assert self.service.detect_language("const x = 1;\nconsole.log(x);") == 'javascript'
+        assert self.service.detect_language("#!/bin/bash\necho $HOME") == 'bash'
+        assert self.service.detect_language("1 + 1") == 'python'
+
+    def test_detect_language_from_decisive_markers(self):
+        """Test that a shebang or a decisive marker settles the language regardless of other indicators"""
+        assert self.service.detect_language("#!/usr/bin/env python3\necho = 1\nexport = 2") == 'python'
+        assert self.service.detect_language("#!/bin/sh\nimport_dir=$1\nprint() { echo $1; }") == 'bash'
+        assert self.service.detect_language("#!/usr/bin/env node\nprint(1)") == 'javascript'
+        assert self.service.detect_language("def main():\n    echo = '$HOME'\n    export = 1") == 'python'
+
+    def test_security_check_allows_plain_code(self):
+        """Test that code within the size limit passes, whatever it does; the sandbox confines it"""
+        assert self.service._check_code_security("print(sum(range(10)))", 'python') == {"safe": True}
+        assert self.service._check_code_security("import os\nos.remove('x')", 'python') == {"safe": True}
+
+    def test_security_check_rejects_long_code(self):
+        """Test the 10KB length limit"""
+        result = self.service._check_code_security("x = 1\n" * 2000, 'python')
+        assert result == {"safe": False, "reason": "Code too long (max 10KB)"}
+
+    @requires_sandbox
+    def test_execution_writes_no_files(self):
+        """Test that a bash snippet runs without leaving anything in the temp directory"""
+        result = self.service._execute_code_sync("echo hi", 'bash', 10)
+        assert result["success"] is True
+        assert result["stdout"] == "hi\n"
+        assert os.listdir(self.service.temp_dir) == []
+
+    @requires_sandbox
+    @pytest.mark.parametrize("language,code", [
+        ('python', "print(6 * 7)"),
+        ('javascript', "console.log(6 * 7)"),
+        ('bash', "echo $((6 * 7))"),
+    ])
+    def test_execution_pipes_code_through_stdin(self, language, code):
+        """Test that each runtime runs the code it is fed on stdin"""
+        if not self.service.get_language_availability()[language]:
+            pytest.skip(f"{language} runtime not installed")
+        result = self.service._execute_code_sync(code, language, 10)
+        assert result["success"] is True
+        assert result["stdout"] == "42\n"
+        assert result["output_truncated"] is False
+        assert result["return_code"] == 0
+
+    @requires_sandbox
+    @pytest.mark.skipif(not RESOURCE_LIMITS_AVAILABLE, reason="prlimit not available")
+    def test_execution_memory_limit(self):
+        """Test that a snippet can't allocate past the memory limit"""
+        result = self.service._execute_code_sync("x = bytearray(1024 ** 3)", 'python', 10)
+        assert result["success"] is True
+        assert result["return_code"] != 0
+        assert "MemoryError" in result["stderr"]
+
+    @requires_sandbox
+    def test_execution_timeout_kills_process_group(self):
+        """Test that a snippet running past its timeout is killed along with its children"""
+        start = time.monotonic()
+        result = self.service._execute_code_sync("sleep 30 &\nsleep 30", 'bash', 1)
+        assert result == {
+            "success": False,
+            "error": "Code execution timed out after 1 seconds",
+            "language": 'bash',
+            "timeout": 1
+        }
+        assert time.monotonic() - start < 10
+
+    @requires_sandbox
+    def test_execution_timeout_kills_process_ignoring_sigterm(self):
+        """Test that a snippet trapping SIGTERM doesn't outlive its timeout"""
+        start = time.monotonic()
+        result = self.service._execute_code_sync("trap '' TERM\nsleep 30", 'bash', 1)
+        assert result["error"] == "Code execution timed out after 1 seconds"
+        assert time.monotonic() - start < 10
+
+    @requires_sandbox
+    def test_execution_caps_output(self):
+        """Test that a snippet printing past the output limit is stopped and its output cut off"""
+        start = time.monotonic()
+        result = self.service._execute_code_sync("yes", 'bash', 10)
+        assert result["success"] is True
+        assert result["output_truncated"] is True
+        assert len(result["stdout"]) == MAX_OUTPUT_BYTES
+        assert result["stdout"].startswith("y\ny\n")
+        assert time.monotonic() - start < 5
+
+    @requires_sandbox
+    @pytest.mark.parametrize("language,code", [
+        ('python', "print(open('/etc/hostname').read() != '')\nopen('{outside}', 'w')"),
+        ('javascript', "const fs = require('fs')\nconsole.log(fs.readFileSync('/etc/hostname', 'utf8') !== '')\n"
+                       "fs.writeFileSync('{outside}', 'x')"),
+        ('bash', "test -r /etc/hostname && echo True\necho x > '{outside}'"),
+    ])
+    def test_sandbox_confines_filesystem(self, language, code, tmp_path):
+        """Test that snippets can read system files and their working directory, but write nowhere else"""
+        if not self.service.get_language_availability()[language]:
+            pytest.skip(f"{language} runtime not installed")
+        outside = tmp_path / "outside.txt"
+        result = self.service._execute_code_sync(code.format(outside=outside), language, 10)
+        assert result["stdout"].lower() == "true\n"
+        assert result["return_code"] != 0
+        assert not outside.exists()
+
+    @requires_sandbox
+    def test_sandbox_hides_server_files_and_environment(self, monkeypatch):
+        """Test that a snippet can't read the server's code or secrets in its environment"""
+        monkeypatch.setenv("OPENAI_API_KEY", "secret")
+        code = ("import os\n"
+                "open('scratch.txt', 'w').write('ok')\n"
+                "print(open('scratch.txt').read(), os.environ.get('OPENAI_API_KEY'))\n"
+                f"open({os.path.abspath(__file__)!r}).read()")
+        result = self.service._execute_code_sync(code, 'python', 10)
+        assert result["stdout"] == "ok None\n"
+        assert "PermissionError" in result["stderr"]
+
+    @requires_sandbox
+    def test_sandbox_blocks_network(self):
+        """Test that a snippet can open neither TCP nor UDP sockets"""
+        code = ("import socket\n"
+                "for kind in (socket.SOCK_STREAM, socket.SOCK_DGRAM):\n"
+                "    try:\n"
+                "        socket.socket(socket.AF_INET, kind)\n"
+                "        print('allowed')\n"
+                "    except PermissionError:\n"
+                "        print('blocked')\n"
+                "import urllib.request\n"
+                "urllib.request.urlopen('http://127.0.0.1:9', timeout=2)")
+        result = self.service._execute_code_sync(code, 'python', 10)
+        assert result["stdout"] == "blocked\nblocked\n"
+        assert "Permission denied" in result["stderr"]
+
+    def test_execution_refused_without_sandbox(self):
+        """Test that nothing is run when no sandbox can be set up"""
+        self.service.sandbox_unavailable_reason = "Landlock is not supported by the kernel"
+        result = self.service._execute_code_sync("print(1)", 'python', 10)
+        assert result == {
+            "success": False,
+            "error": "Code execution sandbox unavailable: Landlock is not supported by the kernel",
+            "language": 'python'
+        }
+        assert self.service.get_service_status()["available"] is False
+
+    def test_executor_size(self, monkeypatch):
+        """Test that the worker count comes from the argument, then CODE_EXECUTION_WORKERS"""
+        monkeypatch.setenv("CODE_EXECUTION_WORKERS", "6")
+        for max_workers, expected in ((3, 3), (None, 6)):
+            service = CodeExecutionService(max_workers=max_workers)
+            try:
+                assert service.max_workers == expected
+                assert service.executor._max_workers == expected
+            finally:
+                service.cleanup()
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -10,29 +10,34 @@ import sys
 sys.path.append('..')
 
 from main import app
-from api.conversations import load_conversations, save_conversations
+from api.conversations import load_conversations, save_conversations, append_to_journal
 
 class TestConversationsAPI:
     """Test suite for conversations API endpoints"""
     
     def setup_method(self):
-        """Set up test client and temporary file"""
+        """Set up test client and temporary storage files"""
         self.client = TestClient(app)
         # Create a temporary directory for test files
         self.test_dir = tempfile.mkdtemp()
-        self.original_conversations_file = 'conversations.json'
+        # Keep the snapshot, the journal and the cache of them away from the
+        # real ones in the working directory
+        self.patches = [
+            patch('api.conversations.CONVERSATIONS_FILE', os.path.join(self.test_dir, 'conversations.json')),
+            patch('api.conversations.CONVERSATIONS_JOURNAL', os.path.join(self.test_dir, 'conversations.jsonl')),
+            patch.dict('api.conversations._CACHE', {"path": None, "signature": None, "data": None, "journal_entries": 0}),
+            patch('api.conversations._BY_ID', {})
+        ]
+        for p in self.patches:
+            p.start()
         
     def teardown_method(self):
         """Clean up after each test"""
+        for p in reversed(self.patches):
+            p.stop()
         # Clean up temporary directory
         if os.path.exists(self.test_dir):
             shutil.rmtree(self.test_dir)
-        # Clean up test conversations file
-        if os.path.exists('test_conversations.json'):
-            os.remove('test_conversations.json')
-        # Clean up any conversations.json that might be a directory
-        if os.path.exists('conversations.json') and os.path.isdir('conversations.json'):
-            shutil.rmtree('conversations.json')
     
     def test_get_conversations_empty(self):
         """Test getting conversations when none exist"""
@@ -42,6 +47,27 @@ class TestConversationsAPI:
         assert "conversations" in data
         assert isinstance(data["conversations"], list)
     
+    def test_get_conversations_returns_summaries(self):
+        """Test that the conversation list carries metadata but not message histories"""
+        create_response = self.client.post(
+            "/api/conversations/",
+            json={"title": "Summary"}
+        )
+        conv_id = create_response.json()["conversation"]["id"]
+        long_message = "x" * 200
+        self.client.post(
+            f"/api/conversations/{conv_id}/messages",
+            json={"role": "user", "content": long_message}
+        )
+        
+        response = self.client.get("/api/conversations/")
+        summary = next(c for c in response.json()["conversations"] if c["id"] == conv_id)
+        assert "messages" not in summary
+        assert summary["message_count"] == 1
+        assert summary["last_message_preview"] == long_message[:80]
+        assert summary["title"] == long_message[:50] + "..."
+        assert "created_at" in summary and "updated_at" in summary
+    
     def test_create_conversation(self):
         """Test creating a new conversation"""
         response = self.client.post(
@@ -157,6 +183,65 @@ class TestConversationsAPI:
         conv_data = conv_response.json()["conversation"]
         assert conv_data["title"] == message_content  # Should be the full message since it's under 50 chars
     
+    def test_add_message_persists_context(self):
+        """Test that RAG/search context sent with a message is stored with it"""
+        create_response = self.client.post(
+            "/api/conversations/",
+            json={"title": "Context"}
+        )
+        conv_id = create_response.json()["conversation"]["id"]
+        
+        sources = [{"type": "knowledge", "metadata": {"source": "docs"}, "relevance": 0.9}]
+        self.client.post(
+            f"/api/conversations/{conv_id}/messages",
+            json={"role": "assistant", "content": "Answer", "context_sources": sources, "rag_used": True, "search_used": False}
+        )
+        self.client.post(
+            f"/api/conversations/{conv_id}/messages",
+            json={"role": "user", "content": "Thanks"}
+        )
+        
+        messages = self.client.get(f"/api/conversations/{conv_id}").json()["conversation"]["messages"]
+        assert messages[0]["context_sources"] == sources
+        assert messages[0]["rag_used"] is True
+        assert messages[0]["search_used"] is False
+        assert "context_sources" not in messages[1]
+    
+    def test_conversation_ids_unique(self):
+        """Test that conversations created back to back get distinct ids"""
+        ids = {
+            self.client.post("/api/conversations/", json={"title": f"Conversation {i}"}).json()["conversation"]["id"]
+            for i in range(5)
+        }
+        assert len(ids) == 5
+        assert all(conv_id.startswith("conv_") for conv_id in ids)
+    
+    def test_timestamps_stored_as_iso_strings(self):
+        """Test that timestamps are kept as ISO-8601 strings in memory and on disk"""
+        create_response = self.client.post(
+            "/api/conversations/",
+            json={"title": "Timestamps"}
+        )
+        conv_id = create_response.json()["conversation"]["id"]
+        self.client.post(
+            f"/api/conversations/{conv_id}/messages",
+            json={"role": "user", "content": "Hello"}
+        )
+        
+        conversation = next(c for c in load_conversations() if c['id'] == conv_id)
+        assert isinstance(conversation['created_at'], str)
+        assert isinstance(conversation['messages'][0]['timestamp'], str)
+        assert conversation['updated_at'] == conversation['messages'][0]['timestamp']
+        assert datetime.fromisoformat(conversation['updated_at']) >= datetime.fromisoformat(conversation['created_at'])
+    
+    def test_message_model_timestamp_default(self):
+        """Test that the Message model's timestamp default is evaluated per instance"""
+        from api.conversations import Message
+        
+        first = Message(role="user", content="a")
+        second = Message(role="user", content="b")
+        assert first.timestamp is not second.timestamp
+    
     def test_conversation_title_truncation(self):
         """Test that long conversation titles are truncated"""
         # Create a conversation
@@ -179,6 +264,27 @@ class TestConversationsAPI:
         assert len(conv_data["title"]) == 53  # 50 chars + "..."
         assert conv_data["title"].endswith("...")
         assert conv_data["title"].startswith("This is a very long message")
+    
+    def test_failed_journal_write_leaves_cache_unchanged(self):
+        """Test that a change whose journal write fails isn't kept in memory"""
+        create_response = self.client.post("/api/conversations/", json={"title": "Kept"})
+        conv_id = create_response.json()["conversation"]["id"]
+        ids_before = [conv['id'] for conv in load_conversations()]
+        
+        with patch('api.conversations.append_to_journal', side_effect=OSError("disk full")):
+            with pytest.raises(OSError):
+                self.client.post(f"/api/conversations/{conv_id}/messages",
+                                 json={"role": "user", "content": "Lost"})
+            with pytest.raises(OSError):
+                self.client.post("/api/conversations/", json={"title": "Lost"})
+            with pytest.raises(OSError):
+                self.client.delete(f"/api/conversations/{conv_id}")
+        
+        conversation = self.client.get(f"/api/conversations/{conv_id}").json()["conversation"]
+        assert conversation["title"] == "Kept"
+        assert conversation["messages"] == []
+        assert conversation["last_message_preview"] == ""
+        assert [conv['id'] for conv in load_conversations()] == ids_before
 
 class TestConversationsFileHandling:
     """Test suite for conversation file handling and directory issue prevention"""
@@ -257,18 +363,88 @@ class TestConversationsFileHandling:
         save_conversations(test_conversations)
         loaded_conversations = load_conversations()
         
-        # Verify data integrity
-        assert len(loaded_conversations) == 1
-        conv = loaded_conversations[0]
+        # Loading right after saving is served from the write-through cache
+        assert loaded_conversations == test_conversations
+        
+        # Verify data integrity on disk
+        with open('conversations.json', 'r') as f:
+            stored_conversations = json.load(f)
+        assert len(stored_conversations) == 1
+        conv = stored_conversations[0]
         assert conv['id'] == 'test_conv_1'
         assert conv['title'] == 'Test Conversation'
-        assert isinstance(conv['created_at'], datetime)
-        assert isinstance(conv['updated_at'], datetime)
+        # Timestamps are stored as ISO-8601 strings
+        assert conv['created_at'] == original_time.isoformat()
+        assert conv['updated_at'] == original_time.isoformat()
         assert len(conv['messages']) == 1
         msg = conv['messages'][0]
         assert msg['role'] == 'user'
         assert msg['content'] == 'Hello'
-        assert isinstance(msg['timestamp'], datetime)
+        assert datetime.fromisoformat(msg['timestamp']) == original_time
+    
+    def test_load_conversations_detects_external_changes(self):
+        """Test that the in-memory cache is refreshed when the file changes on disk"""
+        save_conversations([{
+            'id': 'cached',
+            'title': 'Cached',
+            'created_at': datetime.now(),
+            'updated_at': datetime.now(),
+            'messages': []
+        }])
+        assert [conv['id'] for conv in load_conversations()] == ['cached']
+        
+        # Rewrite the file behind the cache's back
+        with open('conversations.json', 'w') as f:
+            json.dump([{'id': 'external', 'title': 'External', 'created_at': '2024-01-01T00:00:00',
+                        'updated_at': '2024-01-01T00:00:00', 'messages': []},
+                       {'id': 'second', 'title': 'Second', 'created_at': '2024-01-01T00:00:00',
+                        'updated_at': '2024-01-01T00:00:00', 'messages': []}], f)
+        
+        assert [conv['id'] for conv in load_conversations()] == ['external', 'second']
+    
+    def test_load_conversations_replays_journal(self):
+        """Test that journal entries are applied on top of the snapshot"""
+        save_conversations([{
+            'id': 'base',
+            'title': 'Base',
+            'created_at': '2024-01-01T00:00:00',
+            'updated_at': '2024-01-01T00:00:00',
+            'messages': []
+        }])
+        
+        entries = [
+            {'op': 'create', 'conversation': {'id': 'new', 'title': 'New', 'created_at': '2024-01-02T00:00:00',
+                                              'updated_at': '2024-01-02T00:00:00', 'messages': []}},
+            {'op': 'message', 'id': 'base', 'message': {'role': 'user', 'content': 'Hi', 'timestamp': '2024-01-03T00:00:00'},
+             'updated_at': '2024-01-03T00:00:00', 'title': 'Hi'},
+            {'op': 'delete', 'id': 'new'}
+        ]
+        with open('conversations.jsonl', 'w') as f:
+            for entry in entries:
+                f.write(json.dumps(entry) + "\n")
+            f.write('{"op": "create", "conver')  # torn final line
+        
+        conversations = load_conversations()
+        assert [conv['id'] for conv in conversations] == ['base']
+        assert conversations[0]['title'] == 'Hi'
+        assert conversations[0]['updated_at'] == '2024-01-03T00:00:00'
+        assert conversations[0]['messages'][0]['content'] == 'Hi'
+    
+    def test_journal_compaction(self):
+        """Test that the journal is folded into the snapshot once it grows too long"""
+        save_conversations([])
+        conversations = load_conversations()
+        
+        with patch('api.conversations.JOURNAL_COMPACT_THRESHOLD', 2):
+            for conv_id in ('first', 'second'):
+                conversation = {'id': conv_id, 'title': conv_id, 'created_at': '2024-01-01T00:00:00',
+                                'updated_at': '2024-01-01T00:00:00', 'messages': []}
+                conversations.append(conversation)
+                append_to_journal({'op': 'create', 'conversation': conversation})
+        
+        assert os.path.getsize('conversations.jsonl') == 0
+        with open('conversations.json', 'r') as f:
+            assert [conv['id'] for conv in json.load(f)] == ['first', 'second']
     
     def test_save_conversations_error_handling(self):
         """Test error handling in save_conversations"""
@@ -0,0 +1,61 @@
+import pytest
+import numpy as np
+import sys
+sys.path.append('..')
+
+from services.embedding_cache import EmbeddingCache
+
+class TestEmbeddingCache:
+    """Test suite for the query embedding cache"""
+
+    def test_get_and_put(self):
+        """Test that a cached embedding is returned as a float32 vector"""
+        cache = EmbeddingCache()
+        assert cache.get("hello") is None
+
+        cache.put("hello", [0.1, 0.2, 0.3])
+        vector = cache.get("hello")
+
+        assert vector.dtype == np.float32
+        assert vector.tolist() == pytest.approx([0.1, 0.2, 0.3])
+
+    def test_least_recently_used_entry_is_evicted(self):
+        """Test LRU eviction from memory"""
+        cache = EmbeddingCache(maxsize=2)
+        cache.put("a", [1.0])
+        cache.put("b", [2.0])
+        cache.get("a")
+        cache.put("c", [3.0])
+
+        assert len(cache) == 2
+        assert cache.get("b") is None
+        assert cache.get("a") is not None
+
+    def test_entries_persist_across_instances(self, tmp_path):
+        """Test that embeddings written to SQLite are loaded by a new cache"""
+        path = str(tmp_path / "embeddings.sqlite")
+        cache = EmbeddingCache(path=path)
+        cache.put("hello", [0.1, 0.2, 0.3])
+        cache.close()
+
+        reopened = EmbeddingCache(path=path)
+        assert reopened.get("hello", memory_only=True).tolist() == pytest.approx([0.1, 0.2, 0.3])
+        reopened.close()
+
+    def test_evicted_entries_read_from_disk(self, tmp_path):
+        """Test that entries no longer in memory are still served from SQLite"""
+        cache = EmbeddingCache(path=str(tmp_path / "embeddings.sqlite"), maxsize=1)
+        cache.put("a", [1.0])
+        cache.put("b", [2.0])
+
+        assert cache.get("a", memory_only=True) is None
+        assert cache.get("a").tolist() == [1.0]
+        cache.close()
+
+    def test_model_is_part_of_the_key(self):
+        """Test that embeddings from different models don't collide"""
+        cache = EmbeddingCache(model="model-a")
+        cache.put("hello", [1.0])
+        other = EmbeddingCache(model="model-b")
+
+        assert cache._key("hello") != other._key("hello")
@@ -0,0 +1,60 @@
+import pytest
+import threading
+import time
+import uuid
+import sys
+sys.path.append('..')
+
+from utils.ids import new_ids
+
+class TestNewIds:
+    """Test suite for the document id generator"""
+
+    def test_valid_uuid7(self):
+        """Test that ids are RFC 9562 version 7 UUIDs stamped with the current time"""
+        before = time.time_ns() // 1_000_000
+        ids = new_ids(3)
+        after = time.time_ns() // 1_000_000
+
+        for doc_id in ids:
+            parsed = uuid.UUID(doc_id)
+            assert str(parsed) == doc_id
+            assert parsed.version == 7
+            assert parsed.variant == uuid.RFC_4122
+            assert before <= parsed.int >> 80 <= after
+
+    def test_batch_ordered_and_unique(self):
+        """Test that a batch, including one past the 12-bit counter, sorts in generation order"""
+        ids = new_ids(5000)
+
+        assert ids == sorted(ids)
+        assert len(set(ids)) == 5000
+        assert len(set(new_ids(100)) | set(new_ids(100))) == 200
+
+    def test_ordered_across_calls(self):
+        """Test that ids from consecutive calls, in the same millisecond or after an overflowing batch, keep sorting in order"""
+        ids = [doc_id for _ in range(10000) for doc_id in new_ids(1)]
+        assert ids == sorted(ids)
+
+        # This batch runs past the 12-bit counter into later milliseconds
+        batch = new_ids(10000)
+        following = new_ids(2)
+        assert batch[-1] < following[0] < following[1]
+
+    def test_ordered_across_threads(self):
+        """Test that concurrent callers never get overlapping sequence numbers"""
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(new_ids(500))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # Each batch covers its own contiguous stretch of the sequence
+        batches = sorted(results)
+        for earlier, later in zip(batches, batches[1:]):
+            assert earlier[-1] < later[0]
+        assert len({doc_id for batch in results for doc_id in batch}) == 4000
+
+if __name__ == "__main__":
+    pytest.main([__file__])
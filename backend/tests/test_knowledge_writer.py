@@ -0,0 +1,59 @@
+import pytest
+import asyncio
+from unittest.mock import AsyncMock, call
+import sys
+sys.path.append('..')
+
+from services.knowledge_writer import KnowledgeWriter
+
+class TestKnowledgeWriter:
+    """Test suite for the write-behind knowledge queue"""
+
+    def setup_method(self):
+        """Set up the batch write function the queue writes through"""
+        self.write_fn = AsyncMock()
+
+    @pytest.mark.asyncio
+    async def test_submissions_written_together(self):
+        """Test that documents submitted close together are stored in one call under the returned ids"""
+        writer = KnowledgeWriter(self.write_fn, max_wait_seconds=0.01)
+
+        first = writer.submit(["a"], [{"n": 1}])
+        second = writer.submit(["b", "c"], [{}, {}])
+        self.write_fn.assert_not_called()
+        assert writer.pending == 3
+
+        await asyncio.sleep(0.05)
+
+        assert self.write_fn.call_args_list == [call(["a", "b", "c"], [{"n": 1}, {}, {}], first + second)]
+        assert len(set(first + second)) == 3
+        assert writer.pending == 0
+
+    @pytest.mark.asyncio
+    async def test_full_batches_split(self):
+        """Test that a submission larger than the batch size is written in several calls"""
+        writer = KnowledgeWriter(self.write_fn, max_batch_size=2, max_wait_seconds=10)
+
+        ids = writer.submit(["a", "b", "c"], [{}, {}, {}])
+        await writer.flush()
+
+        assert self.write_fn.call_args_list == [
+            call(["a", "b"], [{}, {}], ids[:2]),
+            call(["c"], [{}], ids[2:])
+        ]
+
+    @pytest.mark.asyncio
+    async def test_failed_write_counted(self):
+        """Test that a failed write is recorded rather than raised"""
+        self.write_fn.side_effect = RuntimeError("ChromaDB unavailable")
+        writer = KnowledgeWriter(self.write_fn)
+
+        writer.submit(["a", "b"], [{}, {}])
+        await writer.flush()
+
+        self.write_fn.assert_awaited_once()
+        assert writer.failed_writes == 2
+        assert writer.pending == 0
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,239 @@
+import pytest
+import asyncio
+import httpx
+import json
+import threading
+import time
+from types import SimpleNamespace
+from unittest.mock import patch, AsyncMock, MagicMock
+import sys
+sys.path.append('..')
+
+import api.models as models_api
+from api.dependencies import get_chroma, get_rag
+from services.rag_service import RAGService
+from services.response_cache import ResponseCache
+from services.web_search_service import WebSearchService
+
+class TestModelsCache:
+    """Test suite for the cached Ollama model list"""
+
+    def setup_method(self):
+        """Start each test with an empty cache and an Ollama client whose /api/tags returns one more model on every call"""
+        models_api._models_cache.update({"models": None, "expires": 0.0, "refreshing": False})
+        self.handler = MagicMock(side_effect=lambda request: httpx.Response(
+            200, json={"models": [{"name": f"model{self.handler.call_count}"}]}))
+        self.client = httpx.AsyncClient(transport=httpx.MockTransport(self.handler))
+
+    @pytest.mark.asyncio
+    async def test_models_served_from_cache(self):
+        """Test that the model list is only fetched once within the TTL"""
+        first = await models_api.get_ollama_models(self.client)
+        second = await models_api.get_ollama_models(self.client)
+
+        assert first == second == {"models": [{"name": "model1"}]}
+        self.handler.assert_called_once()
+        assert self.handler.call_args.args[0].url.path == "/api/tags"
+
+    @pytest.mark.asyncio
+    async def test_models_refreshed_in_background_near_expiry(self):
+        """Test stale-while-revalidate: the cached list is returned while a refresh runs"""
+        await models_api.get_ollama_models(self.client)
+        # Move the entry into the refresh window
+        models_api._models_cache["expires"] -= models_api.MODELS_CACHE_TTL - 1
+
+        result = await models_api.get_ollama_models(self.client)
+        assert result == {"models": [{"name": "model1"}]}
+
+        # Let the background refresh finish
+        for _ in range(10):
+            await asyncio.sleep(0)
+            if not models_api._models_cache["refreshing"]:
+                break
+        assert (await models_api.get_ollama_models(self.client)) == {"models": [{"name": "model2"}]}
+
+        assert self.handler.call_count == 2
+
+    @pytest.mark.asyncio
+    async def test_models_error_not_cached(self):
+        """Test that an error response from Ollama is not cached"""
+        client = httpx.AsyncClient(transport=httpx.MockTransport(lambda request: httpx.Response(500)))
+        result = await models_api.get_ollama_models(client)
+
+        assert result["models"] == []
+        assert "error" in result
+        assert models_api._models_cache["models"] is None
+
+class TestChatContext:
+    """Test suite for context gathering in the chat endpoint"""
+
+    def setup_method(self):
+        """Set up the chat endpoint services around a mock ChromaDB service"""
+        chroma = MagicMock(knowledge_version=0)
+        chroma.check_available = AsyncMock(return_value=False)
+        chroma.embed_query = AsyncMock(return_value=None)
+        self.services = {
+            "chroma": chroma,
+            "rag": RAGService(chroma),
+            "web_search": WebSearchService(),
+            "response_cache": ResponseCache()
+        }
+
+    @pytest.mark.asyncio
+    async def test_web_search_and_rag_run_concurrently(self):
+        """Test that web search and RAG overlap and are combined into one prompt"""
+        search_started = asyncio.Event()
+        rag_started = asyncio.Event()
+
+        async def auto_search(query):
+            search_started.set()
+            await asyncio.wait_for(rag_started.wait(), timeout=1)
+            return {"search_performed": True, "results": [{"title": "T", "url": "u", "snippet": "S"}]}
+
+        async def augment_prompt(query, history, conversation_id=None, query_embedding=None):
+            rag_started.set()
+            await asyncio.wait_for(search_started.wait(), timeout=1)
+            assert query == "What is Python?"
+            return {
+                "rag_available": True,
+                "context_text": "Knowledge: Python is a language",
+                "sources": [{"type": "knowledge", "id": "doc1", "metadata": {}, "relevance": 0.8}]
+            }
+
+        sent = []
+        def handler(request):
+            sent.append(json.loads(request.content))
+            return httpx.Response(200, json={"message": {"role": "assistant", "content": "Hi"}})
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+        self.services["chroma"].check_available.return_value = True
+        with patch.object(self.services["web_search"], 'auto_search', auto_search), \
+             patch.object(self.services["rag"], 'augment_prompt', augment_prompt), \
+             patch.object(models_api, '_store_conversation_context', AsyncMock()):
+            result = await models_api.chat_with_model(
+                {"messages": [{"role": "user", "content": "What is Python?"}]}, client, **self.services)
+
+        prompt = sent[0]["messages"][-1]["content"]
+        assert "Knowledge: Python is a language" in prompt
+        assert "Web result: T - S" in prompt
+        assert [s["type"] for s in result["context_sources"]] == ["web_search", "knowledge"]
+        assert result["rag_used"] and result["search_used"]
+
+    @pytest.mark.asyncio
+    async def test_repeated_question_served_from_response_cache(self):
+        """Test that an identical question is answered without calling Ollama again"""
+        sent = []
+        def handler(request):
+            sent.append(request)
+            return httpx.Response(200, json={"message": {"role": "assistant", "content": "4"}})
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        request = {"messages": [{"role": "user", "content": "What is 2+2?"}], "use_rag": False, "auto_search": False}
+
+        with patch.object(models_api, '_store_conversation_context', AsyncMock()):
+            first = await models_api.chat_with_model(request, client, **self.services)
+            second = await models_api.chat_with_model(
+                {**request, "messages": [{"role": "user", "content": "  what is 2+2? "}]}, client, **self.services)
+
+        assert len(sent) == 1
+        assert second["message"] == first["message"]
+        assert second["cached"] is True
+
+    @pytest.mark.asyncio
+    async def test_streamed_reply_cached(self):
+        """Test that a streamed reply is cached and replayed as a single final chunk"""
+        sent = []
+        def handler(request):
+            sent.append(request)
+            chunks = [
+                {"message": {"role": "assistant", "content": "Hel"}, "done": False},
+                {"message": {"role": "assistant", "content": "lo"}, "done": False},
+                {"message": {"role": "assistant", "content": ""}, "done": True}
+            ]
+            return httpx.Response(200, content="".join(json.dumps(c) + "\n" for c in chunks))
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        request = {"messages": [{"role": "user", "content": "Say hello"}],
+                   "use_rag": False, "auto_search": False, "stream": True}
+
+        async def read_chunks(response):
+            return [json.loads(line) async for chunk in response.body_iterator for line in chunk.splitlines()]
+
+        with patch.object(models_api, '_store_conversation_context', AsyncMock()) as store:
+            first = await read_chunks(await models_api.chat_with_model(request, client, **self.services))
+            second = await read_chunks(await models_api.chat_with_model(request, client, **self.services))
+
+        assert len(sent) == 1
+        assert [c["message"]["content"] for c in first] == ["Hel", "lo", ""]
+        assert first[-1]["done"] and first[-1]["rag_used"] is False
+        assert len(second) == 1
+        assert second[0]["message"]["content"] == "Hello"
+        assert second[0]["done"] and second[0]["cached"]
+        stored = store.call_args_list[0].args[2]
+        assert stored[-1] == {"role": "assistant", "content": "Hello"}
+
+class TestServiceDependencies:
+    """Test suite for the app-scoped service dependencies"""
+
+    @pytest.mark.asyncio
+    async def test_services_created_once_per_app(self):
+        """Test that every dependency returns the same instances, built around one ChromaDB service"""
+        request = MagicMock()
+        request.app.state = SimpleNamespace()
+
+        with patch('api.dependencies.ChromaDBService') as chromadb_service_class:
+            chroma = await get_chroma(request)
+            assert await get_chroma(request) is chroma
+            rag = await get_rag(request)
+            assert await get_rag(request) is rag
+            assert rag.chromadb_service is chroma
+
+        chromadb_service_class.assert_called_once_with()
+
+    @pytest.mark.asyncio
+    async def test_services_created_once_under_concurrent_requests(self):
+        """Test that concurrent first requests share one set of services, created off the event loop"""
+        request = MagicMock()
+        request.app.state = SimpleNamespace()
+        creating_threads = []
+
+        def slow_service():
+            creating_threads.append(threading.get_ident())
+            time.sleep(0.05)  # Connecting to ChromaDB
+            return MagicMock()
+
+        with patch('api.dependencies.ChromaDBService', side_effect=slow_service) as chromadb_service_class:
+            services = await asyncio.gather(*(get_chroma(request) for _ in range(4)))
+
+        assert chromadb_service_class.call_count == 1
+        assert all(service is services[0] for service in services)
+        assert creating_threads[0] != threading.get_ident()
+
+class TestResponseCache:
+    """Test suite for the chat response cache"""
+
+    def test_context_scopes_entries(self):
+        """Test that an answer is only reused for the same model and history"""
+        cache = ResponseCache()
+        key = ResponseCache.context_key("llama3.2", [])
+        cache.put(key, "Hello", {"message": "hi"})
+
+        assert cache.get_exact(key, "hello") == {"message": "hi"}
+        assert cache.get_exact(ResponseCache.context_key("mistral", []), "Hello") is None
+        history = [{"role": "user", "content": "Earlier"}]
+        assert cache.get_exact(ResponseCache.context_key("llama3.2", history), "Hello") is None
+
+    def test_similar_question_hits(self):
+        """Test the semantic tier"""
+        cache = ResponseCache(semantic_threshold=0.95)
+        key = ResponseCache.context_key("llama3.2", [])
+        cache.put(key, "What is Python?", {"message": "a language"}, embedding=[1.0, 0.0, 0.0])
+
+        assert cache.get_similar(key, [0.99, 0.01, 0.0]) == {"message": "a language"}
+        assert cache.get_similar(key, [0.0, 1.0, 0.0]) is None
+
+    def test_knowledge_change_invalidates(self):
+        """Test that entries are dropped when the knowledge version changes"""
+        cache = ResponseCache()
+        key = ResponseCache.context_key("llama3.2", [])
+        cache.put(key, "Hello", {"message": "hi"}, knowledge_version=0)
+
+        assert cache.get_exact(key, "Hello", knowledge_version=1) is None
@@ -0,0 +1,54 @@
+import pytest
+import asyncio
+from unittest.mock import MagicMock
+import sys
+sys.path.append('..')
+
+from services.query_batcher import QueryBatcher
+
+class TestQueryBatcher:
+    """Test suite for coalescing concurrent vector queries"""
+
+    def setup_method(self):
+        """Set up a multi-vector query returning 3 results per query vector"""
+        self.query_fn = MagicMock(side_effect=lambda embeddings, n_results: {
+            "ids": [[f"{e[0]}-{j}" for j in range(3)][:n_results] for e in embeddings],
+            "documents": [[f"doc {j}" for j in range(3)][:n_results] for _ in embeddings],
+            "metadatas": None,
+            "distances": [[0.1 * j for j in range(3)][:n_results] for _ in embeddings]
+        })
+
+    @pytest.mark.asyncio
+    async def test_concurrent_queries_sent_together(self):
+        """Test that queries submitted together run as one call, each trimmed to its own limit"""
+        batcher = QueryBatcher(self.query_fn, max_wait_seconds=0.01)
+
+        first, second = await asyncio.gather(
+            batcher.submit([1.0], 1),
+            batcher.submit([2.0], 3)
+        )
+
+        self.query_fn.assert_called_once_with([[1.0], [2.0]], 3)
+        assert first["ids"] == [["1.0-0"]]
+        assert second["ids"] == [["2.0-0", "2.0-1", "2.0-2"]]
+        assert first["metadatas"] is None
+
+    @pytest.mark.asyncio
+    async def test_full_batch_flushed_immediately(self):
+        """Test that a batch is sent as soon as it reaches the maximum size"""
+        batcher = QueryBatcher(self.query_fn, max_batch_size=2, max_wait_seconds=60)
+
+        await asyncio.wait_for(asyncio.gather(batcher.submit([1.0], 2), batcher.submit([2.0], 2)), timeout=1)
+
+        self.query_fn.assert_called_once_with([[1.0], [2.0]], 2)
+
+    @pytest.mark.asyncio
+    async def test_errors_reach_every_caller(self):
+        """Test that a failed batch query fails each waiting search"""
+        self.query_fn.side_effect = RuntimeError("ChromaDB down")
+        batcher = QueryBatcher(self.query_fn)
+
+        results = await asyncio.gather(batcher.submit([1.0], 1), batcher.submit([2.0], 1), return_exceptions=True)
+
+        assert all(isinstance(r, RuntimeError) for r in results)
+        self.query_fn.assert_called_once()
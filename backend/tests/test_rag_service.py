@@ -0,0 +1,126 @@
+import pytest
+from unittest.mock import MagicMock, AsyncMock
+import sys
+sys.path.append('..')
+
+from services.rag_service import RAGService
+from services.semantic_cache import SemanticCache
+
+class TestSemanticCache:
+    """Test suite for the embedding similarity cache"""
+
+    def test_similar_query_hits(self):
+        """Test that a query close to a cached one returns the cached value"""
+        cache = SemanticCache(threshold=0.9)
+        cache.insert([1.0, 0.0, 0.0], "cached")
+
+        assert cache.lookup([0.99, 0.05, 0.0]) == "cached"
+        assert cache.lookup([0.0, 1.0, 0.0]) is None
+
+    def test_least_recently_used_entry_is_evicted(self):
+        """Test LRU eviction when the cache is full"""
+        cache = SemanticCache(capacity=2, threshold=0.99)
+        cache.insert([1.0, 0.0], "a")
+        cache.insert([0.0, 1.0], "b")
+        cache.lookup([1.0, 0.0])  # "a" is now more recently used than "b"
+        cache.insert([-1.0, 0.0], "c")
+
+        assert len(cache) == 2
+        assert cache.lookup([1.0, 0.0]) == "a"
+        assert cache.lookup([0.0, 1.0]) is None
+        assert cache.lookup([-1.0, 0.0]) == "c"
+
+    def test_expired_entries_miss(self):
+        """Test that entries older than the TTL are not served"""
+        cache = SemanticCache(ttl_seconds=0)
+        cache.insert([1.0, 0.0], "stale")
+
+        assert cache.lookup([1.0, 0.0]) is None
+
+class TestRAGService:
+    """Test suite for RAG prompt augmentation"""
+
+    def setup_method(self):
+        """Set up a mock ChromaDB service returning one relevant document"""
+        self.chromadb_service = MagicMock()
+        self.chromadb_service.is_available.return_value = True
+        self.chromadb_service.check_available = AsyncMock(return_value=True)
+        self.chromadb_service.knowledge_version = 0
+        self.chromadb_service.embed_query = AsyncMock(return_value=[0.1, 0.2, 0.3])
+        self.chromadb_service.search_documents = AsyncMock(return_value=[{
+            'id': 'doc1',
+            'content': 'Python is a programming language',
+            'metadata': {'source': 'test'},
+            'distance': 0.2,
+            'relevance_score': 0.8
+        }])
+        self.chromadb_service.search_conversations = AsyncMock(return_value=[])
+        self.rag_service = RAGService(self.chromadb_service)
+
+    @pytest.mark.asyncio
+    async def test_repeat_query_served_from_semantic_cache(self):
+        """Test that a repeated query in a conversation skips the vector search"""
+
+        first = await self.rag_service.augment_prompt("What is Python?", conversation_id="conv1")
+        second = await self.rag_service.augment_prompt("What is Python?", conversation_id="conv1")
+
+        assert self.chromadb_service.search_documents.call_count == 1
+        assert first["sources"] == second["sources"]
+        assert "Python is a programming language" in second["augmented_prompt"]
+
+        # The precomputed embedding is passed on rather than embedding twice
+        assert self.chromadb_service.search_documents.call_args[1]['query_embedding'] == [0.1, 0.2, 0.3]
+
+    @pytest.mark.asyncio
+    async def test_distance_thresholds_pushed_into_search(self):
+        """Test that relevance thresholds are applied by the ChromaDB service rather than afterwards"""
+
+        await self.rag_service.augment_prompt(
+            "What is Python?",
+            conversation_history=[{"role": "user", "content": "Hi"}],
+            conversation_id="conv1"
+        )
+
+        search_kwargs = self.chromadb_service.search_documents.call_args[1]
+        assert search_kwargs['distance_threshold'] == self.rag_service.document_distance_threshold
+        assert search_kwargs['limit'] == 3
+        conversation_kwargs = self.chromadb_service.search_conversations.call_args[1]
+        assert conversation_kwargs['distance_threshold'] == self.rag_service.conversation_distance_threshold
+        assert conversation_kwargs['limit'] == 2
+
+    @pytest.mark.asyncio
+    async def test_semantic_cache_invalidated_by_knowledge_changes(self):
+        """Test that adding knowledge drops cached search results"""
+
+        await self.rag_service.augment_prompt("What is Python?", conversation_id="conv1")
+        self.chromadb_service.knowledge_version += 1
+        await self.rag_service.augment_prompt("What is Python?", conversation_id="conv1")
+
+        assert self.chromadb_service.search_documents.call_count == 2
+
+    @pytest.mark.asyncio
+    async def test_one_embedding_shared_by_both_searches(self):
+        """Test that a precomputed embedding is reused for knowledge and conversation search"""
+
+        await self.rag_service.augment_prompt(
+            "What is Python?",
+            conversation_history=[{"role": "user", "content": "Hi"}],
+            conversation_id="conv1",
+            query_embedding=[0.3, 0.2, 0.1]
+        )
+
+        self.chromadb_service.embed_query.assert_not_called()
+        assert self.chromadb_service.search_documents.call_args[1]['query_embedding'] == [0.3, 0.2, 0.1]
+        assert self.chromadb_service.search_conversations.call_args[1]['query_embedding'] == [0.3, 0.2, 0.1]
+
+    @pytest.mark.asyncio
+    async def test_unavailable_chromadb_checked_without_blocking(self):
+        """Test that availability is checked through the non-blocking check before searching"""
+        self.chromadb_service.check_available.return_value = False
+
+        result = await self.rag_service.augment_prompt("What is Python?")
+
+        assert result["rag_available"] is False
+        assert result["augmented_prompt"] == "What is Python?"
+        self.chromadb_service.is_available.assert_not_called()
+        self.chromadb_service.search_documents.assert_not_called()
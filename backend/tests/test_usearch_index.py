@@ -0,0 +1,54 @@
+import pytest
+import numpy as np
+import sys
+sys.path.append('..')
+
+pytest.importorskip("usearch")
+
+from services.usearch_index import USearchIndex
+
+class TestUSearchIndex:
+    """Test suite for the USearch-backed embedding index"""
+
+    def test_nearest_first_with_squared_l2_distance(self):
+        """Test that results are ordered by squared L2 distance, as ChromaDB reports it"""
+        index = USearchIndex()
+        index.add(['a', 'b', 'c'], [[1.0, 0.0], [0.0, 1.0], [0.6, 0.8]], ['A', 'B', 'C'], [{}, {}, {}])
+
+        results = index.search([0.0, 1.0], limit=2)
+
+        assert [index.ids[i] for i, _ in results] == ['b', 'c']
+        assert results[0][1] == pytest.approx(0.0, abs=1e-6)
+        assert results[1][1] == pytest.approx(0.36 + 0.04)
+
+    def test_positions_continue_across_adds(self):
+        """Test that entries added later map back to their own ids"""
+        rng = np.random.default_rng(0)
+        vectors = rng.normal(size=(100, 16)).astype(np.float32)
+        index = USearchIndex()
+        index.add([str(i) for i in range(50)], vectors[:50], [''] * 50, [{}] * 50)
+        index.add([str(i) for i in range(50, 100)], vectors[50:], [''] * 50, [{}] * 50)
+
+        position, distance = index.search(vectors[73], limit=1)[0]
+        assert index.ids[position] == '73'
+        assert distance == pytest.approx(0.0, abs=1e-4)
+
+    def test_quantized_close_to_exact(self):
+        """Test that a float16 index finds the same neighbours with nearly the same distances"""
+        rng = np.random.default_rng(1)
+        vectors = rng.normal(size=(500, 32)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        query = vectors[7] + 0.1 * rng.normal(size=32).astype(np.float32)
+        exact = USearchIndex()
+        quantized = USearchIndex(quantize=True)
+        for index in (exact, quantized):
+            index.add([str(i) for i in range(500)], vectors, [''] * 500, [{}] * 500)
+
+        exact_results = exact.search(query, limit=5)
+        quantized_results = quantized.search(query, limit=5)
+        assert [i for i, _ in quantized_results] == [i for i, _ in exact_results]
+        for (_, d_exact), (_, d_quantized) in zip(exact_results, quantized_results):
+            assert d_quantized == pytest.approx(d_exact, abs=1e-2)
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,59 @@
+import pytest
+import numpy as np
+import sys
+sys.path.append('..')
+
+from services.vector_index import VectorIndex
+
+class TestVectorIndex:
+    """Test suite for the in-memory embedding index"""
+
+    def test_nearest_first_with_squared_l2_distance(self):
+        """Test that results are ordered by squared L2 distance, as ChromaDB reports it"""
+        index = VectorIndex()
+        index.add(['a', 'b', 'c'], [[1.0, 0.0], [0.0, 1.0], [0.6, 0.8]], ['A', 'B', 'C'], [{}, {}, {}])
+
+        results = index.search([0.0, 1.0], limit=2)
+
+        assert [index.ids[i] for i, _ in results] == ['b', 'c']
+        assert results[0][1] == pytest.approx(0.0)
+        assert results[1][1] == pytest.approx(0.36 + 0.04)
+
+    def test_matches_brute_force(self):
+        """Test top-k against a straightforward distance computation"""
+        rng = np.random.default_rng(0)
+        vectors = rng.normal(size=(200, 16)).astype(np.float32)
+        query = rng.normal(size=16).astype(np.float32)
+        index = VectorIndex()
+        index.add([str(i) for i in range(100)], vectors[:100], [''] * 100, [{}] * 100)
+        index.add([str(i) for i in range(100, 200)], vectors[100:], [''] * 100, [{}] * 100)
+
+        expected = np.argsort(((vectors - query) ** 2).sum(axis=1))[:5]
+        assert [i for i, _ in index.search(query, limit=5)] == expected.tolist()
+
+    def test_quantized_close_to_exact(self):
+        """Test that an int8 index finds the same neighbours with nearly the same distances"""
+        rng = np.random.default_rng(1)
+        vectors = rng.normal(size=(500, 32)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        query = vectors[7] + 0.1 * rng.normal(size=32).astype(np.float32)
+        exact = VectorIndex()
+        quantized = VectorIndex(quantize=True, block_rows=64)
+        for index in (exact, quantized):
+            index.add([str(i) for i in range(500)], vectors, [''] * 500, [{}] * 500)
+
+        expected = exact.search(query, limit=3)
+        results = quantized.search(query, limit=3)
+
+        assert quantized._matrix.dtype == np.int8
+        assert results[0][0] == expected[0][0] == 7
+        assert [d for _, d in results] == pytest.approx([d for _, d in expected], rel=0.02, abs=1e-3)
+
+    def test_empty_or_mismatched_queries(self):
+        """Test that an empty index or a query of the wrong dimension finds nothing"""
+        index = VectorIndex()
+        assert index.search([1.0, 0.0], limit=3) == []
+
+        index.add(['a'], [[1.0, 0.0]], ['A'], [None])
+        assert index.search([1.0, 0.0, 0.0], limit=3) == []
+        assert index.metadatas == [{}]
@@ -0,0 +1,31 @@
+from typing import Coroutine, Optional, Set
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Strong references to running tasks; the event loop only keeps weak ones,
+# so an unreferenced task can be garbage collected before it finishes
+_background_tasks: Set[asyncio.Task] = set()
+
+def _task_done(task: asyncio.Task):
+    _background_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"Background task {task.get_name()} failed: {task.exception()}")
+
+def spawn(coro: Coroutine, name: Optional[str] = None) -> asyncio.Task:
+    """Run a coroutine in the background, off the request's critical path"""
+    task = asyncio.create_task(coro, name=name)
+    _background_tasks.add(task)
+    task.add_done_callback(_task_done)
+    return task
+
+async def drain(timeout: float = 10.0):
+    """Wait for pending background tasks (called on application shutdown)"""
+    if not _background_tasks:
+        return
+    done, pending = await asyncio.wait(set(_background_tasks), timeout=timeout)
+    for task in pending:
+        task.cancel()
+    if pending:
+        logger.warning(f"Cancelled {len(pending)} background task(s) still running at shutdown")
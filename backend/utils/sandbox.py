@@ -0,0 +1,221 @@
+"""Launcher that runs a command inside a Landlock + seccomp sandbox.
+
+Run as a script, `sandbox.py <writable dir> -- <command...>` restricts
+itself and then execs the command, which inherits the restrictions:
+
+- Landlock: the filesystem is read-only and limited to the system
+  directories and the command's install prefix. Only the writable
+  directory can be written. TCP bind/connect are denied, and so are
+  signals and abstract unix sockets reaching outside the sandbox.
+- seccomp: sockets other than AF_UNIX can't be created, and the
+  syscalls for debugging other processes, namespaces, mounts, kernel
+  modules and io_uring (which bypasses seccomp) fail.
+
+The restrictions are applied in this process rather than in a
+preexec_fn, so the caller keeps subprocess's fast spawn path. If either
+one can't be applied the launcher exits with EXIT_SANDBOX_UNAVAILABLE
+instead of running the command unconfined.
+
+This file is run with `python -I -S`, so it only uses the standard
+library.
+"""
+from typing import List, Optional
+import ctypes
+import ctypes.util
+import errno
+import os
+import shutil
+import sys
+
+EXIT_SANDBOX_UNAVAILABLE = 126
+
+# Landlock syscalls have the same numbers on every architecture
+_SYS_LANDLOCK_CREATE_RULESET = 444
+_SYS_LANDLOCK_ADD_RULE = 445
+_SYS_LANDLOCK_RESTRICT_SELF = 446
+_LANDLOCK_CREATE_RULESET_VERSION = 1
+_LANDLOCK_RULE_PATH_BENEATH = 1
+_PR_SET_NO_NEW_PRIVS = 38
+
+_FS_EXECUTE = 1 << 0
+_FS_WRITE_FILE = 1 << 1
+_FS_READ_FILE = 1 << 2
+_FS_READ_DIR = 1 << 3
+_FS_TRUNCATE = 1 << 14
+_FS_IOCTL_DEV = 1 << 15
+# Every filesystem right known to each Landlock ABI version
+_FS_RIGHTS_BY_ABI = {1: (1 << 13) - 1, 2: (1 << 14) - 1, 3: (1 << 15) - 1, 4: (1 << 15) - 1}
+_FS_RIGHTS_LATEST = (1 << 16) - 1
+# The rights that apply to a file rather than a directory
+_FS_FILE_RIGHTS = _FS_EXECUTE | _FS_WRITE_FILE | _FS_READ_FILE | _FS_TRUNCATE | _FS_IOCTL_DEV
+_FS_READ = _FS_EXECUTE | _FS_READ_FILE | _FS_READ_DIR
+_NET_TCP = (1 << 0) | (1 << 1)  # Bind and connect, ABI 4+
+_SCOPE_ALL = (1 << 0) | (1 << 1)  # Abstract unix sockets and signals, ABI 6+
+
+# Readable by every sandboxed command, besides its own install prefix
+READ_ONLY_PATHS = ('/usr', '/lib', '/lib32', '/lib64', '/bin', '/sbin', '/etc', '/proc', '/sys')
+# Device files the command may also write to
+DEVICE_PATHS = ('/dev/null', '/dev/zero', '/dev/random', '/dev/urandom')
+
+_SCMP_ACT_ALLOW = 0x7fff0000
+_SCMP_CMP_NE = 1
+_AF_UNIX = 1
+# Failed with EPERM, apart from io_uring, which fails with ENOSYS so that
+# runtimes fall back to plain syscalls
+DENIED_SYSCALLS = (
+    'ptrace', 'process_vm_readv', 'process_vm_writev', 'mount', 'umount2', 'pivot_root', 'chroot',
+    'unshare', 'setns', 'bpf', 'perf_event_open', 'kexec_load', 'kexec_file_load', 'init_module',
+    'finit_module', 'delete_module', 'reboot', 'swapon', 'swapoff', 'keyctl', 'add_key',
+    'request_key', 'userfaultfd'
+)
+
+class _RulesetAttr(ctypes.Structure):
+    _fields_ = [("handled_access_fs", ctypes.c_uint64),
+                ("handled_access_net", ctypes.c_uint64),
+                ("scoped", ctypes.c_uint64)]
+
+class _PathBeneathAttr(ctypes.Structure):
+    _pack_ = 1
+    _fields_ = [("allowed_access", ctypes.c_uint64), ("parent_fd", ctypes.c_int32)]
+
+class _ScmpArgCmp(ctypes.Structure):
+    _fields_ = [("arg", ctypes.c_uint), ("op", ctypes.c_int),
+                ("datum_a", ctypes.c_uint64), ("datum_b", ctypes.c_uint64)]
+
+class SandboxUnavailable(Exception):
+    pass
+
+_libc = ctypes.CDLL(None, use_errno=True)
+_libc.syscall.restype = ctypes.c_long
+
+def _syscall(*args) -> int:
+    result = _libc.syscall(*args)
+    if result < 0:
+        err = ctypes.get_errno()
+        raise OSError(err, os.strerror(err))
+    return result
+
+def landlock_abi() -> int:
+    """Landlock ABI version supported by the kernel, 0 if none"""
+    try:
+        return _syscall(ctypes.c_long(_SYS_LANDLOCK_CREATE_RULESET), None, ctypes.c_size_t(0),
+                        ctypes.c_uint32(_LANDLOCK_CREATE_RULESET_VERSION))
+    except OSError:
+        return 0
+
+def _load_libseccomp():
+    path = ctypes.util.find_library("seccomp") or "libseccomp.so.2"
+    try:
+        lib = ctypes.CDLL(path, use_errno=True)
+    except OSError:
+        return None
+    lib.seccomp_init.restype = ctypes.c_void_p
+    lib.seccomp_init.argtypes = [ctypes.c_uint32]
+    lib.seccomp_syscall_resolve_name.argtypes = [ctypes.c_char_p]
+    lib.seccomp_rule_add_array.argtypes = [ctypes.c_void_p, ctypes.c_uint32, ctypes.c_int,
+                                           ctypes.c_uint, ctypes.POINTER(_ScmpArgCmp)]
+    lib.seccomp_load.argtypes = [ctypes.c_void_p]
+    lib.seccomp_release.argtypes = [ctypes.c_void_p]
+    return lib
+
+def sandbox_support() -> Optional[str]:
+    """Why commands can't be sandboxed on this system, or None if they can"""
+    if not sys.platform.startswith("linux"):
+        return "not Linux"
+    if landlock_abi() < 1:
+        return "Landlock is not supported by the kernel"
+    if _load_libseccomp() is None:
+        return "libseccomp is not installed"
+    return None
+
+def _install_prefix(executable: str) -> str:
+    """Directory a runtime was installed into, e.g. /usr/local for /usr/local/bin/python3"""
+    return os.path.dirname(os.path.dirname(os.path.realpath(executable)))
+
+def _allow_path(ruleset_fd: int, path: str, rights: int):
+    try:
+        fd = os.open(path, os.O_PATH | os.O_CLOEXEC)
+    except OSError:
+        return  # Nothing to allow access to
+    try:
+        if not os.path.isdir(path):
+            rights &= _FS_FILE_RIGHTS
+        rule = _PathBeneathAttr(rights, fd)
+        _syscall(ctypes.c_long(_SYS_LANDLOCK_ADD_RULE), ctypes.c_int(ruleset_fd),
+                 ctypes.c_int(_LANDLOCK_RULE_PATH_BENEATH), ctypes.byref(rule), ctypes.c_uint32(0))
+    finally:
+        os.close(fd)
+
+def _restrict_filesystem(writable_dir: str, read_only_paths: List[str]):
+    abi = landlock_abi()
+    if abi < 1:
+        raise SandboxUnavailable("Landlock is not supported by the kernel")
+    fs_rights = _FS_RIGHTS_BY_ABI.get(abi, _FS_RIGHTS_LATEST)
+    attr = _RulesetAttr(fs_rights, _NET_TCP if abi >= 4 else 0, _SCOPE_ALL if abi >= 6 else 0)
+    # Older kernels reject attributes larger than the struct they know
+    size = 8 if abi < 4 else 16 if abi < 6 else 24
+    ruleset_fd = _syscall(ctypes.c_long(_SYS_LANDLOCK_CREATE_RULESET), ctypes.byref(attr),
+                          ctypes.c_size_t(size), ctypes.c_uint32(0))
+    try:
+        for path in read_only_paths:
+            _allow_path(ruleset_fd, path, _FS_READ)
+        for path in DEVICE_PATHS:
+            _allow_path(ruleset_fd, path, fs_rights & _FS_FILE_RIGHTS & ~_FS_EXECUTE)
+        _allow_path(ruleset_fd, writable_dir, fs_rights)
+        _libc.prctl(_PR_SET_NO_NEW_PRIVS, 1, 0, 0, 0)
+        _syscall(ctypes.c_long(_SYS_LANDLOCK_RESTRICT_SELF), ctypes.c_int(ruleset_fd), ctypes.c_uint32(0))
+    finally:
+        os.close(ruleset_fd)
+
+def _filter_syscalls():
+    lib = _load_libseccomp()
+    if lib is None:
+        raise SandboxUnavailable("libseccomp is not installed")
+    ctx = lib.seccomp_init(_SCMP_ACT_ALLOW)
+    if not ctx:
+        raise SandboxUnavailable("seccomp_init failed")
+    try:
+        def deny(name: str, err: int, *conditions: _ScmpArgCmp):
+            number = lib.seccomp_syscall_resolve_name(name.encode())
+            if number < 0:
+                return  # Not a syscall on this architecture
+            args = (_ScmpArgCmp * len(conditions))(*conditions)
+            result = lib.seccomp_rule_add_array(ctx, 0x00050000 | err, number, len(conditions), args)
+            if result < 0:
+                raise SandboxUnavailable(f"Could not add a seccomp rule for {name}: {os.strerror(-result)}")
+
+        deny('socket', errno.EACCES, _ScmpArgCmp(0, _SCMP_CMP_NE, _AF_UNIX, 0))
+        for name in DENIED_SYSCALLS:
+            deny(name, errno.EPERM)
+        deny('io_uring_setup', errno.ENOSYS)
+        result = lib.seccomp_load(ctx)
+        if result < 0:
+            raise SandboxUnavailable(f"Could not load the seccomp filter: {os.strerror(-result)}")
+    finally:
+        lib.seccomp_release(ctx)
+
+def launcher_command(writable_dir: str) -> List[str]:
+    """Command prefix that runs what follows it in the sandbox"""
+    return [sys.executable, "-I", "-S", os.path.abspath(__file__), writable_dir, "--"]
+
+def main(argv: List[str]) -> int:
+    if len(argv) < 3 or argv[1] != "--":
+        print("usage: sandbox.py <writable dir> -- <command...>", file=sys.stderr)
+        return 2
+    writable_dir, command = argv[0], argv[2:]
+    executable = shutil.which(command[0])
+    if executable is None:
+        print(f"sandbox: {command[0]}: command not found", file=sys.stderr)
+        return 127
+
+    try:
+        _restrict_filesystem(writable_dir, list(READ_ONLY_PATHS) + [_install_prefix(executable)])
+        _filter_syscalls()
+    except (SandboxUnavailable, OSError) as e:
+        print(f"sandbox: unavailable: {e}", file=sys.stderr)
+        return EXIT_SANDBOX_UNAVAILABLE
+
+    os.execv(executable, command)
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -1,15 +1,21 @@
-from typing import Dict, Any
-import requests
+from typing import Dict, Any, Optional
+import httpx
 import psutil
 import time
 from services.chromadb_service import ChromaDBService
 from services.web_search_service import WebSearchService
+from api.conversations import load_conversations, CONVERSATIONS_FILE, CONVERSATIONS_JOURNAL
+from api.dependencies import OLLAMA_URL
 import os
-import json
 import asyncio
 from datetime import datetime
 
-async def get_system_status() -> Dict[str, Any]:
+# Start psutil's CPU time counters, so cpu_percent() can be read without
+# blocking; each reading covers the time since the previous one
+psutil.cpu_percent(interval=None)
+
+async def get_system_status(http: httpx.AsyncClient, chroma: ChromaDBService,
+                            web_search: WebSearchService) -> Dict[str, Any]:
     """Get comprehensive system status with enhanced monitoring"""
     status = {
         "overall": "healthy",
@@ -21,24 +27,17 @@ async def get_system_status() -> Dict[str, Any]:
         "uptime": get_process_uptime()
     }
     
-    # Check Ollama
-    ollama_status = await check_ollama_service()
-    status["services"]["ollama"] = ollama_status
-    
-    # Check ChromaDB
-    chromadb_status = await check_chromadb_service()
-    status["services"]["chromadb"] = chromadb_status
-    
-    # Check Web Search Services
-    web_search_status = await check_web_search_service()
-    status["services"]["web_search"] = web_search_status
-    
-    # Check conversation storage
-    conversations_status = check_conversations_service()
-    status["services"]["conversations"] = conversations_status
-    
-    # Get system resources
-    status["system_resources"] = get_system_resources()
+    # The checks are independent, so they run concurrently, and the ones
+    # that block (file and system stats) run in worker threads
+    services = status["services"]
+    (services["ollama"], services["chromadb"], services["web_search"],
+     services["conversations"], status["system_resources"]) = await asyncio.gather(
+        check_ollama_service(http),
+        check_chromadb_service(chroma),
+        check_web_search_service(web_search),
+        asyncio.to_thread(check_conversations_service),
+        asyncio.to_thread(get_system_resources)
+    )
     
     # Determine overall health
     service_healths = [service.get("status", "error") for service in status["services"].values()]
@@ -63,44 +62,43 @@ async def get_system_status() -> Dict[str, Any]:
     
     return status
 
-async def check_ollama_service() -> Dict[str, Any]:
+async def check_ollama_service(http: httpx.AsyncClient) -> Dict[str, Any]:
     """Check Ollama service with detailed information"""
     try:
-        response = requests.get("http://localhost:11434/api/tags", timeout=5)
+        response = await http.get(f"{OLLAMA_URL}/api/tags", timeout=5)
         if response.status_code == 200:
             models = response.json().get("models", [])
             return {
                 "status": "available",
                 "models_count": len(models),
                 "models": [model.get("name", "") for model in models[:10]],  # First 10 models
-                "api_endpoint": "http://localhost:11434",
+                "api_endpoint": OLLAMA_URL,
                 "response_time": response.elapsed.total_seconds()
             }
         else:
             return {
                 "status": "error",
                 "error": f"HTTP {response.status_code}",
-                "api_endpoint": "http://localhost:11434"
+                "api_endpoint": OLLAMA_URL
             }
-    except requests.exceptions.Timeout:
+    except httpx.TimeoutException:
         return {
             "status": "timeout",
             "error": "Request timed out after 5 seconds",
-            "api_endpoint": "http://localhost:11434"
+            "api_endpoint": OLLAMA_URL
         }
     except Exception as e:
         return {
             "status": "unavailable",
             "error": str(e),
-            "api_endpoint": "http://localhost:11434"
+            "api_endpoint": OLLAMA_URL
         }
 
-async def check_chromadb_service() -> Dict[str, Any]:
+async def check_chromadb_service(chroma: ChromaDBService) -> Dict[str, Any]:
     """Check ChromaDB service with detailed statistics"""
     try:
-        chromadb_service = ChromaDBService()
-        if chromadb_service.is_available():
-            stats = chromadb_service.get_collection_stats()
+        if await chroma.check_available():
+            stats = await asyncio.to_thread(chroma.get_collection_stats)
             return {
                 "status": "available",
                 "connection_type": stats.get("connection_type", "unknown"),
@@ -121,11 +119,10 @@ async def check_chromadb_service() -> Dict[str, Any]:
             "error": str(e)
         }
 
-async def check_web_search_service() -> Dict[str, Any]:
+async def check_web_search_service(web_search: WebSearchService) -> Dict[str, Any]:
     """Check web search service status"""
     try:
-        web_search_service = WebSearchService()
-        service_status = web_search_service.get_service_status()
+        service_status = web_search.get_service_status()
         
         return {
             "status": "available" if service_status.get("available", False) else "unavailable",
@@ -142,22 +139,24 @@ async def check_web_search_service() -> Dict[str, Any]:
 def check_conversations_service() -> Dict[str, Any]:
     """Check conversation storage service"""
     try:
-        conversations_file = "conversations.json"
+        conversations_file = CONVERSATIONS_FILE
         if os.path.exists(conversations_file):
-            with open(conversations_file, 'r') as f:
-                conversations = json.load(f)
-                file_stats = os.stat(conversations_file)
-                return {
-                    "status": "available",
-                    "count": len(conversations),
-                    "storage": "file_based",
-                    "file_size": file_stats.st_size,
-                    "last_modified": datetime.fromtimestamp(file_stats.st_mtime).isoformat()
-                }
+            # Served from the conversations cache; only re-parsed if the files changed
+            conversations = load_conversations()
+            file_stats = os.stat(conversations_file)
+            journal_size = os.path.getsize(CONVERSATIONS_JOURNAL) if os.path.isfile(CONVERSATIONS_JOURNAL) else 0
+            return {
+                "status": "available",
+                "count": len(conversations),
+                "storage": "file_based",
+                "file_size": file_stats.st_size,
+                "journal_size": journal_size,
+                "last_modified": datetime.fromtimestamp(file_stats.st_mtime).isoformat()
+            }
         else:
             return {
                 "status": "available",
-                "count": 0,
+                "count": len(load_conversations()),
                 "storage": "file_based",
                 "file_size": 0,
                 "note": "New installation - no conversations yet"
@@ -171,8 +170,9 @@ def check_conversations_service() -> Dict[str, Any]:
 def get_system_resources() -> Dict[str, Any]:
     """Get system resource information"""
     try:
-        # CPU information
-        cpu_percent = psutil.cpu_percent(interval=1)
+        # CPU information, averaged since the previous reading rather than
+        # sampled over a one second wait
+        cpu_percent = psutil.cpu_percent(interval=None)
         cpu_count = psutil.cpu_count()
         
         # Memory information
@@ -223,7 +223,27 @@ def get_process_uptime() -> float:
     except Exception:
         return 0.0
 
-async def get_performance_metrics() -> Dict[str, Any]:
+async def time_ollama_response(http: httpx.AsyncClient) -> Optional[float]:
+    """Seconds Ollama takes to list its models, or None if it failed"""
+    try:
+        start_time = time.perf_counter()
+        response = await http.get(f"{OLLAMA_URL}/api/tags", timeout=10)
+        end_time = time.perf_counter()
+        return end_time - start_time if response.status_code == 200 else None
+    except Exception:
+        return None
+
+async def time_chromadb_response(chroma: ChromaDBService) -> Optional[float]:
+    """Seconds ChromaDB takes to report collection stats, or None if it failed"""
+    try:
+        start_time = time.perf_counter()
+        stats = await asyncio.to_thread(chroma.get_collection_stats)
+        end_time = time.perf_counter()
+        return end_time - start_time if stats.get("available", False) else None
+    except Exception:
+        return None
+
+async def get_performance_metrics(http: httpx.AsyncClient, chroma: ChromaDBService) -> Dict[str, Any]:
     """Get detailed performance metrics"""
     try:
         # Test response times for key services
@@ -234,30 +254,11 @@ async def get_performance_metrics() -> Dict[str, Any]:
             "error_rates": {}
         }
         
-        # Test Ollama response time
-        try:
-            start_time = time.time()
-            response = requests.get("http://localhost:11434/api/tags", timeout=10)
-            end_time = time.time()
-            if response.status_code == 200:
-                metrics["response_times"]["ollama"] = end_time - start_time
-            else:
-                metrics["response_times"]["ollama"] = None
-        except Exception:
-            metrics["response_times"]["ollama"] = None
-        
-        # Test ChromaDB response time
-        try:
-            start_time = time.time()
-            chromadb_service = ChromaDBService()
-            stats = chromadb_service.get_collection_stats()
-            end_time = time.time()
-            if stats.get("available", False):
-                metrics["response_times"]["chromadb"] = end_time - start_time
-            else:
-                metrics["response_times"]["chromadb"] = None
-        except Exception:
-            metrics["response_times"]["chromadb"] = None
+        # Both services are timed at once
+        metrics["response_times"]["ollama"], metrics["response_times"]["chromadb"] = await asyncio.gather(
+            time_ollama_response(http),
+            time_chromadb_response(chroma)
+        )
         
         # System performance
         metrics["system_load"] = {
@@ -27,6 +27,11 @@ if [ ! -f "backend/conversations.json" ]; then
     echo "[]" > backend/conversations.json
 fi
 
+if [ ! -f "backend/conversations.jsonl" ]; then
+    echo "Creating backend/conversations.jsonl..."
+    touch backend/conversations.jsonl
+fi
+
 if [ ! -d "backend/chromadb_data" ]; then
     echo "Creating backend/chromadb_data directory..."
     mkdir -p backend/chromadb_data
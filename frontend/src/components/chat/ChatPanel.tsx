@@ -46,6 +46,42 @@ interface Message {
   search_used?: boolean;
 }
 
+/**
+ * Read a streamed chat response (newline-delimited JSON chunks), calling
+ * onContent with the reply so far as each chunk arrives. Resolves to the
+ * final chunk with the message content filled in.
+ */
+const readChatStream = async (
+  response: Response,
+  onContent: (content: string) => void,
+): Promise<any> => {
+  const reader = response.body!.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  let content = '';
+  let last: any = null;
+
+  const handleLine = (line: string) => {
+    if (!line.trim()) return;
+    const chunk = JSON.parse(line);
+    content += chunk.message?.content || '';
+    last = chunk;
+    onContent(content);
+  };
+
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    const lines = buffer.split('\n');
+    buffer = lines.pop() || '';
+    lines.forEach(handleLine);
+  }
+  handleLine(buffer + decoder.decode());
+
+  return last && { ...last, message: { ...last.message, role: 'assistant', content } };
+};
+
 interface Model {
   name: string;
   size?: number;
@@ -166,7 +202,12 @@ export const ChatPanel: React.FC<ChatPanelProps> = ({
     return null;
   };
 
-  const addMessageToConversation = async (convId: string, role: string, content: string) => {
+  const addMessageToConversation = async (
+    convId: string,
+    role: string,
+    content: string,
+    context?: Pick<Message, 'context_sources' | 'rag_used' | 'search_used'>
+  ) => {
     try {
       await fetch(`http://localhost:8000/api/conversations/${convId}/messages`, {
         method: 'POST',
@@ -176,6 +217,7 @@ export const ChatPanel: React.FC<ChatPanelProps> = ({
         body: JSON.stringify({
           role,
           content,
+          ...context,
         }),
       });
     } catch (error) {
@@ -240,12 +282,29 @@ export const ChatPanel: React.FC<ChatPanelProps> = ({
           use_rag: ragEnabled,
           auto_search: webSearchEnabled,
           conversation_id: currentConversationId || 'default',
+          stream: true,
         }),
       });
 
-      const data = await response.json();
+      if (!response.ok) {
+        throw new Error(`Chat request failed with status ${response.status}`);
+      }
+
+      // Show the reply as it is generated, replacing the placeholder with
+      // the complete message (sources, thinking) once the stream is done
+      let streamStarted = false;
+      const data = await readChatStream(response, (content) => {
+        const started = streamStarted;
+        streamStarted = true;
+        const partial: Message = {
+          role: 'assistant',
+          content,
+          timestamp: new Date().toISOString(),
+        };
+        setMessages(prev => (started ? [...prev.slice(0, -1), partial] : [...prev, partial]));
+      });
       
-      if (data.message) {
+      if (data?.message) {
         const thinkingEndTime = Date.now();
         const thinkingDuration = thinkingEndTime - thinkingStartTime;
 
@@ -280,14 +339,18 @@ export const ChatPanel: React.FC<ChatPanelProps> = ({
           search_used: data.search_used || false,
         };
 
-        setMessages(prev => [...prev, assistantMessage]);
+        setMessages(prev => (streamStarted ? [...prev.slice(0, -1), assistantMessage] : [...prev, assistantMessage]));
 
         // Stop thinking process
         setCurrentThinking(null);
 
         // Save assistant message to backend
         if (currentConversationId) {
-          await addMessageToConversation(currentConversationId, 'assistant', assistantMessage.content);
+          await addMessageToConversation(currentConversationId, 'assistant', assistantMessage.content, {
+            context_sources: assistantMessage.context_sources,
+            rag_used: assistantMessage.rag_used,
+            search_used: assistantMessage.search_used,
+          });
         }
       }
     } catch (error) {
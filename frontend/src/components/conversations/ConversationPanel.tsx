@@ -21,9 +21,10 @@ import { formatDistanceToNow } from 'date-fns';
 interface Conversation {
   id: string;
   title: string;
-  messages: any[];
   created_at: string;
   updated_at: string;
+  message_count?: number;
+  last_message_preview?: string;
 }
 
 interface ConversationPanelProps {